@@ -0,0 +1,170 @@
+"""
+AI-CARE Lung 警示分流佇列
+依 SLA 期限排序的 min-heap：🔴 30 分鐘內處理、🟡 當日處理
+"""
+
+import heapq
+import itertools
+import threading
+from datetime import datetime
+
+RED_SLA_MINUTES = 30
+GREEN_SLA_HOURS = 24
+
+LEVEL_RANK = {"red": 0, "yellow": 1, "green": 2}
+ESCALATION = {"green": "yellow", "yellow": "red"}
+
+# 允許的狀態轉換：待處理 → 聯繫中 → 已處理
+TRANSITIONS = {
+    "pending": {"contacted", "resolved"},
+    "contacted": {"resolved"},
+    "resolved": set(),
+}
+
+
+def sla_deadline(level, created_at):
+    if level == "red":
+        return created_at + RED_SLA_MINUTES * 60
+    if level == "yellow":
+        # 當日處理：建立當天 23:59:59 前
+        day_end = datetime.fromtimestamp(created_at).replace(hour=23, minute=59, second=59, microsecond=0)
+        return day_end.timestamp()
+    return created_at + GREEN_SLA_HOURS * 3600
+
+
+class AlertQueue:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.heap = []
+        self.entries = {}
+        self.alerts = {}
+        self.open_counts = {level: 0 for level in LEVEL_RANK}
+        self.last_id = 0
+        self.counter = itertools.count()
+        self.stale = 0
+
+    def __len__(self):
+        return len(self.alerts)
+
+    # ---------- 載入 ----------
+    def sync(self, db):
+        # 只載入上次同步後新增的警示
+        with self.lock:
+            for alert in db.alerts_after(self.last_id):
+                if alert["status"] != "resolved":
+                    self.push(alert)
+                self.last_id = max(self.last_id, alert["id"])
+
+    def push(self, alert):
+        with self.lock:
+            alert = dict(alert)
+            alert["deadline"] = sla_deadline(alert["level"], alert["created_at"])
+            old = self.alerts.get(alert["id"])
+            if old:
+                self._invalidate(alert["id"])
+                self.open_counts[old["level"]] -= 1
+            self.open_counts[alert["level"]] += 1
+            self.alerts[alert["id"]] = alert
+            self._push_entry(alert)
+            self.last_id = max(self.last_id, alert["id"])
+
+    def _push_entry(self, alert):
+        # 期限相同時紅色優先，再依加入順序
+        entry = [alert["deadline"], LEVEL_RANK[alert["level"]], next(self.counter), alert["id"], True]
+        self.entries[alert["id"]] = entry
+        heapq.heappush(self.heap, entry)
+
+    def _invalidate(self, alert_id):
+        entry = self.entries.pop(alert_id, None)
+        if entry:
+            entry[-1] = False
+            self.stale += 1
+
+    def _compact(self):
+        if self.stale > len(self.heap) // 2:
+            self.heap = [e for e in self.heap if e[-1]]
+            heapq.heapify(self.heap)
+            self.stale = 0
+
+    # ---------- 狀態轉換 ----------
+    # 警示已被其他人處理（或頁面過時）時不是錯誤：can_transition / next_level 回傳 False / None，
+    # set_status / escalate 不做任何事並回傳 None
+    def can_transition(self, alert_id, status):
+        with self.lock:
+            alert = self.alerts.get(alert_id)
+            return alert is not None and status in TRANSITIONS[alert["status"]]
+
+    def next_level(self, alert_id):
+        with self.lock:
+            alert = self.alerts.get(alert_id)
+            return alert and ESCALATION.get(alert["level"])
+
+    def set_status(self, alert_id, status):
+        with self.lock:
+            if not self.can_transition(alert_id, status):
+                return None
+            alert = self.alerts[alert_id]
+            alert["status"] = status
+            if status == "resolved":
+                self.resolve(alert_id)
+            return alert
+
+    def resolve(self, alert_id):
+        with self.lock:
+            alert = self.alerts.pop(alert_id, None)
+            if alert is None:
+                return None
+            alert["status"] = "resolved"
+            self.open_counts[alert["level"]] -= 1
+            self._invalidate(alert_id)
+            self._compact()
+            return alert
+
+    def escalate(self, alert_id, now):
+        # 升級後期限從升級時間重新計算，但不會晚於原期限
+        with self.lock:
+            new_level = self.next_level(alert_id)
+            if new_level is None:
+                return None
+            alert = self.alerts[alert_id]
+            self.open_counts[alert["level"]] -= 1
+            self.open_counts[new_level] += 1
+            alert["level"] = new_level
+            alert["deadline"] = min(alert["deadline"], sla_deadline(new_level, now))
+            self._invalidate(alert_id)
+            self._push_entry(alert)
+            self._compact()
+            return alert
+
+    # ---------- 查詢 ----------
+    def _take(self, stop):
+        # 依期限依序取出有效項目，再放回 heap：O(k log n)
+        taken = []
+        with self.lock:
+            while self.heap:
+                entry = self.heap[0]
+                if not entry[-1]:
+                    heapq.heappop(self.heap)
+                    self.stale -= 1
+                    continue
+                if stop(entry, len(taken)):
+                    break
+                taken.append(heapq.heappop(self.heap))
+            for entry in taken:
+                heapq.heappush(self.heap, entry)
+            return [self.alerts[e[3]] for e in taken]
+
+    def next(self, n, offset=0):
+        return self._take(lambda entry, count: count >= n + offset)[offset:]
+
+    def breaching_soon(self, now, within_minutes=10, limit=20):
+        horizon = now + within_minutes * 60
+        return self._take(lambda entry, count: entry[0] > horizon or count >= limit)
+
+    def open_alerts(self):
+        with self.lock:
+            return list(self.alerts.values())
+
+    def counts(self):
+        with self.lock:
+            return dict(self.open_counts)
@@ -0,0 +1,263 @@
+"""
+AI-CARE Lung 順從度分析
+依研究排程展開每位受試者的應回報時段，與實際回報做向量化區間比對，依組別 × 追蹤時段 / 月份計算完成率
+新回報只標記其落入的時段，不重算整個世代
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from store import UTC_OFFSET
+import trends
+
+ARMS = ["AI-ePRO", "傳統ePRO", "常規照護"]
+ARM_COLORS = {"AI-ePRO": "#8b5cf6", "傳統ePRO": "#94a3b8", "常規照護": "#cbd5e1"}
+
+DAY = 86400
+# (時段, 起點, 起始天, 結束天, 每幾天至少回報一次)；結束天為 None 表示到出院為止
+WINDOWS = [
+    ("住院期間", "surgery", 0, None, 1),
+    ("出院後 1 個月", "discharge", 0, 30, 7),
+    ("出院後 2-3 個月", "discharge", 30, 90, 7),
+    ("出院後 4-6 個月", "discharge", 90, 180, 14),
+    ("出院後 7-12 個月", "discharge", 180, 365, 30),
+]
+TREND_MONTHS = 12
+# 時段排序鍵 = 個案序號 * KEY_SPAN + 時間（epoch 秒在 2286 年前都小於 1e10）
+KEY_SPAN = 1e10
+REPORT_BATCH = 100000
+
+
+# ============================================
+# 排程展開與區間比對
+# ============================================
+def build_slots(surgery_at, discharge_at):
+    # 回傳依 (個案, 開始時間) 排序的 patient, window, start, end 陣列；每個時段內至少要有一次回報
+    parts = []
+    for w, (_, anchor, first, last, every) in enumerate(WINDOWS):
+        base = surgery_at if anchor == "surgery" else discharge_at
+        start = base + first * DAY
+        end = discharge_at if last is None else base + last * DAY
+        count = np.maximum(np.ceil((end - start) / (every * DAY)), 0).astype(np.int64)
+        patient = np.repeat(np.arange(len(base)), count)
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        slot_start = start[patient] + offset * every * DAY
+        parts.append((patient, np.full(len(patient), w), slot_start, np.minimum(slot_start + every * DAY, end[patient])))
+    patient, window, start, end = (np.concatenate(col) for col in zip(*parts))
+    order = np.lexsort((start, patient))
+    return patient[order], window[order], start[order], end[order]
+
+
+def match_reports(slot_patient, slot_start, slot_end, patient, ts):
+    # 每筆回報以二分搜尋找到所屬時段；回傳被命中的時段索引（個案不在世代內時 patient 為 -1）
+    slot_key = slot_patient * KEY_SPAN + slot_start
+    idx = np.searchsorted(slot_key, patient * KEY_SPAN + ts, side="right") - 1
+    ok = (patient >= 0) & (idx >= 0)
+    idx = np.where(ok, idx, 0)
+    ok &= (slot_patient[idx] == patient) & (ts < slot_end[idx])
+    return idx[ok]
+
+
+def month_number(ts):
+    # 本地時間的月份序號（1970-01 為 0）
+    return ((np.asarray(ts) + UTC_OFFSET).astype("datetime64[s]").astype("datetime64[M]")).astype(np.int64)
+
+
+def month_label(month):
+    return f"{1970 + month // 12}/{month % 12 + 1:02d}"
+
+
+# ============================================
+# 完成率模型（跨 session 共用，增量更新）
+# ============================================
+class ComplianceModel:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.cohort_version = None
+        self.last_report_id = 0
+        self.patient_ids = []
+        self.index = {}
+        self.memo = {}
+        self.rebuilds = 0
+        self.reports_seen = 0
+
+    def refresh(self, db):
+        # 收案名單變動時重新展開時段；否則只比對上次之後的新回報
+        with self.lock:
+            version = db.version("enrollment")
+            if version != self.cohort_version:
+                self._rebuild(db)
+                self.cohort_version = version
+            while True:
+                rows = db.report_times_after(self.last_report_id, REPORT_BATCH)
+                if not rows:
+                    break
+                self._mark(rows)
+                self.last_report_id = rows[-1][0]
+        return self
+
+    def _rebuild(self, db):
+        enrolled = db.list_enrollment()
+        self.patient_ids = [e["patient_id"] for e in enrolled]
+        self.index = {pid: i for i, pid in enumerate(self.patient_ids)}
+        self.patient_arm = np.array([ARMS.index(e["arm"]) for e in enrolled], dtype=np.int64)
+        surgery = np.array([e["surgery_at"] for e in enrolled], dtype=float)
+        discharge = np.array([e["discharge_at"] for e in enrolled], dtype=float)
+        self.patient, self.window, self.start, self.end = build_slots(surgery, discharge)
+        self.arm = self.patient_arm[self.patient]
+        self.month = month_number(self.end)
+        self.hit = np.zeros(len(self.patient), dtype=bool)
+        self.last_report_id = 0
+        self.reports_seen = 0
+        self.memo = {}
+        self.rebuilds += 1
+
+    def _mark(self, rows):
+        if not len(self.patient):
+            return
+        _, patient_ids, times = zip(*rows)
+        patient = np.array([self.index.get(pid, -1) for pid in patient_ids], dtype=np.int64)
+        self.hit[match_reports(self.patient, self.start, self.end, patient, np.array(times, dtype=float))] = True
+        self.reports_seen += len(rows)
+        self.memo = {}
+
+    def summary(self, now=None):
+        # 同一小時內、沒有新回報時直接回傳上次結果
+        now = now or time.time()
+        with self.lock:
+            key = (self.cohort_version, self.last_report_id, int(now // 3600))
+            if key not in self.memo:
+                self.memo = {key: self._summary(now)}
+            return self.memo[key]
+
+    def _summary(self, now):
+        arms, windows = len(ARMS), len(WINDOWS)
+        due = self.end <= now
+
+        def rates(group, size, mask):
+            expected = np.bincount(group[mask], minlength=size)
+            completed = np.bincount(group[mask & self.hit], minlength=size)
+            return [None if e == 0 else float(c / e * 100) for c, e in zip(completed, expected)], expected
+
+        by_window, expected = rates(self.arm * windows + self.window, arms * windows, due)
+        last_month = int(month_number(now))
+        months = list(range(last_month - TREND_MONTHS + 1, last_month + 1))
+        in_range = self.month >= months[0]
+        by_month, _ = rates(np.where(in_range, self.arm * TREND_MONTHS + self.month - months[0], 0), arms * TREND_MONTHS, due & in_range)
+        overall, _ = rates(self.arm, arms, due)
+        total, _ = rates(np.zeros(len(due), dtype=np.int64), 1, due)
+        return {
+            "windows": {
+                arm: [(WINDOWS[w][0], by_window[a * windows + w], int(expected[a * windows + w])) for w in range(windows)]
+                for a, arm in enumerate(ARMS)
+            },
+            "months": [month_label(m) for m in months],
+            "monthly": {arm: by_month[a * TREND_MONTHS:(a + 1) * TREND_MONTHS] for a, arm in enumerate(ARMS)},
+            "overall": dict(zip(ARMS, overall)),
+            "all": total[0],
+            "enrolled": dict(zip(ARMS, np.bincount(self.patient_arm, minlength=arms).tolist())),
+        }
+
+    def patient_rates(self, now=None):
+        # 每位受試者已到期時段的完成率（未有到期時段者為 nan），順序同 patient_ids
+        now = now or time.time()
+        with self.lock:
+            due = self.end <= now
+            expected = np.bincount(self.patient[due], minlength=len(self.patient_ids))
+            completed = np.bincount(self.patient[due & self.hit], minlength=len(self.patient_ids))
+            return self.patient_ids, np.where(expected > 0, completed / np.maximum(expected, 1), np.nan)
+
+
+# ============================================
+# 示範世代
+# ============================================
+DEMO_ARMS = {"P001": "AI-ePRO", "P002": "AI-ePRO", "P003": "傳統ePRO", "P004": "AI-ePRO", "P005": "常規照護"}
+DEMO_SURGERIES = ["右上肺葉切除", "左下肺葉切除", "右中肺葉切除", "肺節切除", "左上肺葉切除", "楔狀切除"]
+# 各組、各時段的基礎完成機率（依 WINDOWS 順序），再加上個人因子的影響
+DEMO_BASE_RATES = {
+    "AI-ePRO": [0.97, 0.92, 0.85, 0.78, 0.72],
+    "傳統ePRO": [0.93, 0.80, 0.66, 0.56, 0.50],
+    "常規照護": [0.90, 0.62, 0.50, 0.42, 0.36],
+}
+
+
+def demo_propensity(age, college, caregiver, smartphone_years, gad7):
+    # 個人因子對完成率的 logit 影響，供示範數據與因子分析對照
+    return (
+        -0.7 * (age >= 65) + 0.5 * college + 0.8 * caregiver
+        + 0.9 * (smartphone_years >= 3) - 0.5 * (gad7 >= 10)
+    )
+
+
+def seed_demo_cohort(db, size=127, now=None, seed=0):
+    # 為既有示範病人補上收案資料，並產生其餘受試者與其依排程的回報紀錄
+    if db.count_enrollment():
+        return 0
+    now = now or time.time()
+    rng = np.random.default_rng(seed)
+    existing = db.list_patients()
+    n_new = max(size - len(existing), 0)
+    ids = [p["id"] for p in existing] + [f"R{i:03d}" for i in range(1, n_new + 1)]
+    n = len(ids)
+
+    age = np.concatenate([[p["age"] for p in existing], np.clip(rng.normal(63, 9, n_new), 40, 85).round()]).astype(int)
+    days_since = np.concatenate([[p["day"] for p in existing], rng.uniform(3, 540, n_new)])
+    surgery = now - days_since * DAY
+    discharge = surgery + rng.integers(4, 10, n) * DAY
+    arms = [DEMO_ARMS.get(pid) for pid in ids[:len(existing)]] + [str(a) for a in rng.permutation(np.resize(ARMS, n_new))]
+    arms = [arm or ARMS[i % len(ARMS)] for i, arm in enumerate(arms)]
+    college = rng.random(n) < 0.35
+    caregiver = rng.random(n) < 0.7
+    smartphone = np.round(rng.exponential(4, n), 1)
+    gad7 = np.clip(rng.poisson(6, n), 0, 21)
+
+    # 只為新增的受試者產生回報：時段完成機率 = 組別時段基礎機率 + 個人因子
+    patient, window, start, end = build_slots(surgery, discharge)
+    arm_idx = np.array([ARMS.index(a) for a in arms])
+    base = np.array([DEMO_BASE_RATES[a] for a in ARMS])[arm_idx[patient], window]
+    effect = demo_propensity(age, college, caregiver, smartphone, gad7)
+    logit = np.log(base / (1 - base)) + (effect - effect.mean())[patient] + rng.normal(0, 0.6, n)[patient]
+    new = patient >= len(existing)
+    hit = new & (start < now) & (rng.random(len(patient)) < 1 / (1 + np.exp(-logit)))
+    report_at = start + rng.random(len(patient)) * (np.minimum(end, now) - start)
+    symptoms = rng.choice(len(trends.DEMO_SYMPTOMS), len(patient))
+    scores = np.clip(rng.poisson(3, len(patient)), 0, 10)
+
+    started = np.bincount(patient[new & (start < now)], minlength=n)
+    reported = np.bincount(patient[hit], minlength=n)
+    last_report = np.full(n, np.nan)
+    np.fmax.at(last_report, patient[hit], report_at[hit])
+
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO patients (id, name, age, surgery, day, compliance, status, last_report_at, phone, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, 'normal', ?, NULL, ?)",
+            [
+                (ids[i], f"受試者{ids[i]}", int(age[i]), DEMO_SURGERIES[i % len(DEMO_SURGERIES)], int(days_since[i]),
+                 int(round(reported[i] / started[i] * 100)) if started[i] else None,
+                 None if np.isnan(last_report[i]) else float(last_report[i]), now)
+                for i in range(len(existing), n)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO enrollment (patient_id, arm, enrolled_at, surgery_at, discharge_at, college, caregiver, smartphone_years, gad7)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (ids[i], arms[i], float(surgery[i] - DAY), float(surgery[i]), float(discharge[i]),
+                 int(college[i]), int(caregiver[i]), float(smartphone[i]), int(gad7[i]))
+                for i in range(n)
+            ],
+        )
+        order = np.argsort(report_at[hit], kind="stable")
+        conn.executemany(
+            "INSERT INTO reports (patient_id, symptom, score, reported_at) VALUES (?, ?, ?, ?)",
+            [
+                (ids[p], trends.DEMO_SYMPTOMS[s], int(sc), float(t))
+                for p, s, sc, t in zip(patient[hit][order], symptoms[hit][order], scores[hit][order], report_at[hit][order])
+            ],
+        )
+    db.bump("enrollment", "patients", "reports")
+    trends.backfill(db, ids[len(existing):])
+    return n
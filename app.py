@@ -7,11 +7,37 @@ AI-CARE Lung ePRO System
 """
 
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import json
+import os
 import random
+import threading
+import time
+
+from alert_queue import AlertQueue
+import analytics
+import cards
+from chat_history import ChatHistory
+import export
+import factors
+from figure_cache import FigureCache, figure_key
+from instrumentation import SessionMetrics
+from llm import AssistantService, make_backend
+import overdue
+import quality
+import record_writer
+import scheduler
+from search import PatientIndex
+from store import Store
+import symptoms
+import trends
+import vitals
+import workload
+
+# 每次重跑都會重新執行本檔，記下開始時間供執行時間量測
+RUN_STARTED = time.perf_counter()
 
 # ============================================
 # 頁面設定
@@ -26,173 +52,222 @@ st.set_page_config(
 # ============================================
 # 手機友善 CSS（完整版）
 # ============================================
-st.markdown("""
-<style>
-    /* 隱藏預設元素 */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    header {visibility: hidden;}
-    
-    /* 手機字體 */
-    html, body {
-        font-size: 16px;
-        -webkit-text-size-adjust: 100%;
-    }
-    
-    /* 按鈕 */
-    .stButton > button {
-        width: 100%;
-        padding: 14px 20px;
-        font-size: 15px;
-        border-radius: 12px;
-        min-height: 50px;
-    }
-    
-    /* 輸入框 */
-    .stTextInput > div > div > input,
-    .stTextArea > div > div > textarea {
-        font-size: 16px;
-        padding: 14px;
-        border-radius: 12px;
-    }
-    
-    /* Tabs 樣式 */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 4px;
-        flex-wrap: wrap;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        padding: 10px 16px;
-        font-size: 14px;
-    }
-    
-    /* 卡片 */
-    .card {
-        background: white;
-        border-radius: 16px;
-        padding: 20px;
-        margin-bottom: 16px;
-        box-shadow: 0 2px 12px rgba(0,0,0,0.08);
-    }
-    
-    .card-green {
-        background: linear-gradient(135deg, #ecfdf5, #d1fae5);
-        border: 1px solid #a7f3d0;
-    }
-    
-    .card-blue {
-        background: linear-gradient(135deg, #eff6ff, #dbeafe);
-        border: 1px solid #bfdbfe;
-    }
-    
-    .card-purple {
-        background: linear-gradient(135deg, #f5f3ff, #ede9fe);
-        border: 1px solid #c4b5fd;
-    }
-    
-    /* 警示卡片 */
-    .alert-red {
-        background: linear-gradient(135deg, #fef2f2, #fee2e2);
-        border-left: 4px solid #ef4444;
-        border-radius: 12px;
-        padding: 16px;
-        margin-bottom: 12px;
-    }
-    
-    .alert-yellow {
-        background: linear-gradient(135deg, #fffbeb, #fef3c7);
-        border-left: 4px solid #f59e0b;
-        border-radius: 12px;
-        padding: 16px;
-        margin-bottom: 12px;
-    }
-    
-    .alert-green {
-        background: linear-gradient(135deg, #f0fdf4, #dcfce7);
-        border-left: 4px solid #22c55e;
-        border-radius: 12px;
-        padding: 16px;
-        margin-bottom: 12px;
-    }
-    
-    /* 聊天氣泡 */
-    .chat-ai {
-        background: #f1f5f9;
-        border-radius: 18px 18px 18px 4px;
-        padding: 14px 18px;
-        margin: 8px 0;
-        font-size: 15px;
-        line-height: 1.6;
-    }
-    
-    .chat-user {
-        background: linear-gradient(135deg, #10b981, #059669);
-        color: white;
-        border-radius: 18px 18px 4px 18px;
-        padding: 14px 18px;
-        margin: 8px 0;
-        font-size: 15px;
-        line-height: 1.6;
-    }
-    
-    /* 統計數字 */
-    .stat-big {
-        font-size: 28px;
-        font-weight: 700;
-        line-height: 1.2;
-    }
-    
-    /* 進度條 */
-    .progress-bg {
-        background: #e2e8f0;
-        border-radius: 8px;
-        height: 10px;
-        overflow: hidden;
-        margin: 8px 0;
-    }
-    
-    .progress-fill {
-        height: 100%;
-        border-radius: 8px;
-        transition: width 0.3s ease;
-    }
-    
-    /* 病人清單項目 */
-    .patient-item {
-        background: white;
-        border-radius: 12px;
-        padding: 16px;
-        margin-bottom: 10px;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.04);
-        border-left: 4px solid;
-    }
-    
-    /* 手機適配 */
-    @media (max-width: 768px) {
-        [data-testid="stSidebar"] {
-            display: none;
-        }
-        .main .block-container {
-            padding: 1rem;
-            padding-bottom: 20px;
-        }
-    }
-    
-    /* Plotly 圖表手機適配 */
-    .js-plotly-plot {
-        width: 100% !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(cards.STYLE_HTML, unsafe_allow_html=True)
+
+# ============================================
+# 資料儲存
+# ============================================
+DB_PATH = os.environ.get("AICARE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "aicare.db"))
+
+# 示範用：病人端 / 個管師端登入者
+CURRENT_PATIENT_ID = "P001"
+CURRENT_MANAGER_ID = "M01"
+
+SEARCH_LIMIT = 50
+
+# 對話紀錄：記憶體只保留畫面上的最近訊息，完整紀錄寫入檔案
+CHAT_LOG_DIR = os.environ.get("AICARE_CHAT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_logs"))
+CHAT_MEMORY_SIZE = 6
+CHAT_PAGE_SIZE = 10
+
+# 健康小助手後端（可抽換）
+LLM_BACKEND = os.environ.get("AICARE_LLM_BACKEND", "local")
+LLM_TIMEOUT = float(os.environ.get("AICARE_LLM_TIMEOUT", "20"))
+LLM_CONCURRENCY = int(os.environ.get("AICARE_LLM_CONCURRENCY", "8"))
+
+# 首頁畫完後在背景預先載入 pandas / plotly.express（設為 0 則完全延遲到使用時）
+PRELOAD_MODULES = os.environ.get("AICARE_PRELOAD", "1") == "1"
+
+# 圖表快取上限：跨 session 共用 / 每個 session 的個人圖表
+FIGURE_CACHE_BYTES = 16 * 1024 * 1024
+SESSION_FIGURE_CACHE_BYTES = 1024 * 1024
+
+# 執行期量測輸出目錄（JSON / Prometheus 文字格式）
+METRICS_DIR = os.environ.get("AICARE_METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics"))
+METRICS_INTERVAL = float(os.environ.get("AICARE_METRICS_INTERVAL", "60"))
+
+# 研究數據匯出：背景執行緒寫檔的目錄與進度更新間隔（秒）
+EXPORT_DIR = os.environ.get("AICARE_EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+EXPORT_POLL_SECONDS = 1.0
+# 去識別化 HMAC 金鑰：環境變數 AICARE_DEID_KEY，未設定時使用（並產生）金鑰檔
+DEID_KEY_FILE = os.environ.get("AICARE_DEID_KEY_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "deid.key"))
+
+# REDCap 增量同步：網址設為 mock 時啟動本機替身（redcap_mock.py）
+REDCAP_URL = os.environ.get("AICARE_REDCAP_URL", "")
+REDCAP_TOKEN = os.environ.get("AICARE_REDCAP_TOKEN", "")
+
+# 順從度影響因子 bootstrap 使用的行程數（預設為 CPU 核心數）
+FACTOR_WORKERS = int(os.environ.get("AICARE_FACTOR_WORKERS", "0")) or None
+
+# 逾期未回報偵測的背景掃描間隔（秒）
+OVERDUE_SWEEP_SECONDS = float(os.environ.get("AICARE_OVERDUE_SWEEP_SECONDS", "60"))
+
+# 每組收案目標人數
+ENROLLMENT_TARGET = 50
+
+# 清單每頁筆數，限制每次 rerun 的元件數量
+PAGE_SIZE = int(os.environ.get("AICARE_PAGE_SIZE", "10"))
+
+@st.cache_resource
+def get_db():
+    db = Store(DB_PATH)
+    db.seed_demo()
+    vitals.seed_demo_vitals(db, CURRENT_PATIENT_ID)
+    trends.ensure_rollups(db)
+    trends.seed_demo_reports(db, CURRENT_PATIENT_ID)
+    analytics.seed_demo_cohort(db)
+    quality.seed_demo_events(db)
+    workload.seed_demo_activity(db)
+    return db
+
+@st.cache_resource
+def get_search_index():
+    return PatientIndex()
+
+@st.cache_resource
+def get_alert_queue():
+    return AlertQueue()
+
+@st.cache_resource
+def get_assistant():
+    return AssistantService(make_backend(LLM_BACKEND), concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT)
+
+@st.cache_resource
+def get_compliance_model():
+    return analytics.ComplianceModel()
+
+def compliance_summary():
+    # 只比對上次之後的新回報；同一小時內沒有新回報時重用上次結果
+    return get_compliance_model().refresh(get_db()).summary()
+
+@st.cache_resource
+def get_quality_engine():
+    return quality.QualityEngine()
+
+def quality_summary():
+    # 只套用上次之後的新收案 / 介入紀錄 / 結果事件；同一天內沒有新事件時重用上次結果
+    return get_quality_engine().refresh(get_db()).summary()
+
+@st.cache_resource
+def get_scheduler():
+    return scheduler.Scheduler()
+
+@st.cache_resource
+def get_overdue_detector():
+    # 背景定期掃描；個管師頁面開啟時也先掃一次，期限到了不必等下一輪
+    detector = overdue.OverdueDetector()
+    detector.start(get_db(), OVERDUE_SWEEP_SECONDS)
+    return detector
+
+@st.cache_resource
+def get_record_writer():
+    return record_writer.RecordWriter(get_db())
+
+@st.cache_resource
+def get_workload_stats():
+    return workload.WorkloadStats()
+
+@st.cache_resource
+def get_factor_estimator():
+    return factors.FactorEstimator(workers=FACTOR_WORKERS)
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache(FIGURE_CACHE_BYTES)
+
+def session_figure_cache():
+    if 'figure_cache' not in st.session_state:
+        st.session_state.figure_cache = FigureCache(SESSION_FIGURE_CACHE_BYTES)
+    return st.session_state.figure_cache
+
+def plot_cached(cache, name, version, build, **layout):
+    # 資料版本與版面參數都沒變時直接重用已建好的圖表
+    fig = cache.figure(figure_key(name, version, **layout), build)
+    if fig is not None:
+        st.plotly_chart(fig, use_container_width=True)
+    return fig is not None
+
+@st.cache_resource
+def get_exporter():
+    import deid
+    return export.ExportManager(get_db(), EXPORT_DIR, deid_key=deid.load_key(DEID_KEY_FILE))
+
+@st.cache_resource
+def get_redcap():
+    if not REDCAP_URL:
+        return None
+    import redcap
+    url, token = REDCAP_URL, REDCAP_TOKEN
+    if url == "mock":
+        import redcap_mock
+        token = token or "demo"
+        _, _, url = redcap_mock.start(token=token)
+    return redcap.RedcapSync(get_db(), redcap.RedcapClient(url, token))
+
+@st.cache_resource
+def preload_heavy_modules():
+    # 病人端首頁不需要 pandas，等第一次畫面送出後再載入，資料中心開啟時就不用等
+    def load():
+        import pandas
+        import plotly.express
+    thread = threading.Thread(target=load, name="preload-modules", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def get_metrics():
+    return SessionMetrics(dump_dir=METRICS_DIR, dump_interval=METRICS_INTERVAL)
+
+def record_session_metrics():
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    state = {k: st.session_state[k] for k in st.session_state.keys()}
+    history = st.session_state.get("chat_history")
+    get_metrics().record(ctx.session_id, state, counts={
+        "keys": len(state),
+        "chat_messages": len(history) if history is not None else 0,
+        "chat_earlier_pages": st.session_state.get("chat_earlier_pages", 0),
+    }, run_seconds=time.perf_counter() - RUN_STARTED)
+
+ALERT_STALE_NOTICE = "此警示已由其他個管師處理或已更新，畫面已重新整理"
+
+def update_alert_status(alert_id, status):
+    # 先寫資料庫再改佇列（持有佇列鎖，兩者不會不一致）；已被處理的警示回傳 None
+    queue, db = get_alert_queue(), get_db()
+    with queue.lock:
+        if not queue.can_transition(alert_id, status):
+            st.session_state.alert_notice = ALERT_STALE_NOTICE
+            return None
+        db.set_alert_status(alert_id, status)
+        alert = queue.set_status(alert_id, status)
+    db.add_audit(CURRENT_MANAGER_ID, f"alert_{status}", str(alert_id))
+    return alert
+
+def escalate_alert(alert_id):
+    queue, db = get_alert_queue(), get_db()
+    with queue.lock:
+        level = queue.next_level(alert_id)
+        if level is None:
+            st.session_state.alert_notice = ALERT_STALE_NOTICE
+            return None
+        db.set_alert_level(alert_id, level)
+        alert = queue.escalate(alert_id, datetime.now().timestamp())
+    db.add_audit(CURRENT_MANAGER_ID, "alert_escalate", str(alert_id), level)
+    return alert
 
 # ============================================
 # Session State
 # ============================================
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = [
-        {"role": "ai", "content": "您好！我是您的健康小助手 🌱\n\n今天感覺怎麼樣呢？", "time": "09:00"}
-    ]
+    st.session_state.chat_history = ChatHistory(CURRENT_PATIENT_ID, CHAT_LOG_DIR, capacity=CHAT_MEMORY_SIZE)
+    st.session_state.chat_history.append("ai", "您好！我是您的健康小助手 🌱\n\n今天感覺怎麼樣呢？", "09:00", persist=False)
+
+if 'pending_reply' not in st.session_state:
+    st.session_state.pending_reply = None
+
+if 'chat_earlier_pages' not in st.session_state:
+    st.session_state.chat_earlier_pages = 0
 
 if 'page' not in st.session_state:
     st.session_state.page = "patient"
@@ -200,74 +275,46 @@ if 'page' not in st.session_state:
 if 'selected_patient' not in st.session_state:
     st.session_state.selected_patient = None
 
-# ============================================
-# 完整模擬數據
-# ============================================
-PATIENTS = [
-    {"id": "P001", "name": "王大明", "age": 68, "surgery": "右上肺葉切除", "day": 14, "compliance": 92, "status": "alert", "last_report": "10:30", "phone": "0912-345-678"},
-    {"id": "P002", "name": "李小華", "age": 55, "surgery": "左下肺葉切除", "day": 21, "compliance": 85, "status": "warning", "last_report": "09:15", "phone": "0923-456-789"},
-    {"id": "P003", "name": "陳美玲", "age": 72, "surgery": "右中肺葉切除", "day": 7, "compliance": 78, "status": "overdue", "last_report": "昨天", "phone": "0934-567-890"},
-    {"id": "P004", "name": "張志明", "age": 61, "surgery": "肺節切除", "day": 30, "compliance": 95, "status": "normal", "last_report": "08:45", "phone": "0945-678-901"},
-    {"id": "P005", "name": "林淑芬", "age": 58, "surgery": "左上肺葉切除", "day": 45, "compliance": 88, "status": "normal", "last_report": "昨天", "phone": "0956-789-012"},
-]
-
-ALERTS = [
-    {"id": 1, "patient": "王大明", "level": "red", "symptom": "呼吸困難", "score": 8, "time": "10 分鐘前", "phone": "0912-345-678", "status": "pending"},
-    {"id": 2, "patient": "李小華", "level": "yellow", "symptom": "疲勞", "score": 5, "time": "30 分鐘前", "phone": "0923-456-789", "status": "pending"},
-    {"id": 3, "patient": "陳美玲", "level": "yellow", "symptom": "胸痛", "score": 4, "time": "1 小時前", "phone": "0934-567-890", "status": "contacted"},
-    {"id": 4, "patient": "張志明", "level": "green", "symptom": "輕微咳嗽", "score": 2, "time": "2 小時前", "phone": "0945-678-901", "status": "resolved"},
-]
-
-INTERVENTION_RECORDS = [
-    {"patient": "王大明", "type": "電話", "content": "呼吸困難症狀評估，建議使用噘嘴式呼吸，若持續加重需回診。病人表示了解。", "time": "今天 10:45", "duration": "8分鐘", "referral": None},
-    {"patient": "李小華", "type": "LINE", "content": "提醒今日回報，病人表示下午會填寫。", "time": "今天 09:30", "duration": "2分鐘", "referral": None},
-    {"patient": "陳美玲", "type": "電話", "content": "評估後轉介營養諮詢，體重持續下降。已預約營養師門診。", "time": "昨天 15:20", "duration": "12分鐘", "referral": "營養諮詢"},
-]
-
-SCHEDULE = [
-    {"time": "08:00-10:00", "task": "檢視系統數據，主動聯繫未完成者", "status": "done", "detail": "已完成 12 位聯繫"},
-    {"time": "10:00-12:00", "task": "處理紅色/黃色警示患者", "status": "current", "detail": "進行中 - 待處理 4 件"},
-    {"time": "13:00-15:00", "task": "執行轉介、與醫療團隊溝通", "status": "upcoming", "detail": "營養 2 件、緩和 1 件"},
-    {"time": "15:00-17:00", "task": "數據輸入、個案管理日誌", "status": "upcoming", "detail": ""},
-]
-
-COMPLIANCE_DATA = pd.DataFrame({
-    '月份': ['1月', '2月', '3月', '4月', '5月', '6月'],
-    'AI-ePRO': [82, 85, 78, 88, 91, 86],
-    '傳統ePRO': [65, 62, 58, 55, 52, 48]
-})
-
 # ============================================
 # 輔助函數
 # ============================================
-def simulate_ai_response(user_input):
-    user_input = user_input.lower() if user_input else ""
-    
-    if any(word in user_input for word in ['悶', '喘', '呼吸']):
-        return "了解，胸口悶悶的感覺。\n\n請問用 0-10 分來評估，0 分是完全不悶，10 分是非常悶，您覺得大概幾分呢？\n\n（可以用下方滑桿選擇）"
-    elif any(word in user_input for word in ['累', '疲', '沒力']):
-        return "謝謝您告訴我。疲勞感是術後常見的症狀。\n\n請問這個疲勞感，如果用 0-10 分來評估，您覺得大概幾分呢？"
-    elif any(word in user_input for word in ['痛', '疼']):
-        return "了解您有疼痛的感覺。\n\n請問：\n1. 疼痛的位置在哪裡？\n2. 用 0-10 分評估，大概幾分？\n3. 是持續痛還是間歇性的？"
-    elif any(word in user_input for word in ['咳', '痰']):
-        return "好的，關於咳嗽的問題。\n\n請問：\n1. 有沒有痰？\n2. 痰的顏色是？（白/黃/綠/帶血）\n3. 咳嗽嚴重程度 0-10 分？"
-    elif any(word in user_input for word in ['不錯', '好', '還好', '👍']):
-        return "太好了！很高興聽到您感覺不錯 😊\n\n為了完整記錄，想再確認一下：\n• 有沒有任何疼痛感？\n• 呼吸是否順暢？\n• 睡眠品質如何？"
-    elif user_input.replace('分', '').replace('點', '.').replace('。', '').strip().replace('.', '', 1).isdigit():
-        try:
-            score = float(user_input.replace('分', '').replace('點', '.').replace('。', '').strip())
-            score = int(score)
-        except:
-            score = 5
-            
-        if score >= 7:
-            return f"收到，您評估為 {score} 分，這個分數較高。\n\n⚠️ 我已經通知您的個案管理師，她會在 30 分鐘內與您電話聯繫。\n\n在等待期間，您可以：\n• 找個舒適的姿勢休息\n• 試著做噘嘴式呼吸\n• 如果感覺更不舒服，請直接撥打緊急電話"
-        elif score >= 4:
-            return f"收到，您評估為 {score} 分。\n\n💡 小建議：\n• 噘嘴式呼吸：鼻子吸氣 2 秒，噘嘴慢慢吐氣 4 秒\n• 姿勢調整：稍微前傾坐著可能會舒服一些\n• 適度活動：短距離散步有助於改善\n\n個管師會在今天稍後關心您的狀況。"
-        else:
-            return f"收到，您評估為 {score} 分，這是很好的狀況！\n\n✅ 今日症狀回報已完成\n\n繼續保持，記得：\n• 每天按時服藥\n• 適度活動\n• 充足休息\n\n明天見！🌟"
-    else:
-        return "謝謝您的回覆。\n\n能否再詳細描述一下您的感受呢？例如：\n• 有沒有疼痛？\n• 呼吸是否順暢？\n• 有沒有咳嗽？"
+def reported_symptom(history):
+    # 分數對應最近一則提到症狀的病人訊息
+    for msg in reversed(history.recent(CHAT_MEMORY_SIZE)):
+        if msg["role"] == "user":
+            found = symptoms.classify(msg["content"]).symptoms
+            if found:
+                return symptoms.SYMPTOM_LABEL[found[0]]
+    return None
+
+def submit_chat(content):
+    # 先顯示病人訊息，小助手回覆在下一次執行時串流輸出
+    result = symptoms.classify(content)
+    if result.score is not None:
+        symptom = symptoms.SYMPTOM_LABEL[result.symptoms[0]] if result.symptoms else reported_symptom(st.session_state.chat_history)
+        get_db().add_report(CURRENT_PATIENT_ID, symptom, result.score)
+    st.session_state.chat_history.append("user", content, datetime.now().strftime("%H:%M"))
+    st.session_state.pending_reply = content
+    rerun()
+
+def rerun():
+    # fragment 重跑中只重跑該 fragment，其餘情況重跑整頁
+    ctx = get_script_run_ctx()
+    st.rerun(scope="fragment" if ctx and ctx.fragment_ids_this_run else "app")
+
+def render_tabs(key, tabs):
+    # tabs: {標籤: fragment 函式}；st.tabs 會執行每個分頁，這裡只執行選取中的那一個
+    active = st.radio(key, list(tabs), horizontal=True, key=key, label_visibility="collapsed")
+    tabs[active]()
+
+def show_cards(name, rows):
+    # 一整串卡片合併成一次 markdown 輸出
+    html = cards.render_many(name, rows)
+    if html:
+        st.markdown(html, unsafe_allow_html=True)
+
+def format_rate(rate):
+    return "-" if rate is None else f"{rate:.1f}%"
 
 def get_status_style(status):
     styles = {
@@ -286,6 +333,62 @@ def get_alert_style(level):
     }
     return styles.get(level, styles["green"])
 
+def format_when(ts):
+    if ts is None:
+        return "-"
+    dt = datetime.fromtimestamp(ts)
+    today = datetime.now().date()
+    if dt.date() == today:
+        return f"今天 {dt:%H:%M}"
+    if dt.date() == today - timedelta(days=1):
+        return f"昨天 {dt:%H:%M}"
+    return f"{dt:%m/%d %H:%M}"
+
+def paginate(key, total, page_size=None):
+    page_size = page_size or PAGE_SIZE
+    pages = max(1, -(-total // page_size))
+    state_key = f"page_{key}"
+    page = min(st.session_state.get(state_key, 0), pages - 1)
+    st.session_state[state_key] = page
+    return page * page_size, page_size
+
+def render_pager(key, total, page_size=None, truncated=False):
+    page_size = page_size or PAGE_SIZE
+    pages = -(-total // page_size)
+    if pages <= 1:
+        return
+    state_key = f"page_{key}"
+    page = st.session_state.get(state_key, 0)
+    
+    col1, col2, col3 = st.columns(3)
+    if col1.button("‹ 上一頁", key=f"prev_{key}", disabled=page == 0, use_container_width=True):
+        st.session_state[state_key] = page - 1
+        rerun()
+    col2.markdown(f"""
+    <div style="text-align: center; padding-top: 14px; font-size: 13px; color: #64748b;">{page + 1} / {pages}（{'前' if truncated else '共'} {total} 筆）</div>
+    """, unsafe_allow_html=True)
+    if col3.button("下一頁 ›", key=f"next_{key}", disabled=page >= pages - 1, use_container_width=True):
+        st.session_state[state_key] = page + 1
+        rerun()
+
+def format_deadline(deadline, now):
+    minutes = int((deadline - now) // 60)
+    if minutes < 0:
+        return f"逾時 {-minutes} 分鐘"
+    if minutes < 60:
+        return f"剩 {minutes} 分鐘"
+    return f"剩 {minutes // 60} 小時"
+
+def format_ago(ts):
+    minutes = int((datetime.now().timestamp() - ts) // 60)
+    if minutes < 1:
+        return "剛剛"
+    if minutes < 60:
+        return f"{minutes} 分鐘前"
+    if minutes < 24 * 60:
+        return f"{minutes // 60} 小時前"
+    return f"{minutes // (24 * 60)} 天前"
+
 # ============================================
 # 頂部導航
 # ============================================
@@ -354,35 +457,42 @@ def render_patient():
     </div>
     """, unsafe_allow_html=True)
     
-    # Tabs
-    tab1, tab2, tab3 = st.tabs(["💬 對話回報", "📊 歷史紀錄", "📚 衛教專區"])
-    
-    with tab1:
+    # 分頁：只執行選取中的分頁，分頁內的互動只重跑該分頁
+    @st.fragment
+    def chat_tab():
         # 聊天記錄
         st.markdown("#### 與健康小助手對話")
         
+        history = st.session_state.chat_history
+        earlier_pages = st.session_state.chat_earlier_pages
+        
+        # 較早訊息從檔案分頁讀回，只在使用者要求時載入
+        if history.earlier_count() > earlier_pages * CHAT_PAGE_SIZE:
+            if st.button("⬆️ 載入較早訊息", key="chat_earlier", use_container_width=True):
+                st.session_state.chat_earlier_pages += 1
+                rerun()
+        
+        earlier = []
+        for page in range(earlier_pages - 1, -1, -1):
+            earlier += history.earlier(page, CHAT_PAGE_SIZE)
+        
         chat_container = st.container()
         with chat_container:
-            for msg in st.session_state.chat_history[-6:]:
-                if msg["role"] == "ai":
-                    st.markdown(f"""
-                    <div style="display: flex; gap: 10px; margin-bottom: 12px;">
-                        <div style="width: 32px; height: 32px; border-radius: 50%; background: linear-gradient(135deg, #10b981, #059669); display: flex; align-items: center; justify-content: center; flex-shrink: 0; font-size: 16px;">🤖</div>
-                        <div>
-                            <div style="font-size: 11px; color: #64748b; margin-bottom: 4px;">健康小助手 · {msg['time']}</div>
-                            <div class="chat-ai">{msg['content'].replace(chr(10), '<br>')}</div>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""
-                    <div style="display: flex; justify-content: flex-end; margin-bottom: 12px;">
-                        <div style="text-align: right;">
-                            <div style="font-size: 11px; color: #64748b; margin-bottom: 4px;">{msg['time']}</div>
-                            <div class="chat-user">{msg['content']}</div>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
+            st.markdown("".join(
+                cards.render("chat_ai" if msg["role"] == "ai" else "chat_user", time=msg["time"], content_html=cards.text_html(msg["content"]))
+                for msg in earlier + history.recent(CHAT_MEMORY_SIZE)
+            ), unsafe_allow_html=True)
+            
+            # 小助手回覆逐字串流，不阻塞整頁
+            if st.session_state.pending_reply:
+                prompt = st.session_state.pending_reply
+                now = datetime.now().strftime("%H:%M")
+                st.markdown(f"""
+                <div style="font-size: 11px; color: #64748b; margin-bottom: 4px;">🤖 健康小助手 · {now}</div>
+                """, unsafe_allow_html=True)
+                reply = st.write_stream(get_assistant().stream(prompt, history.recent(CHAT_MEMORY_SIZE)[:-1]))
+                history.append("ai", reply, now)
+                st.session_state.pending_reply = None
         
         st.markdown("---")
         
@@ -400,10 +510,7 @@ def render_patient():
         for i, (label, content) in enumerate(quick_replies):
             col = col1 if i % 2 == 0 else col2
             if col.button(label, key=f"quick_{i}", use_container_width=True):
-                now = datetime.now().strftime("%H:%M")
-                st.session_state.chat_history.append({"role": "user", "content": content, "time": now})
-                st.session_state.chat_history.append({"role": "ai", "content": simulate_ai_response(content), "time": now})
-                st.rerun()
+                submit_chat(content)
         
         # 症狀評分
         st.markdown("---")
@@ -426,10 +533,7 @@ def render_patient():
         """, unsafe_allow_html=True)
         
         if st.button(f"📤 提交評分 ({score}分)", use_container_width=True, type="primary"):
-            now = datetime.now().strftime("%H:%M")
-            st.session_state.chat_history.append({"role": "user", "content": f"{score}分", "time": now})
-            st.session_state.chat_history.append({"role": "ai", "content": simulate_ai_response(str(score)), "time": now})
-            st.rerun()
+            submit_chat(f"{score}分")
         
         # 文字輸入
         st.markdown("---")
@@ -437,61 +541,97 @@ def render_patient():
         
         if st.button("📤 送出", use_container_width=True):
             if user_input:
-                now = datetime.now().strftime("%H:%M")
-                st.session_state.chat_history.append({"role": "user", "content": user_input, "time": now})
-                st.session_state.chat_history.append({"role": "ai", "content": simulate_ai_response(user_input), "time": now})
-                st.rerun()
+                submit_chat(user_input)
     
-    with tab2:
+    @st.fragment
+    def history_tab():
         st.markdown("#### 📈 症狀趨勢")
         
-        # 模擬過去7天數據
-        dates = [(datetime.now() - timedelta(days=i)).strftime("%m/%d") for i in range(6, -1, -1)]
-        scores = [3, 2, 4, 3, 5, 3, 2]
-        
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(
-            x=dates, y=scores,
-            mode='lines+markers',
-            line=dict(color='#10b981', width=3),
-            marker=dict(size=10),
-            fill='tozeroy',
-            fillcolor='rgba(16, 185, 129, 0.1)'
-        ))
-        fig.update_layout(
-            height=250,
-            margin=dict(l=20, r=20, t=20, b=40),
-            xaxis_title="日期",
-            yaxis_title="症狀分數",
-            yaxis=dict(range=[0, 10])
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        trend_span = st.radio("趨勢範圍", ["7 天", "30 天", "12 個月"], horizontal=True, key="trend_span", label_visibility="collapsed")
+        trend_days = {"7 天": 7, "30 天": 30, "12 個月": 365}[trend_span]
+        
+        def build_trend():
+            period, trend = trends.series(get_db(), CURRENT_PATIENT_ID, trend_days)
+            if not trend["n"]:
+                return None
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(
+                x=trend["date"], y=trend["mean"],
+                name="平均",
+                mode='lines+markers',
+                line=dict(color='#10b981', width=3),
+                marker=dict(size=10 if len(trend["date"]) <= 31 else 5),
+                fill='tozeroy',
+                fillcolor='rgba(16, 185, 129, 0.1)'
+            ))
+            fig.add_trace(go.Scatter(
+                x=trend["date"], y=trend["max"],
+                name="最高",
+                mode='lines',
+                line=dict(color='#f59e0b', width=1, dash='dot')
+            ))
+            fig.update_layout(
+                height=250,
+                margin=dict(l=20, r=20, t=20, b=40),
+                legend=dict(orientation="h", y=-0.25),
+                xaxis_title="日期" if period == "day" else "週",
+                yaxis_title="症狀分數",
+                yaxis=dict(range=[0, 10])
+            )
+            return fig
+        
+        # 病人個人圖表只快取在自己的 session；跨日後區間改變
+        if not plot_cached(session_figure_cache(), "trend", (get_db().version("reports"), CURRENT_PATIENT_ID, date.today()), build_trend, days=trend_days):
+            st.caption("尚無症狀回報")
+        
+        # 居家血氧 / 心率
+        st.markdown("#### 🫀 居家血氧 / 心率")
+        
+        span = st.radio("時間範圍", ["24 小時", "7 天", "30 天"], horizontal=True, key="vitals_span", label_visibility="collapsed")
+        span_days = {"24 小時": 1, "7 天": 7, "30 天": 30}[span]
+        now = datetime.now().timestamp()
+        
+        def build_vitals():
+            ts, spo2, hr = vitals.chart_series(get_db(), CURRENT_PATIENT_ID, now - span_days * 86400, now)
+            if not len(ts):
+                return None
+            times = [datetime.fromtimestamp(t) for t in ts]
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(x=times, y=spo2, name="SpO2 (%)", line=dict(color='#3b82f6', width=2)))
+            fig.add_trace(go.Scatter(x=times, y=hr, name="心率 (bpm)", yaxis="y2", line=dict(color='#f43f5e', width=1.5)))
+            fig.update_layout(
+                height=250,
+                margin=dict(l=20, r=20, t=20, b=40),
+                legend=dict(orientation="h", y=-0.25),
+                yaxis=dict(title="SpO2 (%)", range=[85, 100]),
+                yaxis2=dict(title="心率", overlaying="y", side="right", showgrid=False)
+            )
+            return fig
+        
+        # 時間窗隨時間移動，以分鐘為單位更新
+        if not plot_cached(session_figure_cache(), "vitals", (get_db().version("vitals"), CURRENT_PATIENT_ID, int(now // 60)), build_vitals, days=span_days):
+            st.caption("尚無居家監測數據")
         
         # 歷史記錄
         st.markdown("#### 📋 回報記錄")
         
-        history = [
-            {"date": "今天 09:30", "symptoms": "輕微疲勞", "score": 2, "status": "正常"},
-            {"date": "昨天 10:15", "symptoms": "胸悶", "score": 3, "status": "正常"},
-            {"date": "12/24 08:45", "symptoms": "呼吸順暢", "score": 1, "status": "良好"},
-            {"date": "12/23 09:00", "symptoms": "輕微咳嗽", "score": 3, "status": "正常"},
-        ]
+        db = get_db()
+        total = db.count_reports(CURRENT_PATIENT_ID)
+        offset, limit = paginate("reports", total)
+        show_cards("report", [
+            {
+                "date": format_when(r["reported_at"]),
+                "symptom": r["symptom"] or "整體",
+                "score": r["score"],
+                "color": "#22c55e" if r["score"] <= 3 else "#f59e0b" if r["score"] <= 6 else "#ef4444",
+            }
+            for r in db.list_reports(CURRENT_PATIENT_ID, limit=limit, offset=offset)
+        ])
         
-        for h in history:
-            color = "#22c55e" if h["score"] <= 3 else "#f59e0b" if h["score"] <= 6 else "#ef4444"
-            st.markdown(f"""
-            <div style="background: white; border-radius: 12px; padding: 14px; margin-bottom: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.04); display: flex; justify-content: space-between; align-items: center;">
-                <div>
-                    <div style="font-size: 12px; color: #64748b;">{h['date']}</div>
-                    <div style="font-weight: 500; color: #1e293b;">{h['symptoms']}</div>
-                </div>
-                <div style="background: {color}20; color: {color}; padding: 4px 12px; border-radius: 8px; font-weight: 600;">
-                    {h['score']}分
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        render_pager("reports", total)
     
-    with tab3:
+    @st.fragment
+    def education_tab():
         st.markdown("#### 📚 衛教資源")
         
         # 衛教卡片
@@ -504,21 +644,9 @@ def render_patient():
             {"icon": "🚨", "title": "警示症狀", "desc": "何時需要立即就醫", "tag": "重要"},
         ]
         
-        for item in edu_items:
-            tag_color = "#ef4444" if item["tag"] == "重要" else "#3b82f6"
-            st.markdown(f"""
-            <div style="background: white; border-radius: 14px; padding: 16px; margin-bottom: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.05); display: flex; align-items: center; gap: 14px;">
-                <div style="font-size: 32px;">{item['icon']}</div>
-                <div style="flex: 1;">
-                    <div style="display: flex; align-items: center; gap: 8px; margin-bottom: 4px;">
-                        <span style="font-weight: 600; color: #1e293b;">{item['title']}</span>
-                        <span style="background: {tag_color}15; color: {tag_color}; padding: 2px 8px; border-radius: 6px; font-size: 11px;">{item['tag']}</span>
-                    </div>
-                    <div style="font-size: 13px; color: #64748b;">{item['desc']}</div>
-                </div>
-                <div style="color: #94a3b8;">▶</div>
-            </div>
-            """, unsafe_allow_html=True)
+        show_cards("education", [
+            dict(item, tag_color="#ef4444" if item["tag"] == "重要" else "#3b82f6") for item in edu_items
+        ])
         
         # 今日小知識
         st.markdown("---")
@@ -542,91 +670,141 @@ def render_patient():
     st.markdown("---")
     if st.button("🚨 緊急聯繫個管師", use_container_width=True, type="secondary"):
         st.error("📞 正在撥打個管師專線：0912-345-678")
+    
+    render_tabs("patient_tab", {
+        "💬 對話回報": chat_tab,
+        "📊 歷史紀錄": history_tab,
+        "📚 衛教專區": education_tab,
+    })
 
 # ============================================
 # 個管師端介面（完整版）
 # ============================================
 def render_manager():
-    # 統計摘要
-    st.markdown("""
-    <div style="background: linear-gradient(135deg, #3b82f6, #2563eb); border-radius: 20px; padding: 20px; color: white; margin-bottom: 20px;">
-        <h3 style="margin: 0 0 16px 0; font-size: 18px;">👩‍⚕️ 今日工作台</h3>
-        <div style="display: flex; justify-content: space-around; text-align: center;">
-            <div>
-                <div style="font-size: 28px; font-weight: 700;">2</div>
-                <div style="font-size: 12px; opacity: 0.9;">🔴 紅色</div>
-            </div>
-            <div>
-                <div style="font-size: 28px; font-weight: 700;">5</div>
-                <div style="font-size: 12px; opacity: 0.9;">🟡 黃色</div>
-            </div>
-            <div>
-                <div style="font-size: 28px; font-weight: 700;">3</div>
-                <div style="font-size: 12px; opacity: 0.9;">⏰ 逾期</div>
-            </div>
-            <div>
-                <div style="font-size: 28px; font-weight: 700;">32</div>
-                <div style="font-size: 12px; opacity: 0.9;">✅ 正常</div>
-            </div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    db = get_db()
+    get_overdue_detector().sweep(db)
+    queue = get_alert_queue()
+    queue.sync(db)
+    counts = queue.counts()
     
-    # Tabs
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["⚠️ 警示", "📋 個案", "📝 紀錄", "📅 排程", "📊 統計"])
+    # 統計摘要
+    st.markdown(cards.render(
+        "workbench",
+        red=counts["red"],
+        yellow=counts["yellow"],
+        overdue=db.count_patients("overdue"),
+        normal=db.count_patients("normal")
+    ), unsafe_allow_html=True)
     
-    with tab1:
+    # 分頁：只執行選取中的分頁，分頁內的互動只重跑該分頁
+    @st.fragment
+    def alerts_tab():
         st.markdown("#### 即時警示")
         st.caption("🔴 30分鐘內處理 | 🟡 當日處理")
         
-        for alert in ALERTS:
+        now = datetime.now().timestamp()
+        
+        notice = st.session_state.pop("alert_notice", None)
+        if notice:
+            st.warning(notice)
+        
+        # 即將逾時（10 分鐘內到期或已逾時）
+        breaching = queue.breaching_soon(now, within_minutes=10)
+        if breaching:
+            st.warning("⏱️ 即將逾時：" + "、".join(
+                f"{a['patient']}（{format_deadline(a['deadline'], now)}）" for a in breaching
+            ))
+        
+        # 依 SLA 期限排序的待處理警示
+        alert_total = len(queue)
+        offset, limit = paginate("alerts", alert_total)
+        status_label = {"pending": "待處理", "contacted": "聯繫中", "resolved": "已處理"}
+        
+        for alert in queue.next(limit, offset=offset):
             style = get_alert_style(alert["level"])
-            status_label = {"pending": "待處理", "contacted": "聯繫中", "resolved": "已處理"}
             
-            st.markdown(f"""
-            <div class="alert-{alert['level']}">
-                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
-                    <div style="display: flex; align-items: center; gap: 10px;">
-                        <div style="width: 40px; height: 40px; border-radius: 10px; background: {style['badge']}; color: white; display: flex; align-items: center; justify-content: center; font-weight: 700; font-size: 16px;">{alert['score']}</div>
-                        <div>
-                            <div style="font-weight: 600; color: {style['color']};">{alert['patient']}</div>
-                            <div style="font-size: 12px; color: #64748b;">{alert['symptom']}</div>
-                        </div>
-                    </div>
-                    <div style="text-align: right;">
-                        <div style="font-size: 11px; color: #64748b;">{alert['time']}</div>
-                        <div style="font-size: 11px; color: {style['color']};">{status_label[alert['status']]}</div>
-                    </div>
-                </div>
-                <div style="font-size: 12px; color: #64748b;">📱 {alert['phone']}</div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(cards.render(
+                "alert",
+                level=alert["level"],
+                badge=style["badge"],
+                color=style["color"],
+                score=alert["score"],
+                patient=alert["patient"],
+                symptom=alert["symptom"],
+                ago=format_ago(alert["created_at"]),
+                status=status_label[alert["status"]],
+                deadline=format_deadline(alert["deadline"], now),
+                phone=alert["phone"]
+            ), unsafe_allow_html=True)
             
+            col1, col2 = st.columns(2)
             if alert["status"] == "pending":
-                col1, col2 = st.columns(2)
-                col1.button(f"📞 電聯", key=f"call_{alert['id']}", use_container_width=True)
+                # 警示狀態會影響頁首統計，重跑整頁
+                if col1.button(f"📞 電聯", key=f"call_{alert['id']}", use_container_width=True):
+                    update_alert_status(alert["id"], "contacted")
+                    st.rerun()
                 col2.button(f"📋 詳情", key=f"detail_{alert['id']}", use_container_width=True)
+            else:
+                if col1.button("✅ 結案", key=f"resolve_{alert['id']}", use_container_width=True):
+                    update_alert_status(alert["id"], "resolved")
+                    st.rerun()
+                if alert["level"] != "red" and col2.button("⬆️ 升級", key=f"escalate_{alert['id']}", use_container_width=True):
+                    escalate_alert(alert["id"])
+                    st.rerun()
+        
+        if not alert_total:
+            st.success("✅ 目前沒有待處理警示")
+        
+        render_pager("alerts", alert_total)
     
-    with tab2:
+    @st.fragment
+    def patients_tab():
         st.markdown("#### 我的個案")
         
         # 搜尋
-        search = st.text_input("🔍 搜尋病人", placeholder="姓名或病歷號...")
+        search = st.text_input("🔍 搜尋病人", placeholder="姓名、病歷號、電話或手術...")
         
-        for p in PATIENTS:
-            if search and search not in p["name"] and search not in p["id"]:
-                continue
-                
+        # 搜尋字串改變時回到第一頁
+        if st.session_state.get("patients_query") != search:
+            st.session_state.patients_query = search
+            st.session_state.page_patients = 0
+        
+        if search:
+            index = get_search_index()
+            index.sync(db)
+            # 多取一筆判斷是否被截斷
+            hits = index.search(search, k=SEARCH_LIMIT + 1)
+            truncated = len(hits) > SEARCH_LIMIT
+            hits = hits[:SEARCH_LIMIT]
+            patient_total = len(hits)
+            offset, limit = paginate("patients", patient_total)
+            patients = db.get_patients(hits[offset:offset + limit])
+        else:
+            patient_total, truncated = db.count_patients(), False
+            offset, limit = paginate("patients", patient_total)
+            patients = db.list_patients(limit=limit, offset=offset)
+        
+        for p in patients:
             style = get_status_style(p["status"])
+            is_open = st.session_state.selected_patient == p["id"]
             
-            with st.expander(f"{style['icon']} {p['name']} ({p['id']}) - D+{p['day']}"):
+            # 只有展開中的病人才建立詳細內容
+            if st.button(
+                f"{'▾' if is_open else '▸'} {style['icon']} {p['name']} ({p['id']}) - D+{p['day']}",
+                key=f"p_open_{p['id']}",
+                use_container_width=True
+            ):
+                st.session_state.selected_patient = None if is_open else p["id"]
+                rerun()
+            
+            if is_open:
                 col1, col2 = st.columns(2)
                 col1.write(f"**年齡**：{p['age']} 歲")
                 col2.write(f"**手術**：{p['surgery']}")
                 
                 col1, col2 = st.columns(2)
                 col1.write(f"**順從度**：{p['compliance']}%")
-                col2.write(f"**最後回報**：{p['last_report']}")
+                col2.write(f"**最後回報**：{format_when(p['last_report_at'])}")
                 
                 st.progress(p['compliance'] / 100)
                 
@@ -634,152 +812,259 @@ def render_manager():
                 col1.button("📞 電話", key=f"p_call_{p['id']}", use_container_width=True)
                 col2.button("💬 LINE", key=f"p_line_{p['id']}", use_container_width=True)
                 col3.button("📝 紀錄", key=f"p_record_{p['id']}", use_container_width=True)
+        
+        if truncated:
+            st.caption(f"只顯示最相符的前 {SEARCH_LIMIT} 筆，請輸入更精確的關鍵字")
+        render_pager("patients", patient_total, truncated=truncated)
     
-    with tab3:
+    @st.fragment
+    def records_tab():
         st.markdown("#### 介入紀錄")
         
         # 新增紀錄表單
+        st.markdown("**新增紀錄**")
+        names = {p["id"]: p["name"] for p in db.patient_names()}
+        patient_id = st.selectbox(
+            "病人", [None] + list(names), format_func=lambda pid: names.get(pid, "選擇..."), key="record_patient"
+        )
+        # 選擇病人時記下其紀錄版本；儲存時版本已變表示其他個管師在這之後寫入了紀錄
+        if patient_id and st.session_state.get("record_base", (None, None))[0] != patient_id:
+            st.session_state.record_base = (patient_id, db.record_version(patient_id))
+        
         with st.form("new_record"):
-            st.markdown("**新增紀錄**")
-            
             col1, col2 = st.columns(2)
-            patient = col1.selectbox("病人", ["選擇..."] + [p["name"] for p in PATIENTS])
-            method = col2.selectbox("方式", ["電話", "LINE", "簡訊", "門診"])
+            method = col1.selectbox("方式", ["電話", "LINE", "簡訊", "門診"])
+            minutes = col2.number_input("時間（分鐘）", min_value=0, max_value=240, value=0)
             
             content = st.text_area("紀錄內容", placeholder="輸入聯繫紀錄...")
             
             col1, col2 = st.columns(2)
             need_referral = col1.checkbox("需要轉介")
-            if need_referral:
-                referral = col2.selectbox("轉介", ["緩和醫療", "營養", "復健", "心理"])
+            referral = col2.selectbox("轉介", ["緩和醫療", "營養", "復健", "心理"])
             
-            if st.form_submit_button("💾 儲存紀錄", use_container_width=True):
+            submitted = st.form_submit_button("💾 儲存紀錄", use_container_width=True)
+        
+        if submitted and not patient_id:
+            st.error("請選擇病人")
+        elif submitted and not content.strip():
+            st.error("請輸入紀錄內容")
+        elif submitted:
+            try:
+                _, version = get_record_writer().write({
+                    "patient_id": patient_id, "type": method, "content": content.strip(),
+                    "duration": f"{minutes}分鐘" if minutes else None,
+                    "referral": referral if need_referral else None,
+                    "manager_id": CURRENT_MANAGER_ID, "expected": st.session_state.record_base[1],
+                })
+            except TimeoutError:
+                st.warning("⏳ 寫入忙碌中，紀錄可能稍後才會出現在清單，請確認後再決定是否重新儲存")
+            except KeyError:
+                st.error("找不到這位病人，請重新選擇")
+            except record_writer.VersionConflict as e:
+                # 看過衝突的紀錄後再按一次儲存即以新版本寫入
+                st.session_state.record_base = (patient_id, e.version)
+                st.warning(f"⚠️ {names[patient_id]} 在您開始填寫後已有 {len(e.records)} 筆新紀錄，請確認後再按一次儲存")
+                for r in e.records:
+                    st.caption(
+                        f"{r['manager'] or '—'}｜{r['type']}｜{format_when(r['created_at'])}"
+                        f"{'｜轉介' + r['referral'] if r['referral'] else ''}｜{r['content'] or ''}"
+                    )
+            else:
+                st.session_state.record_base = (patient_id, version)
                 st.success("✅ 紀錄已儲存！")
         
         st.markdown("---")
         st.markdown("**最近紀錄**")
         
-        for record in INTERVENTION_RECORDS:
-            referral_tag = f'<span style="background: #fce7f3; color: #be185d; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">→{record["referral"]}</span>' if record["referral"] else ""
-            
-            st.markdown(f"""
-            <div style="background: white; border-radius: 12px; padding: 14px; margin-bottom: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.04);">
-                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
-                    <div>
-                        <span style="font-weight: 600;">{record['patient']}</span>
-                        <span style="background: #e0f2fe; color: #0369a1; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">{record['type']}</span>
-                        <span style="background: #f1f5f9; color: #64748b; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">{record['duration']}</span>
-                        {referral_tag}
-                    </div>
-                    <span style="font-size: 11px; color: #94a3b8;">{record['time']}</span>
-                </div>
-                <p style="margin: 0; font-size: 13px; color: #475569; line-height: 1.5;">{record['content']}</p>
-            </div>
-            """, unsafe_allow_html=True)
+        record_total = db.count_interventions()
+        offset, limit = paginate("records", record_total)
+        
+        show_cards("record", [
+            {
+                "patient": record["patient"],
+                "type": record["type"],
+                "duration": record["duration"] or "",
+                "referral_html": cards.render("referral_tag", referral=record["referral"]) if record["referral"] else "",
+                "when": format_when(record["created_at"]),
+                "content": record["content"] or "",
+            }
+            for record in db.list_interventions(limit=limit, offset=offset)
+        ])
+        
+        render_pager("records", record_total)
+    
+    def select_manager(key):
+        managers = {m["id"]: m["name"] for m in db.list_managers()}
+        ids = list(managers) or [CURRENT_MANAGER_ID]
+        return st.selectbox(
+            "個管師", ids, index=ids.index(CURRENT_MANAGER_ID) if CURRENT_MANAGER_ID in ids else 0,
+            format_func=lambda mid: managers.get(mid, mid), key=key, label_visibility="collapsed",
+        )
     
-    with tab4:
+    @st.fragment
+    def schedule_tab():
         st.markdown("#### 今日排程")
         
-        for item in SCHEDULE:
-            if item["status"] == "done":
-                bg, border, icon = "#f0fdf4", "#bbf7d0", "✅"
-            elif item["status"] == "current":
-                bg, border, icon = "#eff6ff", "#bfdbfe", "▶️"
-            else:
-                bg, border, icon = "#f8fafc", "#e2e8f0", "⏳"
-            
-            st.markdown(f"""
-            <div style="background: {bg}; border: 1px solid {border}; border-radius: 12px; padding: 14px; margin-bottom: 10px;">
-                <div style="display: flex; align-items: center; gap: 12px;">
-                    <span style="font-size: 20px;">{icon}</span>
-                    <div>
-                        <div style="font-size: 12px; color: #64748b;">{item['time']}</div>
-                        <div style="font-weight: 500; color: #1e293b;">{item['task']}</div>
-                        {f'<div style="font-size: 12px; color: #64748b; margin-top: 2px;">{item["detail"]}</div>' if item["detail"] else ""}
-                    </div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        manager_id = select_manager("schedule_manager")
+        now = datetime.now().timestamp()
+        
+        # 待處理警示、逾期個案與待執行轉介依期限與時段分派給各個管師；只有項目變動時才增量重排
+        plan = get_scheduler().refresh(db, queue).agenda(manager_id, now)
+        if plan["day"] != date.today():
+            st.caption(f"今日時段已結束或非工作日，以下為下一個工作日（{plan['day']:%m/%d}）的排程")
+        
+        schedule_style = {
+            "done": ("#f0fdf4", "#bbf7d0", "✅"),
+            "current": ("#eff6ff", "#bfdbfe", "▶️"),
+        }
+        rows = []
+        for block in plan["blocks"]:
+            bg, border, icon = schedule_style.get(block["status"], ("#f8fafc", "#e2e8f0", "⏳"))
+            groups = {}
+            for task in block["tasks"]:
+                groups[task["group"]] = groups.get(task["group"], 0) + 1
+            late = sum(task["late"] for task in block["tasks"])
+            pending = "、".join(f"{group} {n} 件" for group, n in groups.items())
+            parts = []
+            if block["status"] == "current":
+                parts.append(f"進行中 - 待處理 {len(block['tasks'])} 件（{pending}）" if pending else "進行中")
+            elif block["status"] == "upcoming" and pending:
+                parts.append(pending)
+            if block["completed"]:
+                parts.append(f"已完成 {block['completed']} 件")
+            if late and block["status"] != "done":
+                parts.append(f"{late} 件可能逾時")
+            detail = "，".join(parts)
+            rows.append({
+                "bg": bg, "border": border, "icon": icon,
+                "time": block["time"],
+                "task": block["task"],
+                "detail_html": cards.render("schedule_detail", detail=detail) if detail else "",
+            })
+        show_cards("schedule", rows)
+        if plan["overflow"]:
+            st.caption(f"另有 {len(plan['overflow'])} 件排不進本日時段，順延至下一個工作日")
+        
+        # 目前（或下一個有工作的）時段的工作清單
+        block = next((b for b in plan["blocks"] if b["status"] != "done" and b["tasks"]), None)
+        if block is None:
+            return
+        st.markdown("---")
+        st.markdown(f"**{block['time']} 工作清單**")
+        
+        tasks = block["tasks"]
+        offset, limit = paginate("schedule", len(tasks))
+        for task in tasks[offset:offset + limit]:
+            st.markdown(cards.render(
+                "task",
+                patient=task["patient"],
+                group=task["group"],
+                detail=task["detail"],
+                eta=datetime.fromtimestamp(task["eta"]).strftime("%H:%M"),
+                deadline=format_deadline(task["deadline"], now),
+                color="#ef4444" if task["late"] else "#22c55e",
+            ), unsafe_allow_html=True)
+            if task["kind"] == "referral" and st.button("✅ 轉介已完成", key=f"referral_done_{task['id']}", use_container_width=True):
+                # 稽核時間即完成時間，工作統計的「轉介完成」依此計入
+                done_at = time.time()
+                if db.complete_referral(task["id"], now=done_at):
+                    db.add_audit(manager_id, "referral_done", str(task["id"]), now=done_at)
+                rerun()
+        
+        render_pager("schedule", len(tasks))
     
-    with tab5:
+    @st.fragment
+    def stats_tab():
         st.markdown("#### 工作統計")
         
-        # 今日數據
+        manager_id = select_manager("stats_manager")
+        
+        # 今日數據（與昨日相比）
+        stats = get_workload_stats().refresh(db)
+        today, yesterday = stats.today(manager_id)
+        avg_delta = None if today["avg_call"] is None or yesterday["avg_call"] is None else f"{today['avg_call'] - yesterday['avg_call']:+.1f}"
+        
         col1, col2 = st.columns(2)
-        col1.metric("今日聯繫", "12 次", "+3")
-        col2.metric("平均通話", "4.5 分鐘", "-0.5")
+        col1.metric("今日聯繫", f"{today['contacts']} 次", f"{today['contacts'] - yesterday['contacts']:+d}")
+        col2.metric("平均通話", "-" if today["avg_call"] is None else f"{today['avg_call']:.1f} 分鐘", avg_delta)
         
         col1, col2 = st.columns(2)
-        col1.metric("警示處理", "8 件", "+2")
-        col2.metric("轉介完成", "3 件", "+1")
+        col1.metric("警示處理", f"{today['alerts']} 件", f"{today['alerts'] - yesterday['alerts']:+d}")
+        col2.metric("轉介完成", f"{today['referrals']} 件", f"{today['referrals'] - yesterday['referrals']:+d}")
         
         st.markdown("---")
         st.markdown("**本週工作量**")
         
-        # 工作量圖表
-        days = ['一', '二', '三', '四', '五']
-        contacts = [10, 12, 8, 15, 12]
-        
-        fig = go.Figure()
-        fig.add_trace(go.Bar(x=days, y=contacts, marker_color='#3b82f6'))
-        fig.update_layout(
-            height=200,
-            margin=dict(l=20, r=20, t=20, b=40),
-            xaxis_title="星期",
-            yaxis_title="聯繫次數"
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        # 工作量圖表：週一到今天，週末沒有聯繫時不顯示
+        contacts = stats.week(manager_id)
+        days = workload.WEEKDAYS[:len(contacts)]
+        while len(days) > 5 and not contacts[-1]:
+            days, contacts = days[:-1], contacts[:-1]
+        
+        def build_workload():
+            fig = go.Figure()
+            fig.add_trace(go.Bar(x=days, y=contacts, marker_color='#3b82f6'))
+            fig.update_layout(
+                height=200,
+                margin=dict(l=20, r=20, t=20, b=40),
+                xaxis_title="星期",
+                yaxis_title="聯繫次數"
+            )
+            return fig
+        
+        plot_cached(get_figure_cache(), "workload", (days, contacts), build_workload)
+    
+    render_tabs("manager_tab", {
+        "⚠️ 警示": alerts_tab,
+        "📋 個案": patients_tab,
+        "📝 紀錄": records_tab,
+        "📅 排程": schedule_tab,
+        "📊 統計": stats_tab,
+    })
 
 # ============================================
 # 資料中心介面（完整版）
 # ============================================
 def render_data():
+    summary = compliance_summary()
+    
     # 頂部統計
-    st.markdown("""
+    st.markdown(f"""
     <div style="background: linear-gradient(135deg, #8b5cf6, #7c3aed); border-radius: 20px; padding: 20px; color: white; margin-bottom: 20px;">
         <h3 style="margin: 0 0 16px 0; font-size: 18px;">📊 研究數據總覽</h3>
         <div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 12px; text-align: center;">
             <div style="background: rgba(255,255,255,0.15); border-radius: 12px; padding: 12px;">
-                <div style="font-size: 24px; font-weight: 700;">127</div>
-                <div style="font-size: 11px; opacity: 0.9;">總收案 /150</div>
+                <div style="font-size: 24px; font-weight: 700;">{sum(summary['enrolled'].values())}</div>
+                <div style="font-size: 11px; opacity: 0.9;">總收案 /{ENROLLMENT_TARGET * len(analytics.ARMS)}</div>
             </div>
             <div style="background: rgba(255,255,255,0.15); border-radius: 12px; padding: 12px;">
-                <div style="font-size: 24px; font-weight: 700;">78.5%</div>
+                <div style="font-size: 24px; font-weight: 700;">{format_rate(summary['all'])}</div>
                 <div style="font-size: 11px; opacity: 0.9;">完成率</div>
             </div>
             <div style="background: rgba(255,255,255,0.15); border-radius: 12px; padding: 12px;">
-                <div style="font-size: 24px; font-weight: 700;">85.2%</div>
+                <div style="font-size: 24px; font-weight: 700;">{format_rate(summary['overall']['AI-ePRO'])}</div>
                 <div style="font-size: 11px; opacity: 0.9;">AI組</div>
             </div>
         </div>
     </div>
     """, unsafe_allow_html=True)
     
-    # Tabs
-    tab1, tab2, tab3, tab4 = st.tabs(["📈 總覽", "🏆 品質", "📋 順從度", "💾 匯出"])
-    
-    with tab1:
+    # 分頁：只執行選取中的分頁，分頁內的互動只重跑該分頁
+    @st.fragment
+    def overview_tab():
         st.markdown("#### 收案進度")
         
+        enrolled = compliance_summary()["enrolled"]
         groups = [
-            ("組別A (AI-ePRO)", 45, 50, "#8b5cf6"),
-            ("組別B (傳統ePRO)", 42, 50, "#3b82f6"),
-            ("組別C (常規照護)", 40, 50, "#64748b"),
+            ("組別A (AI-ePRO)", enrolled["AI-ePRO"], "#8b5cf6"),
+            ("組別B (傳統ePRO)", enrolled["傳統ePRO"], "#3b82f6"),
+            ("組別C (常規照護)", enrolled["常規照護"], "#64748b"),
         ]
         
-        for name, current, target, color in groups:
-            pct = current / target * 100
-            st.markdown(f"""
-            <div style="margin-bottom: 16px;">
-                <div style="display: flex; justify-content: space-between; margin-bottom: 6px;">
-                    <span style="font-size: 13px; color: #1e293b;">{name}</span>
-                    <span style="font-size: 13px; font-weight: 600; color: {color};">{current}/{target} ({pct:.0f}%)</span>
-                </div>
-                <div class="progress-bg">
-                    <div class="progress-fill" style="width: {pct}%; background: {color};"></div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        show_cards("progress", [
+            {"margin": 16, "label": name, "value": f"{current}/{ENROLLMENT_TARGET} ({current / ENROLLMENT_TARGET * 100:.0f}%)", "pct": min(current / ENROLLMENT_TARGET * 100, 100), "color": color}
+            for name, current, color in groups
+        ])
         
         st.markdown("---")
         st.markdown("#### 研究時程")
@@ -797,150 +1082,280 @@ def render_data():
         st.markdown("---")
         st.markdown("#### 順從度趨勢")
         
-        fig = px.line(COMPLIANCE_DATA, x='月份', y=['AI-ePRO', '傳統ePRO'],
-                     color_discrete_map={'AI-ePRO': '#8b5cf6', '傳統ePRO': '#94a3b8'})
-        fig.update_layout(
-            height=250,
-            margin=dict(l=20, r=20, t=20, b=40),
-            legend_title_text='',
-            yaxis_title='完成率 (%)'
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        trend = {k: compliance_summary()[k] for k in ("months", "monthly")}
+        
+        def build_compliance():
+            import pandas as pd
+            import plotly.express as px
+            
+            compliance = pd.DataFrame({'月份': trend["months"], **trend["monthly"]})
+            fig = px.line(compliance, x='月份', y=analytics.ARMS, color_discrete_map=analytics.ARM_COLORS)
+            fig.update_layout(
+                height=250,
+                margin=dict(l=20, r=20, t=20, b=40),
+                legend_title_text='',
+                yaxis_title='完成率 (%)'
+            )
+            return fig
+        
+        # 以月完成率本身為版本：數字沒變就重用圖表
+        plot_cached(get_figure_cache(), "compliance", trend, build_compliance)
     
-    with tab2:
+    @st.fragment
+    def quality_tab():
         st.markdown("#### 品質指標達成")
         
-        quality_metrics = [
-            {"name": "緩和轉介率", "indicator": "#4", "current": 68, "target": 60, "trend": "+28%", "good": True},
-            {"name": "30天死亡率", "indicator": "#6", "current": 1.2, "target": 2, "trend": "-52%", "good": True},
-            {"name": "完治率", "indicator": "#9", "current": 82, "target": 75, "trend": "+17%", "good": True},
-            {"name": "個管收案率", "indicator": "#5", "current": 95, "target": 90, "trend": "+27%", "good": True},
-        ]
+        summary = quality_summary()
         
-        for m in quality_metrics:
-            color = "#22c55e" if m["good"] else "#f59e0b"
-            st.markdown(f"""
-            <div style="background: white; border-radius: 14px; padding: 16px; margin-bottom: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.05);">
-                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
-                    <div>
-                        <span style="background: #f5f3ff; color: #7c3aed; padding: 2px 8px; border-radius: 4px; font-size: 10px;">指標{m['indicator']}</span>
-                        <span style="font-weight: 600; color: #1e293b; margin-left: 8px;">{m['name']}</span>
-                    </div>
-                    <span style="background: {color}20; color: {color}; padding: 4px 10px; border-radius: 6px; font-size: 12px; font-weight: 600;">{m['trend']}</span>
-                </div>
-                <div style="display: flex; align-items: baseline; gap: 8px;">
-                    <span style="font-size: 28px; font-weight: 700; color: #1e293b;">{m['current']}{'%' if m['current'] > 10 else '%'}</span>
-                    <span style="font-size: 13px; color: #64748b;">目標 {m['target']}%</span>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        show_cards("quality", [
+            {
+                "indicator": m["indicator"],
+                "name": m["name"],
+                "trend": "-" if m["trend"] is None else f"{m['trend']:+.0f}%",
+                "current": "-" if m["rate"] is None else f"{m['rate']:.1f}" if m["rate"] < 10 else f"{m['rate']:.0f}",
+                "target": f"{'≤' if m['lower_better'] else '≥'}{m['target']}",
+                "color": "#22c55e" if m["met"] else "#f59e0b",
+            }
+            for m in summary["indicators"]
+        ])
+        st.caption(f"趨勢為與 {quality.TREND_DAYS} 天前的累計值相比")
         
         st.markdown("---")
         st.markdown("#### 🏆 品質認證進度")
         
-        cert = [
-            ("📊 管理面", 3, 4),
-            ("💉 照護面", 12, 15),
-            ("📈 成效面", 7, 9),
-        ]
-        
-        for label, done, total in cert:
-            pct = done / total * 100
-            st.markdown(f"""
-            <div style="margin-bottom: 12px;">
-                <div style="display: flex; justify-content: space-between; margin-bottom: 4px;">
-                    <span>{label}</span>
-                    <span style="font-weight: 600;">{done}/{total}</span>
-                </div>
-                <div class="progress-bg">
-                    <div class="progress-fill" style="width: {pct}%; background: #8b5cf6;"></div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        # 各面向達標的指標數
+        show_cards("cert", [
+            {"label": label, "done": done, "total": total, "pct": done / total * 100 if total else 0}
+            for label, done, total in summary["cert"]
+        ])
     
-    with tab3:
+    @st.fragment
+    def compliance_tab():
         st.markdown("#### 各時段完成率")
         
-        periods = [
-            ("住院期間", 95),
-            ("出院後 1 個月", 88),
-            ("出院後 2-3 個月", 75),
-            ("出院後 4-6 個月", 68),
-            ("出院後 7-12 個月", 62),
-        ]
+        arm = st.radio("組別", analytics.ARMS, horizontal=True, key="compliance_arm", label_visibility="collapsed")
+        periods = compliance_summary()["windows"][arm]
         
-        for period, rate in periods:
-            color = "#22c55e" if rate >= 80 else "#f59e0b" if rate >= 60 else "#ef4444"
-            st.markdown(f"""
-            <div style="margin-bottom: 14px;">
-                <div style="display: flex; justify-content: space-between; margin-bottom: 4px;">
-                    <span style="font-size: 13px; color: #1e293b;">{period}</span>
-                    <span style="font-size: 13px; font-weight: 600; color: {color};">{rate}%</span>
-                </div>
-                <div class="progress-bg">
-                    <div class="progress-fill" style="width: {rate}%; background: {color};"></div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        show_cards("progress", [
+            {"margin": 14, "label": f"{period}（應回報 {expected:,} 次）", "value": format_rate(rate), "pct": rate or 0, "color": "#22c55e" if (rate or 0) >= 80 else "#f59e0b" if (rate or 0) >= 60 else "#ef4444"}
+            for period, rate, expected in periods
+        ])
         
         st.markdown("---")
         st.markdown("#### 順從度影響因子")
         
-        factors = [
-            ("年齡 ≥65 歲", -15, False),
-            ("大學以上學歷", 12, True),
-            ("有主要照顧者", 18, True),
-            ("智慧型手機經驗 ≥3年", 22, True),
-            ("基線焦慮 (GAD-7≥10)", -8, False),
-        ]
+        db = get_db()
+        estimator = get_factor_estimator()
+        X, y = factors.cohort_matrix(db.cohort_baseline(), *get_compliance_model().refresh(db).patient_rates())
+        result = estimator.result(X, y)
+        # 第一次才自動估計；之後世代有變動時先顯示上次結果，由使用者決定何時重算
+        if result is None and (estimator.latest is None or st.session_state.get("refresh_factors")):
+            st.session_state.refresh_factors = False
+            with st.spinner("估計中..."):
+                result = estimator.estimate(X, y)
+        stale = result is None and estimator.latest is not None
+        result = result or estimator.latest
+        if result is None:
+            st.caption(f"資料不足（需至少 {factors.MIN_PATIENTS} 位已有到期時段的受試者）")
+            return
         
-        for factor, impact, positive in factors:
-            color = "#16a34a" if positive else "#dc2626"
-            bg = "#f0fdf4" if positive else "#fef2f2"
-            sign = "+" if impact > 0 else ""
-            
-            st.markdown(f"""
-            <div style="display: flex; justify-content: space-between; align-items: center; padding: 12px 14px; background: {bg}; border-radius: 10px; margin-bottom: 8px;">
-                <span style="font-size: 13px; color: #1e293b;">{factor}</span>
-                <span style="font-weight: 600; color: {color};">{sign}{impact}%</span>
-            </div>
-            """, unsafe_allow_html=True)
+        show_cards("factor", [
+            {
+                "factor": f"{f['label']}（95% CI {f['low']:+.0f}~{f['high']:+.0f}）",
+                "impact": f"{f['effect']:+.0f}%",
+                # 信賴區間跨過 0 的因子以灰色顯示
+                "color": "#64748b" if f["low"] < 0 < f["high"] else "#16a34a" if f["effect"] > 0 else "#dc2626",
+                "bg": "#f8fafc" if f["low"] < 0 < f["high"] else "#f0fdf4" if f["effect"] > 0 else "#fef2f2",
+            }
+            for f in result["factors"]
+        ])
+        st.caption(
+            f"羅吉斯迴歸（校正組別），結果為完成率 ≥{factors.COMPLIANT_RATE:.0%}；平均邊際效果（百分點），"
+            f"n = {result['n']}，bootstrap {result['replicates']} 次，{result['seconds']:.1f} 秒（{format_when(result['computed_at'])}）"
+        )
+        if stale and st.button("🔄 依最新資料重新估計", key="refresh_factors_button"):
+            st.session_state.refresh_factors = True
+            rerun()
+    
+    def export_jobs(polling):
+        # 由 export_tab 包成 fragment（有進行中的工作時定時重跑）
+        exporter = get_exporter()
+        jobs = [job for job in map(exporter.get, st.session_state.export_jobs) if job is not None]
+        if polling and not any(job.active for job in jobs):
+            # 工作都結束了，整頁重跑一次以停止定時更新
+            st.rerun()
+        for job in jobs:
+            label = f"{export.FORMATS[job.format]['label']} · {format_when(job.created_at)}"
+            if job.active:
+                st.progress(job.progress, text=f"{label} · {job.rows:,} / {job.total:,} 筆")
+                if st.button("取消", key=f"export_cancel_{job.id}"):
+                    job.cancel()
+            elif job.status == "done":
+                col1, col2 = st.columns([3, 1])
+                col1.markdown(f"✅ {label} · {job.rows:,} 筆 · {job.size / 1024:,.0f} KB")
+                if st.session_state.get("export_download") == job.id:
+                    # 按下後才讀檔，避免每次重跑都把檔案載入記憶體
+                    with open(job.path, "rb") as f:
+                        col2.download_button("⬇️ 存檔", f, job.file_name, key=f"export_file_{job.id}", use_container_width=True)
+                elif col2.button("⬇️ 下載", key=f"export_get_{job.id}", use_container_width=True):
+                    st.session_state.export_download = job.id
+                    rerun()
+            elif job.status == "cancelled":
+                st.markdown(f"⏹️ {label} · 已取消")
+            else:
+                st.error(f"{label} · 匯出失敗：{job.error}")
     
-    with tab4:
+    def redcap_sync():
+        sync = get_redcap()
+        if sync is None:
+            st.button("🔗 REDCap 同步", key="export_redcap", disabled=True, use_container_width=True,
+                      help="設定 AICARE_REDCAP_URL 與 AICARE_REDCAP_TOKEN 後啟用")
+            return
+        pending = sync.pending()
+        label = f"🔗 REDCap 同步（待送 {pending['patients']} 位個案、{pending['reports']:,} 筆回報）"
+        if st.button(label, key="export_redcap", use_container_width=True, disabled=sync.running):
+            sync.start()
+        if sync.running:
+            st.caption("⏳ 同步中，完成後重新整理即可看到結果")
+        elif sync.last and sync.last["error"]:
+            st.error(f"REDCap 同步失敗：{sync.last['error']}（已送出的批次不會重送）")
+        elif sync.last:
+            last = sync.last
+            st.caption(f"上次同步 {format_when(last['finished_at'])}：{last['patients']} 位個案、{last['reports']:,} 筆回報，{last['batches']} 批，{last['seconds']:.1f} 秒")
+    
+    @st.fragment
+    def export_tab():
         st.markdown("#### 數據匯出")
         
-        formats = [
-            ("📊 SPSS", ".sav"),
-            ("📈 R", ".rds"),
-            ("📉 SAS", ".sas7bdat"),
-            ("📄 CSV", ".csv"),
-            ("📗 Excel", ".xlsx"),
-            ("🔗 REDCap", "同步"),
-        ]
+        if 'export_jobs' not in st.session_state:
+            st.session_state.export_jobs = []
         
-        col1, col2 = st.columns(2)
-        for i, (name, ext) in enumerate(formats):
-            col = col1 if i % 2 == 0 else col2
-            col.button(f"{name} {ext}", key=f"export_{i}", use_container_width=True)
+        formats = export.available_formats()
+        fmt = st.radio(
+            "匯出格式", formats, horizontal=True, key="export_format",
+            format_func=lambda key: f"{export.FORMATS[key]['label']} {export.FORMATS[key]['ext']}",
+        )
+        missing = [f"{spec['label']}（需安裝 {spec['module']}）" for key, spec in export.FORMATS.items() if key not in formats]
+        if missing:
+            st.caption("未啟用：" + "、".join(missing))
+        redcap_sync()
         
         st.markdown("---")
         st.markdown("**匯出選項**")
         
         col1, col2 = st.columns(2)
-        col1.checkbox("去識別化處理", value=True)
-        col2.checkbox("包含數據字典", value=True)
+        deidentify = col1.checkbox("去識別化處理", value=True)
+        dictionary = col2.checkbox("包含數據字典", value=True)
         
         col1, col2 = st.columns(2)
-        col1.checkbox("僅完成追蹤者")
-        col2.checkbox("包含稽核軌跡")
+        completed_only = col1.checkbox("僅完成追蹤者", help=f"出院滿 {export.FOLLOW_UP_DAYS} 天（追蹤期結束）或已完成治療的個案")
+        audit = col2.checkbox("包含稽核軌跡")
         
         if st.button("📦 產生匯出檔案", use_container_width=True, type="primary"):
-            st.success("✅ 檔案產生中，請稍候...")
+            job = get_exporter().submit(
+                fmt, deidentify=deidentify, completed_only=completed_only, dictionary=dictionary, audit=audit,
+            )
+            st.session_state.export_jobs.insert(0, job.id)
+        
+        if st.session_state.export_jobs:
+            st.markdown("---")
+            st.markdown("**匯出工作**")
+            exporter = get_exporter()
+            polling = any(job is not None and job.active for job in map(exporter.get, st.session_state.export_jobs))
+            st.fragment(export_jobs, run_every=EXPORT_POLL_SECONDS if polling else None)(polling)
+    
+    render_tabs("data_tab", {
+        "📈 總覽": overview_tab,
+        "🏆 品質": quality_tab,
+        "📋 順從度": compliance_tab,
+        "💾 匯出": export_tab,
+    })
+
+# ============================================
+# 維運檢視（網址加上 ?admin=1）
+# ============================================
+def render_admin():
+    import pandas as pd
+    
+    metrics = get_metrics()
+    snap = metrics.snapshot()
+    sb = snap["state_bytes"]
+    
+    st.markdown("#### 🛠️ Session 記憶體")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("活躍 session", snap["active_sessions"])
+    col2.metric("p50", f"{sb['quantiles']['0.5'] / 1024:.1f} KB")
+    col3.metric("p99", f"{sb['quantiles']['0.99'] / 1024:.1f} KB")
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("執行次數", snap["runs"])
+    col2.metric("最大", f"{sb['max'] / 1024:.1f} KB")
+    col3.metric("合計", f"{snap['active_bytes_total'] / 1024:.1f} KB")
+    
+    run_ms = snap["run_ms"]["quantiles"]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("執行時間 p50", f"{run_ms['0.5']:.0f} ms")
+    col2.metric("執行時間 p90", f"{run_ms['0.9']:.0f} ms")
+    col3.metric("執行時間 p99", f"{run_ms['0.99']:.0f} ms")
+    
+    st.markdown("**各 key 合計大小**")
+    st.dataframe(
+        pd.DataFrame(
+            sorted(snap["key_bytes_total"].items(), key=lambda kv: -kv[1]),
+            columns=["key", "bytes"]
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    st.markdown("**最大的 session**")
+    heaviest = sorted(snap["sessions"].items(), key=lambda kv: -kv[1]["bytes"])[:20]
+    st.dataframe(
+        pd.DataFrame([
+            {"session": sid[:8], "bytes": r["bytes"], "runs": r["runs"], **r["counts"], "updated": format_when(r["updated_at"])}
+            for sid, r in heaviest
+        ]),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    st.markdown("#### 🤖 健康小助手")
+    stats = get_assistant().stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("快取命中率", f"{stats['hit_rate'] * 100:.0f}%")
+    col2.metric("延遲 p50", f"{stats['latency_p50'] * 1000:.0f} ms")
+    col3.metric("延遲 p95", f"{stats['latency_p95'] * 1000:.0f} ms")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("請求數", stats["requests"])
+    col2.metric("首字 p95", f"{stats['first_token_p95'] * 1000:.0f} ms")
+    col3.metric("逾時", stats["timeouts"])
+    col4.metric("錯誤", stats["errors"])
+    
+    snap["assistant"] = stats
+    
+    st.markdown("#### 📈 圖表快取")
+    stats = get_figure_cache().stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("命中率", f"{stats['hit_rate'] * 100:.0f}%")
+    col2.metric("平均建圖", f"{stats['avg_build_ms']:.1f} ms")
+    col3.metric("快取大小", f"{stats['bytes'] / 1024:.0f} KB（{stats['entries']}）")
+    
+    snap["figure_cache"] = stats
+    
+    col1, col2 = st.columns(2)
+    col1.download_button("⬇️ JSON", json.dumps(snap, ensure_ascii=False, indent=2), "session_metrics.json", use_container_width=True)
+    col2.download_button("⬇️ Prometheus", metrics.prometheus(snap), "session_metrics.prom", use_container_width=True)
 
 # ============================================
 # 主程式
 # ============================================
 def main():
+    if st.query_params.get("admin") == "1":
+        render_admin()
+        record_session_metrics()
+        return
+    
     render_nav()
     st.markdown("<br>", unsafe_allow_html=True)
     
@@ -958,6 +1373,10 @@ def main():
         AI-CARE Lung Trial | 三軍總醫院 數位醫學中心 © 2024
     </div>
     """, unsafe_allow_html=True)
+    
+    record_session_metrics()
+    if PRELOAD_MODULES:
+        preload_heavy_modules()
 
 if __name__ == "__main__":
     main()
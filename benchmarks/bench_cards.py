@@ -0,0 +1,86 @@
+"""
+卡片渲染效能測試：逐張 f-string vs. 預編譯樣板 + 內容快取
+
+    python benchmarks/bench_cards.py [卡片數]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cards
+
+
+def fstring_record(record):
+    # 原本 app.py 內的寫法
+    referral_tag = f'<span style="background: #fce7f3; color: #be185d; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">→{record["referral"]}</span>' if record["referral"] else ""
+    return f"""
+            <div style="background: white; border-radius: 12px; padding: 14px; margin-bottom: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.04);">
+                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+                    <div>
+                        <span style="font-weight: 600;">{record['patient']}</span>
+                        <span style="background: #e0f2fe; color: #0369a1; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">{record['type']}</span>
+                        <span style="background: #f1f5f9; color: #64748b; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">{record['duration']}</span>
+                        {referral_tag}
+                    </div>
+                    <span style="font-size: 11px; color: #94a3b8;">{record['when']}</span>
+                </div>
+                <p style="margin: 0; font-size: 13px; color: #475569; line-height: 1.5;">{record['content']}</p>
+            </div>
+            """
+
+
+def template_record(record):
+    return {
+        "patient": record["patient"],
+        "type": record["type"],
+        "duration": record["duration"],
+        "referral_html": cards.render("referral_tag", referral=record["referral"]) if record["referral"] else "",
+        "when": record["when"],
+        "content": record["content"],
+    }
+
+
+def timeit(fn, repeat=200):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    records = [
+        {
+            "patient": f"病人{i}",
+            "type": "電話",
+            "duration": "8分鐘",
+            "referral": "營養諮詢" if i % 3 == 0 else None,
+            "when": f"今天 {i % 24:02d}:00",
+            "content": "呼吸困難症狀評估，建議使用噘嘴式呼吸，若持續加重需回診。病人表示了解。",
+        }
+        for i in range(n)
+    ]
+
+    old = [fstring_record(r) for r in records]
+    fstring = timeit(lambda: [fstring_record(r) for r in records])
+
+    cards._render.cache_clear()
+    t = time.perf_counter()
+    batched = cards.render_many("record", [template_record(r) for r in records])
+    cold = (time.perf_counter() - t) * 1000
+    warm = timeit(lambda: cards.render_many("record", [template_record(r) for r in records]))
+
+    print(f"{n} 張介入紀錄卡片")
+    print(f"  f-string 逐張:        {fstring:.3f} ms，{n} 次 markdown，{sum(len(h.encode()) for h in old):,} bytes")
+    print(f"  樣板（首次）:         {cold:.3f} ms")
+    print(f"  樣板（快取命中）:     {warm:.3f} ms，1 次 markdown，{len(batched.encode()):,} bytes")
+    print(f"  CSS: 原始 {len(cards.STYLE.encode()):,} bytes → 壓縮後 {len(cards.STYLE_HTML.encode()):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+症狀分類微基準：原本的關鍵字掃描 vs. 編譯後的單次比對
+
+    python benchmarks/bench_classifier.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import symptoms
+
+CASES = {
+    "快速回覆": ["還不錯 👍", "有點累", "胸口悶悶的", "有點痛"],
+    "分數": ["7分", "３", "七分", "4.5", "十分"],
+    "否定": ["今天不喘", "沒有很痛", "不太好"],
+    "長句": [
+        "今天早上起床之後覺得還可以，但是走到樓下買早餐的時候有點喘，回來休息一下就比較好了，晚上睡覺也還行",
+        "傷口附近偶爾會抽痛，尤其是咳嗽的時候特別明顯，痰是白色的，沒有發燒，大概五分",
+    ],
+    "無關鍵字": ["請問下次回診是什麼時候", "謝謝"],
+}
+# 分數解析檢查：「分」只在句尾、標點、語氣詞或症狀詞前才算分數
+SCORE_CHECKS = {
+    "7分": 7, "３": 3, "七分": 7, "十分": 10, "十分累": None, "大概五分": 5, "7分痛": 7, "5分，還好": 5,
+    "走路5分鐘就喘": None, "三分之一的時間在咳": None, "跟家人分享 2 次": None, "咳了三分多鐘": None,
+    "痛到8分了": 8, "疼痛8分了": 8, "喘 7分了": 7, "6分耶": 6, "5分哦": 5,
+}
+
+
+def legacy_classify(user_input):
+    # 原本 simulate_ai_response 的判斷流程（不含回覆文字）
+    user_input = user_input.lower() if user_input else ""
+    if any(word in user_input for word in ['悶', '喘', '呼吸']):
+        return "breath"
+    elif any(word in user_input for word in ['累', '疲', '沒力']):
+        return "fatigue"
+    elif any(word in user_input for word in ['痛', '疼']):
+        return "pain"
+    elif any(word in user_input for word in ['咳', '痰']):
+        return "cough"
+    elif any(word in user_input for word in ['不錯', '好', '還好', '👍']):
+        return "good"
+    elif user_input.replace('分', '').replace('點', '.').replace('。', '').strip().replace('.', '', 1).isdigit():
+        try:
+            return int(float(user_input.replace('分', '').replace('點', '.').replace('。', '').strip()))
+        except ValueError:
+            return 5
+    return None
+
+
+def per_call_us(fn, messages, number):
+    total = timeit.timeit(lambda: [fn(m) for m in messages], number=number)
+    return total / (number * len(messages)) * 1e6
+
+
+def main():
+    for text, expected in SCORE_CHECKS.items():
+        assert symptoms.classify(text).score == expected, (text, symptoms.classify(text).score, expected)
+
+    print(f"{'案例':<10}{'原本 µs':>10}{'未快取 µs':>12}{'快取 µs':>10}")
+    for name, messages in CASES.items():
+        legacy = per_call_us(legacy_classify, messages, 20000)
+        uncached = per_call_us(symptoms._classify, messages, 20000)
+        cached = per_call_us(symptoms.classify, messages, 20000)
+        print(f"{name:<10}{legacy:>10.2f}{uncached:>12.2f}{cached:>10.2f}")
+
+    rng = random.Random(0)
+    pool = [m for messages in CASES.values() for m in messages]
+    stream = [rng.choice(pool) for _ in range(100_000)]
+    t_legacy = timeit.timeit(lambda: [legacy_classify(m) for m in stream], number=1)
+    t_single = timeit.timeit(lambda: [symptoms._classify(m) for m in stream], number=1)
+    t_batch = timeit.timeit(lambda: symptoms.classify_batch(stream), number=1)
+    print(f"\n100,000 則訊息：原本 {t_legacy:.3f}s，逐筆未快取 {t_single:.3f}s，classify_batch {t_batch:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+研究數據匯出效能測試：大量症狀回報分批寫出的速度與記憶體高峰
+「一次載入」模擬把整張表 fetchall 後再寫檔的作法
+
+    python benchmarks/bench_export.py [筆數]
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export
+from store import Store
+
+
+def fill(db, n):
+    patients = [p["id"] for p in db.list_patients()]
+    now = time.time()
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO reports (patient_id, symptom, score, reported_at) VALUES (?, ?, ?, ?)",
+            ((patients[i % len(patients)], "疲勞", i % 11, now - i * 60) for i in range(n)),
+        )
+
+
+def load_all(db, path):
+    rows = db.query_tuples(
+        "SELECT r.id, r.patient_id, p.name, p.phone, p.age, p.surgery, p.day, r.symptom, r.score, r.reported_at"
+        " FROM reports r JOIN patients p ON p.id = r.patient_id ORDER BY r.id"
+    )
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([col[0] for col in export.REPORT_COLUMNS])
+        writer.writerows(export._text_rows(export.REPORT_COLUMNS, rows))
+    return len(rows)
+
+
+def measure(fn):
+    # tracemalloc 會拖慢數倍，時間與記憶體分兩次量
+    t = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - t
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    tmp = tempfile.mkdtemp(prefix="aicare-export-")
+    db = Store(os.path.join(tmp, "aicare.db"))
+    db.seed_demo()
+    fill(db, n)
+
+    cases = [("一次載入 CSV", lambda: load_all(db, os.path.join(tmp, "all.csv")))]
+    for fmt in export.available_formats():
+        path = os.path.join(tmp, "out" + export.FORMATS[fmt]["ext"])
+        cases.append((f"分批 {fmt}", lambda path=path, fmt=fmt: export.run_export(db, path, fmt, deidentify=False)))
+
+    path = os.path.join(tmp, "deid.csv")
+    cases.append(("分批 csv 去識別", lambda: export.run_export(db, path, "csv", deid_key=b"benchmark-key")))
+
+    print(f"{db.count_report_rows():,} 筆症狀回報")
+    print(f"{'方式':<16}{'時間':>10}{'每秒筆數':>14}{'記憶體高峰':>12}")
+    for name, fn in cases:
+        rows, elapsed, peak = measure(fn)
+        print(f"{name:<16}{elapsed:>9.2f}s{rows / elapsed:>14,.0f}{peak / 1024 / 1024:>10.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+順從度影響因子效能測試：bootstrap 1,000 次的羅吉斯迴歸，單一行程 vs. 行程池
+
+    python benchmarks/bench_factors.py [受試者數] [次數]
+
+「重抽複製」為每次以索引複製資料、從零開始配適的寫法；行程池時間不含第一次啟動行程。
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import analytics
+import factors
+from store import Store
+
+
+def copy_bootstrap(X, y, replicates, seed=0):
+    rng = np.random.default_rng(seed)
+    n = len(y)
+    for _ in range(replicates):
+        idx = rng.integers(0, n, n)
+        beta = factors.fit_logistic(X[idx], y[idx])
+        factors.marginal_effects(X[idx], beta)
+
+
+def timed(estimator, X, y):
+    estimator.results = {}
+    t = time.perf_counter()
+    estimator.estimate(X, y)
+    return time.perf_counter() - t
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    replicates = int(sys.argv[2]) if len(sys.argv) > 2 else factors.REPLICATES
+    db = Store(":memory:")
+    db.seed_demo()
+    analytics.seed_demo_cohort(db, size=size)
+    model = analytics.ComplianceModel().refresh(db)
+    X, y = factors.cohort_matrix(db.cohort_baseline(), *model.patient_rates())
+    print(f"{len(y):,} 位受試者（完成率 ≥80%：{int(y.sum()):,}），bootstrap {replicates} 次，CPU {os.cpu_count()} 核")
+
+    t = time.perf_counter()
+    copy_bootstrap(X, y, replicates)
+    print(f"  重抽複製（單一行程）: {time.perf_counter() - t:6.2f}s")
+
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        estimator = factors.FactorEstimator(workers=workers, replicates=replicates)
+        timed(estimator, X, y)
+        print(f"  權重重抽 {workers} 個行程:    {timed(estimator, X, y):6.2f}s")
+        estimator.close()
+
+    estimator = factors.FactorEstimator(workers=1, replicates=replicates)
+    estimator.estimate(X, y)
+    t = time.perf_counter()
+    estimator.estimate(X, y)
+    print(f"  世代未變（快取）:     {(time.perf_counter() - t) * 1000:6.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
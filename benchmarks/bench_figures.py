@@ -0,0 +1,97 @@
+"""
+圖表快取效能測試：每次重跑重建圖表 vs. 依資料版本快取
+
+    python benchmarks/bench_figures.py [重複次數]
+
+「送出」欄位模擬 st.plotly_chart 內部的驗證與序列化，兩種情況都要付出。
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io
+import plotly.tools
+
+import analytics
+import trends
+from figure_cache import FigureCache, figure_key
+from store import Store
+
+
+def compliance_trend(model):
+    summary = model.summary()
+    return {k: summary[k] for k in ("months", "monthly")}
+
+
+def build_compliance(trend):
+    # 與資料中心「順從度趨勢」相同：各組每月完成率由 analytics.py 從回報計算
+    compliance = pd.DataFrame({'月份': trend["months"], **trend["monthly"]})
+    fig = px.line(compliance, x='月份', y=analytics.ARMS, color_discrete_map=analytics.ARM_COLORS)
+    fig.update_layout(height=250, margin=dict(l=20, r=20, t=20, b=40), legend_title_text='', yaxis_title='完成率 (%)')
+    return fig
+
+
+def build_workload(_):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=['一', '二', '三', '四', '五'], y=[10, 12, 8, 15, 12], marker_color='#3b82f6'))
+    fig.update_layout(height=200, margin=dict(l=20, r=20, t=20, b=40), xaxis_title="星期", yaxis_title="聯繫次數")
+    return fig
+
+
+def build_trend(db):
+    period, trend = trends.series(db, "P001", 365)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=trend["date"], y=trend["mean"], mode='lines+markers', fill='tozeroy'))
+    fig.add_trace(go.Scatter(x=trend["date"], y=trend["max"], mode='lines', line=dict(dash='dot')))
+    fig.update_layout(height=250, margin=dict(l=20, r=20, t=20, b=40), yaxis=dict(range=[0, 10]))
+    return fig
+
+
+def send(fig):
+    # 與 st.plotly_chart 相同的步驟
+    return plotly.io.to_json(plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True), validate=False)
+
+
+def timeit(fn, repeat):
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1000
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    db = Store(":memory:")
+    db.seed_demo()
+    trends.seed_demo_reports(db, "P001")
+    analytics.seed_demo_cohort(db)
+    trend = compliance_trend(analytics.ComplianceModel().refresh(db))
+    cache = FigureCache()
+
+    # (名稱, 建圖, 建圖輸入, 快取版本)；順從度與 app 相同，以月完成率本身為版本
+    charts = [
+        ("順從度趨勢 (px.line)", build_compliance, trend, trend),
+        ("本週工作量 (go.Bar)", build_workload, None, "static"),
+        ("症狀趨勢 12 個月", build_trend, db, db.version("reports")),
+    ]
+    print(f"{'圖表':<22}{'重建':>10}{'快取':>10}{'送出':>10}{'每次重跑節省':>14}")
+    saved_total = 0.0
+    for name, build, data, version in charts:
+        key = figure_key(name, version)
+        rebuild = timeit(lambda: build(data), repeat)
+        fig = cache.figure(key, lambda: build(data))
+        cached = timeit(lambda: cache.figure(figure_key(name, version), lambda: build(data)), repeat)
+        sent = timeit(lambda: send(fig), repeat)
+        saved_total += rebuild - cached
+        print(f"{name:<22}{rebuild:>8.2f}ms{cached:>8.3f}ms{sent:>8.2f}ms{rebuild - cached:>12.2f}ms")
+    print(f"\n三張圖合計每次重跑節省約 {saved_total:.1f} ms；快取 {cache.stats()['bytes'] / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
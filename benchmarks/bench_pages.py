@@ -0,0 +1,64 @@
+"""
+頁面執行時間測試：以 streamlit.testing 執行各頁面，取多次重跑中腳本本身的最短執行時間
+
+    python benchmarks/bench_pages.py [次數]
+
+執行時間取自 session 量測輸出（不含測試框架輪詢的等待）；沒有分頁選擇的舊版本會顯示為「全部」。
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TMP = tempfile.mkdtemp(prefix="aicare-pages-")
+os.environ.update(
+    AICARE_DB=os.path.join(TMP, "aicare.db"),
+    AICARE_CHAT_DIR=os.path.join(TMP, "chat"),
+    AICARE_METRICS_DIR=os.path.join(TMP, "metrics"),
+    AICARE_PRELOAD="0",
+    AICARE_METRICS_INTERVAL="0",
+)
+METRICS_JSON = os.path.join(TMP, "metrics", "session_metrics.json")
+
+from streamlit.testing.v1 import AppTest
+
+PAGES = ["patient", "manager", "data"]
+
+
+def last_run_ms():
+    with open(METRICS_JSON, encoding="utf-8") as f:
+        sessions = json.load(f)["sessions"]
+    return max(sessions.values(), key=lambda r: r["updated_at"])["last_run_ms"]
+
+
+def best_run(at, runs):
+    best = float("inf")
+    for _ in range(runs):
+        at.run()
+        best = min(best, last_run_ms())
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for page in PAGES:
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+        at.session_state["page"] = page
+        at.run()
+        tabs = [r for r in at.radio if r.key == f"{page}_tab"]
+        if not tabs:
+            print(f"{page:<8} 全部        {best_run(at, runs):7.1f} ms")
+            continue
+        for label in tabs[0].options:
+            at.radio(key=f"{page}_tab").set_value(label)
+            at.run()
+            print(f"{page:<8} {label:<10} {best_run(at, runs):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
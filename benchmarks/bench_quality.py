@@ -0,0 +1,60 @@
+"""
+品質指標效能測試：每次重掃全部收案 / 介入紀錄 / 結果 vs. 事件增量更新
+
+    python benchmarks/bench_quality.py [受試者數] [每輪新增紀錄數]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+import quality
+from store import Store
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    delta = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    db = Store(":memory:")
+    db.seed_demo()
+    analytics.seed_demo_cohort(db, size=size)
+    quality.seed_demo_events(db)
+    now = time.time()
+
+    t = time.perf_counter()
+    engine = quality.QualityEngine().refresh(db)
+    engine.summary(now)
+    full = time.perf_counter() - t
+    events = engine.events
+
+    patients = [e["patient_id"] for e in db.list_enrollment()][:delta]
+    for pid in patients:
+        db.add_intervention(pid, "電話", "追蹤", referral="緩和醫療")
+    t = time.perf_counter()
+    engine.refresh(db)
+    summary = engine.summary(now)
+    incremental = time.perf_counter() - t
+
+    # 增量結果須與重掃一致
+    rescanned = quality.QualityEngine().refresh(db).summary(now)
+    assert [(m["num"], m["den"]) for m in summary["indicators"]] == [(m["num"], m["den"]) for m in rescanned["indicators"]]
+
+    print(f"{size:,} 位受試者、{events:,} 個事件，本輪新增 {delta} 筆介入紀錄")
+    print(f"  重掃全部事件:      {full * 1000:8.1f} ms")
+    print(f"  新增後增量更新:    {incremental * 1000:8.2f} ms（每事件 {incremental / delta * 1e6:.1f} µs）")
+    print(f"  沒有新事件:        {timeit(lambda: engine.refresh(db).summary(now)) * 1000:8.2f} µs")
+    print(f"  一年前快照:        {timeit(lambda: engine.snapshot(now - quality.TREND_DAYS * quality.DAY)) * 1000:8.2f} µs")
+
+
+def timeit(fn, repeat=1000):
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1000
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+介入紀錄寫入效能測試：每筆一個交易 vs. group commit 批次提交
+
+    python benchmarks/bench_records.py [寫入執行緒數] [每執行緒筆數] [synchronous]
+
+模擬多位個管師同時送出紀錄（每個執行緒依序送出、等寫入完成才送下一筆），
+病人 5,000 位，約 5% 的紀錄帶著過時的版本送出。資料庫為暫存目錄中的 WAL 檔案；
+synchronous 預設 NORMAL（與 app 相同），指定 FULL 時每次提交都 fsync。
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import record_writer
+from store import Store
+
+PATIENTS = [f"P{i:05d}" for i in range(1, 5001)]
+
+
+def open_store(path, synchronous):
+    db = Store(path)
+    for conn in {db.conn, db.write_conn}:
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO patients (id, name, status, updated_at) VALUES (?, ?, 'normal', 0)",
+            ((pid, pid) for pid in PATIENTS),
+        )
+    return db
+
+
+def run(threads, per_thread, write):
+    # 回傳 (秒數, 衝突筆數, 每筆延遲 ms)
+    conflicts, latency = [0] * threads, [[] for _ in range(threads)]
+
+    def worker(n):
+        rng = np.random.default_rng(n)
+        for i in range(per_thread):
+            record = {"patient_id": PATIENTS[int(rng.integers(len(PATIENTS)))], "type": "電話", "content": f"追蹤 {n}-{i}"}
+            t = time.perf_counter()
+            conflicts[n] += write(record, stale=rng.random() < 0.05)
+            latency[n].append(time.perf_counter() - t)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    t = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - t, sum(conflicts), np.concatenate(latency) * 1000
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    synchronous = sys.argv[3] if len(sys.argv) > 3 else "NORMAL"
+    total = threads * per_thread
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_store(os.path.join(tmp, "single.db"), synchronous)
+
+        def single(record, stale):
+            # 對照組：每筆各自一個交易
+            db.add_intervention(**record)
+            return 0
+
+        single_seconds, _, single_latency = run(threads, per_thread, single)
+        db.close()
+
+        db = open_store(os.path.join(tmp, "group.db"), synchronous)
+        writer = record_writer.RecordWriter(db)
+
+        def grouped(record, stale):
+            version = db.record_version(record["patient_id"])
+            try:
+                writer.write(dict(record, expected=version - 1 if stale and version else version))
+            except record_writer.VersionConflict:
+                return 1
+            return 0
+
+        group_seconds, conflicts, group_latency = run(threads, per_thread, grouped)
+        assert db.count_interventions() + conflicts == total
+        db.close()
+
+    stats = writer.stats
+    print(f"{threads} 個執行緒 × {per_thread} 筆 = {total:,} 筆紀錄（synchronous={synchronous}）")
+    print(f"  每筆一個交易: {total / single_seconds:8,.0f} 筆/秒，延遲 p50 {np.median(single_latency):.2f} ms、p99 {np.percentile(single_latency, 99):.2f} ms")
+    print(f"  group commit: {total / group_seconds:8,.0f} 筆/秒，延遲 p50 {np.median(group_latency):.2f} ms、p99 {np.percentile(group_latency, 99):.2f} ms")
+    print(f"  {stats['batches']:,} 個交易（平均每批 {stats['records'] / stats['batches']:.1f} 筆、最大 {stats['largest']}），版本衝突 {conflicts} 筆")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+REDCap 同步效能測試：每次全部重送 vs. 高水位增量同步（對本機替身伺服器）
+
+    python benchmarks/bench_redcap.py [回報筆數] [每輪新增筆數]
+
+替身伺服器每 20 個請求回一次 503，兩種方式都會經過重試。
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redcap
+import redcap_mock
+from store import Store
+
+
+def fill(db, n, start=0):
+    patients = [p["id"] for p in db.list_patients()]
+    now = time.time() - 3600
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO reports (patient_id, symptom, score, reported_at) VALUES (?, ?, ?, ?)",
+            ((patients[i % len(patients)], "疲勞", i % 11, now + i) for i in range(start, start + n)),
+        )
+
+
+def sync_once(db, url, full):
+    if full:
+        db.set_watermark(redcap.PATIENT_WATERMARK, 0, "")
+        db.set_watermark(redcap.REPORT_WATERMARK, 0)
+    client = redcap.RedcapClient(url, "demo")
+    stats = redcap.RedcapSync(db, client).run(now=time.time() + redcap.SETTLE_SECONDS)
+    if stats["error"]:
+        raise RuntimeError(stats["error"])
+    return stats, client
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    delta = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    redcap.RETRY_BACKOFF = 0.01
+    _, api, url = redcap_mock.start(fail_every=20)
+    db = Store(":memory:")
+    db.seed_demo(now=time.time() - 3600)
+    fill(db, n)
+    sync_once(db, url, full=True)
+
+    fill(db, delta, start=n)
+    print(f"共 {n + delta:,} 筆回報，本輪新增 {delta:,} 筆")
+    print(f"{'方式':<10}{'送出筆數':>10}{'請求':>8}{'傳輸量':>12}{'時間':>10}")
+    for name, full in (("增量同步", False), ("全部重送", True)):
+        t = time.perf_counter()
+        stats, client = sync_once(db, url, full)
+        elapsed = time.perf_counter() - t
+        sent = stats["patients"] + stats["reports"]
+        print(f"{name:<10}{sent:>12,}{client.requests:>8}{client.bytes_sent / 1024:>10,.0f}KB{elapsed:>9.2f}s")
+    print(f"替身伺服器：{api.stats()}")
+
+
+if __name__ == "__main__":
+    main()
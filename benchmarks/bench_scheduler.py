@@ -0,0 +1,99 @@
+"""
+個管師排程效能測試：整體重排 vs. 增量重排（處理掉 / 新增少量工作）
+
+    python benchmarks/bench_scheduler.py [病人數] [個管師數]
+
+約 10% 病人逾期、5% 有待處理警示、3% 有待執行轉介；排程時間固定為某工作日 08:30。
+"""
+
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from alert_queue import AlertQueue
+import scheduler
+from store import Store
+
+
+def fill(db, size, managers, now, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = [f"X{i:05d}" for i in range(size)]
+    status = np.where(rng.random(size) < 0.1, "overdue", "normal")
+    db.add_managers([(m, m) for m in managers])
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO patients (id, name, age, surgery, day, compliance, status, last_report_at, phone, updated_at)"
+            " VALUES (?, ?, 60, '肺葉切除', 30, 80, ?, ?, NULL, ?)",
+            ((pid, f"病人{pid}", str(s), now - 86400, now) for pid, s in zip(ids, status)),
+        )
+        conn.executemany(
+            "INSERT INTO alerts (patient_id, level, symptom, score, status, created_at, updated_at)"
+            " VALUES (?, ?, '疲勞', 5, 'pending', ?, ?)",
+            (
+                (pid, "red" if rng.random() < 0.2 else "yellow", now - 600, now - 600)
+                for pid in ids if rng.random() < 0.05
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO interventions (patient_id, type, content, referral, manager_id, created_at)"
+            " VALUES (?, '電話', '', '營養諮詢', ?, ?)",
+            ((pid, managers[i % len(managers)], now - rng.random() * 86400) for i, pid in enumerate(ids) if rng.random() < 0.03),
+        )
+    db.bump("patients", "alerts", "interventions")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    day = date.today() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    now = datetime.fromisoformat(f"{day} 08:30").timestamp()
+
+    db = Store(":memory:")
+    managers = [f"M{i:02d}" for i in range(1, count + 1)]
+    fill(db, size, managers, now)
+    queue = AlertQueue()
+    queue.sync(db)
+
+    plan = scheduler.Scheduler()
+    t = time.perf_counter()
+    plan.refresh(db, queue, now)
+    first = time.perf_counter() - t
+    loads = plan.loads().values()
+    tasks = plan.last["tasks"]
+    overflow = sum(len(plan.agenda(m, now)["overflow"]) for m in managers)
+
+    t = time.perf_counter()
+    scheduler.Scheduler().update(managers, list(plan.tasks.values()), now)
+    replan = time.perf_counter() - t
+
+    # 處理掉 10 件警示、完成 5 件轉介、新增 5 件紅色警示
+    for alert in queue.next(10):
+        queue.set_status(alert["id"], "resolved")
+        db.set_alert_status(alert["id"], "resolved")
+    for row in db.open_referrals()[:5]:
+        db.complete_referral(row["id"])
+    for pid in [f"X{i:05d}" for i in range(5)]:
+        db.add_alert(pid, "red", "呼吸困難", 8, now=now)
+    queue.sync(db)
+    t = time.perf_counter()
+    plan.refresh(db, queue, now + 2)
+    incremental = time.perf_counter() - t
+    last = plan.last
+
+    print(f"{size:,} 位病人、{count} 位個管師，{tasks:,} 件工作（{overflow:,} 件排不進當日時段）")
+    print(f"  首次排程（含查詢）:  {first * 1000:8.1f} ms")
+    print(f"  整體重排（不含查詢）:{replan * 1000:8.1f} ms")
+    print(f"  增量重排（含查詢）:  {incremental * 1000:8.1f} ms（+{last['added']} -{last['removed']}，{'整體' if last['full'] else '增量'}）")
+    print(f"  其中排程本身:        {last['seconds'] * 1000:8.1f} ms")
+    print(f"  各個管師負荷:        {min(loads):.0f}-{max(loads):.0f} 分鐘")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+病人搜尋效能測試：索引 vs. 原本的線性掃描
+
+    python benchmarks/bench_search.py [病人數]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import PatientIndex
+
+SURNAMES = "王李陳張林黃吳劉蔡楊許鄭謝洪郭邱曾廖賴徐周葉蘇莊呂江何蕭羅高"
+GIVEN = "大小美志淑明華玲芬偉雅婷怡君家豪建宏俊傑宗翰文欣佳慧"
+SURGERIES = ["右上肺葉切除", "右中肺葉切除", "右下肺葉切除", "左上肺葉切除", "左下肺葉切除", "肺節切除", "楔狀切除"]
+
+
+def make_patients(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"P{i:06d}",
+            "name": rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(2)),
+            "phone": f"09{rng.randrange(10**8):08d}",
+            "surgery": rng.choice(SURGERIES),
+        }
+        for i in range(n)
+    ]
+
+
+def linear_scan(patients, search):
+    return [p for p in patients if not (search not in p["name"] and search not in p["id"])]
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    patients = make_patients(n)
+
+    t = time.perf_counter()
+    index = PatientIndex()
+    index.add_many(patients)
+    print(f"建立索引 {n:,} 位病人: {(time.perf_counter() - t) * 1000:.0f} ms")
+
+    t = time.perf_counter()
+    index.add({"id": "PNEW", "name": "新病人", "phone": "0900-000-000", "surgery": "肺節切除"})
+    print(f"增量新增 1 位病人: {(time.perf_counter() - t) * 1000:.3f} ms\n")
+
+    sample = patients[n // 2]
+    queries = [
+        sample["name"], sample["name"][1:], sample["name"][0],
+        sample["id"], sample["id"][:4], sample["phone"][:6], "肺節",
+    ]
+    print(f"{'查詢':<12}{'線性掃描 ms':>12}{'索引 top-20 ms':>16}")
+    for q in queries:
+        scan = timeit(lambda: linear_scan(patients, q), 5)
+        indexed = timeit(lambda: index.search(q, k=20), 20)
+        print(f"{q:<12}{scan:>12.2f}{indexed:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+冷啟動效能測試：每次以新的 Python 行程量測匯入時間與病人端首頁第一次執行時間
+
+    python benchmarks/bench_startup.py [次數]
+
+「預先載入」模擬原本在 app.py 頂端匯入 pandas / plotly.express 的情況。
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+import streamlit
+if sys.argv[2] == "eager":
+    import pandas, plotly.express
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+done = time.perf_counter()
+print(json.dumps({
+    "imports": imported - started,
+    "first_run": done - imported,
+    "total": done - started,
+    "pandas": "pandas" in sys.modules,
+    "error": bool(at.exception),
+}))
+"""
+
+
+def run_child(mode, env):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, os.path.join(ROOT, "app.py"), mode],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    tmp = tempfile.mkdtemp(prefix="aicare-startup-")
+    env = dict(
+        os.environ,
+        AICARE_DB=os.path.join(tmp, "aicare.db"),
+        AICARE_CHAT_DIR=os.path.join(tmp, "chat"),
+        AICARE_METRICS_DIR=os.path.join(tmp, "metrics"),
+        AICARE_PRELOAD="0",
+    )
+    # 第一次啟動會寫入示範數據，不列入量測
+    run_child("lazy", env)
+
+    print(f"{'模式':<10}{'匯入':>10}{'首次執行':>12}{'合計':>10}  已載入 pandas")
+    for mode, label in (("lazy", "延遲載入"), ("eager", "預先載入")):
+        results = [run_child(mode, env) for _ in range(runs)]
+        if any(r["error"] for r in results):
+            print(f"{label}: 執行錯誤")
+            continue
+        med = {k: statistics.median(r[k] for r in results) * 1000 for k in ("imports", "first_run", "total")}
+        print(f"{label:<8}{med['imports']:>8.0f}ms{med['first_run']:>10.0f}ms{med['total']:>8.0f}ms  {results[0]['pandas']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+個管師工作量效能測試：每次重跑都由全部介入紀錄重算 vs. 環狀日桶讀取
+
+    python benchmarks/bench_workload.py [介入紀錄筆數] [個管師數]
+
+紀錄平均分布在過去兩年；「SQL 彙總」為只查今日 / 昨日 / 本週的索引查詢。
+"""
+
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import workload
+from store import Store, day_number, week_number
+
+
+def fill(db, n, managers, now, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.sort(now - rng.random(n) * 730 * workload.DAY)
+    kinds = rng.choice(["電話", "LINE", "門診"], n)
+    minutes = rng.integers(1, 12, n)
+    who = rng.integers(0, len(managers), n)
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO interventions (patient_id, type, content, duration, referral, manager_id, created_at)"
+            " VALUES ('P001', ?, '', ?, ?, ?, ?)",
+            (
+                (str(k), f"{m}分鐘", "營養諮詢" if i % 10 == 0 else None, managers[w], float(t))
+                for i, (k, m, w, t) in enumerate(zip(kinds, minutes, who, times))
+            ),
+        )
+    db.bump("interventions")
+
+
+def scan(db, manager_id, now):
+    # 對照組：讀出全部紀錄，逐筆依日期分組
+    today = day_number(now)
+    counts = defaultdict(int)
+    for _, manager, _, _, _, at in db.intervention_log_after(0, 10 ** 9):
+        if manager == manager_id:
+            counts[day_number(at)] += 1
+    return counts[today], counts[today - 1], [counts[d] for d in range(week_number(today), today + 1)]
+
+
+def sql(db, manager_id, now):
+    today = day_number(now)
+    since = workload.day_start(week_number(today - 1))
+    counts = defaultdict(int)
+    for (at,) in db.query_tuples(
+        "SELECT created_at FROM interventions WHERE manager_id = ? AND created_at >= ?", (manager_id, since),
+    ):
+        counts[day_number(at)] += 1
+    return counts[today], counts[today - 1], [counts[d] for d in range(week_number(today), today + 1)]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    now = time.time()
+    db = Store(":memory:")
+    db.seed_demo(now=now)
+    managers = [f"M{i:02d}" for i in range(1, size + 1)]
+    db.add_managers([(m, m) for m in managers])
+    fill(db, n, managers, now)
+
+    stats = workload.WorkloadStats()
+    t = time.perf_counter()
+    stats.refresh(db, now)
+    first = time.perf_counter() - t
+
+    expected = scan(db, "M01", now)
+    today, yesterday = stats.today("M01", now)
+    assert (today["contacts"], yesterday["contacts"], stats.week("M01", now)) == expected
+    assert sql(db, "M01", now) == expected
+
+    print(f"{n:,} 筆介入紀錄、{size} 位個管師，載入視窗內 {stats.events:,} 筆")
+    print(f"  全部紀錄重算:      {timeit(lambda: scan(db, 'M01', now), 3):8.1f} ms")
+    print(f"  SQL 彙總:          {timeit(lambda: sql(db, 'M01', now), 20):8.2f} ms")
+    print(f"  環狀日桶首次載入:  {first * 1000:8.1f} ms")
+
+    for i in range(100):
+        db.add_intervention("P001", "電話", "", "5分鐘", manager_id=managers[i % size], now=now)
+    t = time.perf_counter()
+    stats.refresh(db, now)
+    print(f"  新增 100 筆後更新: {(time.perf_counter() - t) * 1000:8.2f} ms")
+    print(f"  讀取（今日 + 本週）:{timeit(lambda: (stats.refresh(db, now).today('M01', now), stats.week('M01', now)), 1000) * 1000:8.2f} µs")
+
+
+def timeit(fn, repeat):
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat * 1000
+
+
+if __name__ == "__main__":
+    main()
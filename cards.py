@@ -0,0 +1,408 @@
+"""
+AI-CARE Lung 卡片樣板
+HTML 卡片樣板預先編譯、依內容快取渲染結果，並可將整串卡片合併成一次 markdown 輸出
+"""
+
+import html
+import re
+import string
+from functools import lru_cache
+
+RENDER_CACHE_SIZE = 4096
+
+_SPACE_BETWEEN_TAGS = re.compile(r">\s+<")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE = re.compile(r"\s*([{}:;,])\s*")
+
+
+def _compact(text):
+    # 去掉縮排與換行：markdown 遇到空行或縮排會跳出 HTML 區塊
+    return _SPACE_BETWEEN_TAGS.sub("><", " ".join(line.strip() for line in text.strip().splitlines() if line.strip()))
+
+
+def _minify_css(css):
+    css = _CSS_COMMENT.sub("", css)
+    return _CSS_SPACE.sub(r"\1", " ".join(css.split())).replace(";}", "}")
+
+
+# ============================================
+# 手機友善 CSS（完整版）
+# ============================================
+STYLE = """
+    /* 隱藏預設元素 */
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+    header {visibility: hidden;}
+    
+    /* 手機字體 */
+    html, body {
+        font-size: 16px;
+        -webkit-text-size-adjust: 100%;
+    }
+    
+    /* 按鈕 */
+    .stButton > button {
+        width: 100%;
+        padding: 14px 20px;
+        font-size: 15px;
+        border-radius: 12px;
+        min-height: 50px;
+    }
+    
+    /* 輸入框 */
+    .stTextInput > div > div > input,
+    .stTextArea > div > div > textarea {
+        font-size: 16px;
+        padding: 14px;
+        border-radius: 12px;
+    }
+    
+    /* Tabs 樣式 */
+    .stTabs [data-baseweb="tab-list"] {
+        gap: 4px;
+        flex-wrap: wrap;
+    }
+    
+    .stTabs [data-baseweb="tab"] {
+        padding: 10px 16px;
+        font-size: 14px;
+    }
+    
+    /* 卡片 */
+    .card {
+        background: white;
+        border-radius: 16px;
+        padding: 20px;
+        margin-bottom: 16px;
+        box-shadow: 0 2px 12px rgba(0,0,0,0.08);
+    }
+    
+    .card-green {
+        background: linear-gradient(135deg, #ecfdf5, #d1fae5);
+        border: 1px solid #a7f3d0;
+    }
+    
+    .card-blue {
+        background: linear-gradient(135deg, #eff6ff, #dbeafe);
+        border: 1px solid #bfdbfe;
+    }
+    
+    .card-purple {
+        background: linear-gradient(135deg, #f5f3ff, #ede9fe);
+        border: 1px solid #c4b5fd;
+    }
+    
+    /* 警示卡片 */
+    .alert-red {
+        background: linear-gradient(135deg, #fef2f2, #fee2e2);
+        border-left: 4px solid #ef4444;
+        border-radius: 12px;
+        padding: 16px;
+        margin-bottom: 12px;
+    }
+    
+    .alert-yellow {
+        background: linear-gradient(135deg, #fffbeb, #fef3c7);
+        border-left: 4px solid #f59e0b;
+        border-radius: 12px;
+        padding: 16px;
+        margin-bottom: 12px;
+    }
+    
+    .alert-green {
+        background: linear-gradient(135deg, #f0fdf4, #dcfce7);
+        border-left: 4px solid #22c55e;
+        border-radius: 12px;
+        padding: 16px;
+        margin-bottom: 12px;
+    }
+    
+    /* 聊天氣泡 */
+    .chat-ai {
+        background: #f1f5f9;
+        border-radius: 18px 18px 18px 4px;
+        padding: 14px 18px;
+        margin: 8px 0;
+        font-size: 15px;
+        line-height: 1.6;
+    }
+    
+    .chat-user {
+        background: linear-gradient(135deg, #10b981, #059669);
+        color: white;
+        border-radius: 18px 18px 4px 18px;
+        padding: 14px 18px;
+        margin: 8px 0;
+        font-size: 15px;
+        line-height: 1.6;
+    }
+    
+    /* 統計數字 */
+    .stat-big {
+        font-size: 28px;
+        font-weight: 700;
+        line-height: 1.2;
+    }
+    
+    /* 進度條 */
+    .progress-bg {
+        background: #e2e8f0;
+        border-radius: 8px;
+        height: 10px;
+        overflow: hidden;
+        margin: 8px 0;
+    }
+    
+    .progress-fill {
+        height: 100%;
+        border-radius: 8px;
+        transition: width 0.3s ease;
+    }
+    
+    /* 病人清單項目 */
+    .patient-item {
+        background: white;
+        border-radius: 12px;
+        padding: 16px;
+        margin-bottom: 10px;
+        box-shadow: 0 2px 8px rgba(0,0,0,0.04);
+        border-left: 4px solid;
+    }
+    
+    /* 手機適配 */
+    @media (max-width: 768px) {
+        [data-testid="stSidebar"] {
+            display: none;
+        }
+        .main .block-container {
+            padding: 1rem;
+            padding-bottom: 20px;
+        }
+    }
+    
+    /* Plotly 圖表手機適配 */
+    .js-plotly-plot {
+        width: 100% !important;
+    }
+"""
+
+STYLE_HTML = f"<style>{_minify_css(STYLE)}</style>"
+
+# ============================================
+# 卡片樣板（欄位預設做 HTML 跳脫；名稱以 _html 結尾的欄位原樣插入）
+# ============================================
+TEMPLATES = {
+    "chat_ai": """
+        <div style="display: flex; gap: 10px; margin-bottom: 12px;">
+            <div style="width: 32px; height: 32px; border-radius: 50%; background: linear-gradient(135deg, #10b981, #059669); display: flex; align-items: center; justify-content: center; flex-shrink: 0; font-size: 16px;">🤖</div>
+            <div>
+                <div style="font-size: 11px; color: #64748b; margin-bottom: 4px;">健康小助手 · {time}</div>
+                <div class="chat-ai">{content_html}</div>
+            </div>
+        </div>
+    """,
+    "chat_user": """
+        <div style="display: flex; justify-content: flex-end; margin-bottom: 12px;">
+            <div style="text-align: right;">
+                <div style="font-size: 11px; color: #64748b; margin-bottom: 4px;">{time}</div>
+                <div class="chat-user">{content_html}</div>
+            </div>
+        </div>
+    """,
+    "report": """
+        <div style="background: white; border-radius: 12px; padding: 14px; margin-bottom: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.04); display: flex; justify-content: space-between; align-items: center;">
+            <div>
+                <div style="font-size: 12px; color: #64748b;">{date}</div>
+                <div style="font-weight: 500; color: #1e293b;">{symptom}</div>
+            </div>
+            <div style="background: {color}20; color: {color}; padding: 4px 12px; border-radius: 8px; font-weight: 600;">
+                {score}分
+            </div>
+        </div>
+    """,
+    "education": """
+        <div style="background: white; border-radius: 14px; padding: 16px; margin-bottom: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.05); display: flex; align-items: center; gap: 14px;">
+            <div style="font-size: 32px;">{icon}</div>
+            <div style="flex: 1;">
+                <div style="display: flex; align-items: center; gap: 8px; margin-bottom: 4px;">
+                    <span style="font-weight: 600; color: #1e293b;">{title}</span>
+                    <span style="background: {tag_color}15; color: {tag_color}; padding: 2px 8px; border-radius: 6px; font-size: 11px;">{tag}</span>
+                </div>
+                <div style="font-size: 13px; color: #64748b;">{desc}</div>
+            </div>
+            <div style="color: #94a3b8;">▶</div>
+        </div>
+    """,
+    "workbench": """
+        <div style="background: linear-gradient(135deg, #3b82f6, #2563eb); border-radius: 20px; padding: 20px; color: white; margin-bottom: 20px;">
+            <h3 style="margin: 0 0 16px 0; font-size: 18px;">👩‍⚕️ 今日工作台</h3>
+            <div style="display: flex; justify-content: space-around; text-align: center;">
+                <div>
+                    <div style="font-size: 28px; font-weight: 700;">{red}</div>
+                    <div style="font-size: 12px; opacity: 0.9;">🔴 紅色</div>
+                </div>
+                <div>
+                    <div style="font-size: 28px; font-weight: 700;">{yellow}</div>
+                    <div style="font-size: 12px; opacity: 0.9;">🟡 黃色</div>
+                </div>
+                <div>
+                    <div style="font-size: 28px; font-weight: 700;">{overdue}</div>
+                    <div style="font-size: 12px; opacity: 0.9;">⏰ 逾期</div>
+                </div>
+                <div>
+                    <div style="font-size: 28px; font-weight: 700;">{normal}</div>
+                    <div style="font-size: 12px; opacity: 0.9;">✅ 正常</div>
+                </div>
+            </div>
+        </div>
+    """,
+    "alert": """
+        <div class="alert-{level}">
+            <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+                <div style="display: flex; align-items: center; gap: 10px;">
+                    <div style="width: 40px; height: 40px; border-radius: 10px; background: {badge}; color: white; display: flex; align-items: center; justify-content: center; font-weight: 700; font-size: 16px;">{score}</div>
+                    <div>
+                        <div style="font-weight: 600; color: {color};">{patient}</div>
+                        <div style="font-size: 12px; color: #64748b;">{symptom}</div>
+                    </div>
+                </div>
+                <div style="text-align: right;">
+                    <div style="font-size: 11px; color: #64748b;">{ago}</div>
+                    <div style="font-size: 11px; color: {color};">{status} · {deadline}</div>
+                </div>
+            </div>
+            <div style="font-size: 12px; color: #64748b;">📱 {phone}</div>
+        </div>
+    """,
+    "record": """
+        <div style="background: white; border-radius: 12px; padding: 14px; margin-bottom: 10px; box-shadow: 0 2px 8px rgba(0,0,0,0.04);">
+            <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+                <div>
+                    <span style="font-weight: 600;">{patient}</span>
+                    <span style="background: #e0f2fe; color: #0369a1; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">{type}</span>
+                    <span style="background: #f1f5f9; color: #64748b; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">{duration}</span>
+                    {referral_html}
+                </div>
+                <span style="font-size: 11px; color: #94a3b8;">{when}</span>
+            </div>
+            <p style="margin: 0; font-size: 13px; color: #475569; line-height: 1.5;">{content}</p>
+        </div>
+    """,
+    "referral_tag": """
+        <span style="background: #fce7f3; color: #be185d; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">→{referral}</span>
+    """,
+    "schedule": """
+        <div style="background: {bg}; border: 1px solid {border}; border-radius: 12px; padding: 14px; margin-bottom: 10px;">
+            <div style="display: flex; align-items: center; gap: 12px;">
+                <span style="font-size: 20px;">{icon}</span>
+                <div>
+                    <div style="font-size: 12px; color: #64748b;">{time}</div>
+                    <div style="font-weight: 500; color: #1e293b;">{task}</div>
+                    {detail_html}
+                </div>
+            </div>
+        </div>
+    """,
+    "task": """
+        <div style="background: white; border-left: 4px solid {color}; border-radius: 10px; padding: 10px 14px; margin-bottom: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.04);">
+            <div style="display: flex; justify-content: space-between; align-items: center;">
+                <div>
+                    <span style="font-weight: 600;">{patient}</span>
+                    <span style="background: #f1f5f9; color: #64748b; padding: 2px 6px; border-radius: 4px; font-size: 10px; margin-left: 4px;">{group}</span>
+                    <div style="font-size: 12px; color: #64748b; margin-top: 2px;">{detail}</div>
+                </div>
+                <div style="text-align: right; font-size: 11px;">
+                    <div style="color: #64748b;">預計 {eta}</div>
+                    <div style="color: {color};">{deadline}</div>
+                </div>
+            </div>
+        </div>
+    """,
+    "schedule_detail": """
+        <div style="font-size: 12px; color: #64748b; margin-top: 2px;">{detail}</div>
+    """,
+    "progress": """
+        <div style="margin-bottom: {margin}px;">
+            <div style="display: flex; justify-content: space-between; margin-bottom: 6px;">
+                <span style="font-size: 13px; color: #1e293b;">{label}</span>
+                <span style="font-size: 13px; font-weight: 600; color: {color};">{value}</span>
+            </div>
+            <div class="progress-bg">
+                <div class="progress-fill" style="width: {pct}%; background: {color};"></div>
+            </div>
+        </div>
+    """,
+    "cert": """
+        <div style="margin-bottom: 12px;">
+            <div style="display: flex; justify-content: space-between; margin-bottom: 4px;">
+                <span>{label}</span>
+                <span style="font-weight: 600;">{done}/{total}</span>
+            </div>
+            <div class="progress-bg">
+                <div class="progress-fill" style="width: {pct}%; background: #8b5cf6;"></div>
+            </div>
+        </div>
+    """,
+    "quality": """
+        <div style="background: white; border-radius: 14px; padding: 16px; margin-bottom: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.05);">
+            <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 8px;">
+                <div>
+                    <span style="background: #f5f3ff; color: #7c3aed; padding: 2px 8px; border-radius: 4px; font-size: 10px;">指標{indicator}</span>
+                    <span style="font-weight: 600; color: #1e293b; margin-left: 8px;">{name}</span>
+                </div>
+                <span style="background: {color}20; color: {color}; padding: 4px 10px; border-radius: 6px; font-size: 12px; font-weight: 600;">{trend}</span>
+            </div>
+            <div style="display: flex; align-items: baseline; gap: 8px;">
+                <span style="font-size: 28px; font-weight: 700; color: #1e293b;">{current}%</span>
+                <span style="font-size: 13px; color: #64748b;">目標 {target}%</span>
+            </div>
+        </div>
+    """,
+    "factor": """
+        <div style="display: flex; justify-content: space-between; align-items: center; padding: 12px 14px; background: {bg}; border-radius: 10px; margin-bottom: 8px;">
+            <span style="font-size: 13px; color: #1e293b;">{factor}</span>
+            <span style="font-weight: 600; color: {color};">{impact}</span>
+        </div>
+    """,
+}
+
+
+def _compile(template):
+    # 預先切成 (字面文字, 欄位, 格式) 片段，渲染時只需串接
+    parts = []
+    for literal, field, spec, _ in string.Formatter().parse(_compact(template)):
+        parts.append((literal, field, spec or "", bool(field) and field.endswith("_html")))
+    return tuple(parts)
+
+
+COMPILED = {name: _compile(t) for name, t in TEMPLATES.items()}
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(name, items):
+    fields = dict(items)
+    out = []
+    for literal, field, spec, raw in COMPILED[name]:
+        out.append(literal)
+        if field:
+            value = format(fields[field], spec)
+            out.append(value if raw else html.escape(value))
+    return "".join(out)
+
+
+def render(template, /, **fields):
+    # 以 (樣板, 欄位內容) 為鍵快取；相同內容的卡片只組一次字串
+    return _render(template, tuple(fields.items()))
+
+
+def render_many(template, rows):
+    return "".join(_render(template, tuple(row.items())) for row in rows)
+
+
+def text_html(text):
+    # 使用者文字：跳脫後保留換行
+    return html.escape(text).replace("\n", "<br>")
+
+
+def cache_info():
+    return _render.cache_info()
@@ -0,0 +1,91 @@
+"""
+AI-CARE Lung 對話紀錄
+記憶體只保留最近訊息（環形緩衝），完整紀錄寫入每位病人的 JSONL 檔，較早訊息分頁讀回
+"""
+
+import json
+import os
+import threading
+from array import array
+from collections import deque
+
+DEFAULT_CAPACITY = 20
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _file_lock(path):
+    with _file_locks_guard:
+        return _file_locks.setdefault(path, threading.Lock())
+
+
+class ChatHistory:
+    __slots__ = ("path", "recent_messages", "boundary", "offsets", "scanned")
+
+    def __init__(self, patient_id, directory, capacity=DEFAULT_CAPACITY):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{patient_id}.jsonl")
+        # (role, content, time, 該行結束的檔案位移)；未寫入檔案的訊息為 None
+        self.recent_messages = deque(maxlen=capacity)
+        # 本 session 開始時的檔案大小；此位置之前皆為「較早訊息」
+        self.boundary = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.offsets = array("q")
+        self.scanned = 0
+
+    def __len__(self):
+        return len(self.recent_messages)
+
+    def append(self, role, content, time, persist=True):
+        end = None
+        if persist:
+            line = json.dumps({"role": role, "content": content, "time": time}, ensure_ascii=False) + "\n"
+            with _file_lock(self.path), open(self.path, "ab") as f:
+                f.write(line.encode("utf-8"))
+                end = f.tell()
+        if len(self.recent_messages) == self.recent_messages.maxlen:
+            evicted = self.recent_messages[0][3]
+            if evicted is not None:
+                # 被擠出記憶體的訊息之後改由檔案分頁讀回
+                self.boundary = max(self.boundary, evicted)
+        self.recent_messages.append((role, content, time, end))
+
+    def recent(self, n):
+        return [
+            {"role": role, "content": content, "time": time}
+            for role, content, time, _ in list(self.recent_messages)[-n:]
+        ]
+
+    # ---------- 較早訊息 ----------
+    def _scan(self):
+        # 增量建立行位移索引，只掃描上次之後新增的部分
+        if self.scanned >= self.boundary:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.scanned)
+            pos = self.scanned
+            while pos < self.boundary:
+                line = f.readline()
+                if not line:
+                    break
+                self.offsets.append(pos)
+                pos += len(line)
+            self.scanned = pos
+
+    def earlier_count(self):
+        self._scan()
+        return len(self.offsets)
+
+    def earlier(self, page, page_size=20):
+        # page 0 為最接近目前對話的一頁；回傳依時間由舊到新
+        self._scan()
+        end = len(self.offsets) - page * page_size
+        start = max(0, end - page_size)
+        if end <= 0:
+            return []
+        messages = []
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[start])
+            for _ in range(end - start):
+                messages.append(json.loads(f.readline()))
+        return messages
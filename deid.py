@@ -0,0 +1,106 @@
+"""
+AI-CARE Lung 去識別化
+以欄為單位處理 pandas DataFrame：HMAC 假名化、直接識別資料移除、依個案一致的日期平移、年齡分組
+雜湊只對每個不重複值計算一次，再以 factorize 的代碼展開回整欄
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+
+import numpy as np
+
+PSEUDONYM_PREFIX = "S"
+PSEUDONYM_LENGTH = 12
+MAX_SHIFT_DAYS = 180
+AGE_BAND_WIDTH = 5
+# 90 歲以上合併為一組（HIPAA Safe Harbor）
+AGE_TOP_CODE = 90
+
+DIRECT_IDENTIFIERS = ("name", "phone")
+
+
+def load_key(path, env="AICARE_DEID_KEY"):
+    # 金鑰優先取環境變數；否則讀取金鑰檔，不存在時產生一把並只允許擁有者讀寫
+    value = os.environ.get(env)
+    if value:
+        return value.encode("utf-8")
+    if not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip().encode("utf-8")
+
+
+def _digest(key, purpose, value):
+    return hmac.new(key, f"{purpose}:{value}".encode("utf-8"), hashlib.sha256).digest()
+
+
+def _map_unique(series, fn):
+    # fn 只作用於不重複值；缺值維持 None
+    import pandas as pd
+
+    codes, uniques = pd.factorize(series)
+    mapped = np.array([fn(v) for v in uniques] + [None], dtype=object)
+    # 代碼 -1（缺值）對到最後一格的 None
+    return pd.Series(mapped[codes], index=series.index)
+
+
+def pseudonym(key, value):
+    return PSEUDONYM_PREFIX + _digest(key, "id", value).hex()[:PSEUDONYM_LENGTH]
+
+
+def pseudonymize(series, key):
+    return _map_unique(series, lambda v: pseudonym(key, v))
+
+
+def shift_days(key, patient_id, max_days=MAX_SHIFT_DAYS):
+    # 每位個案固定的非零位移，落在 ±[1, max_days] 天
+    h = int.from_bytes(_digest(key, "shift", patient_id)[:8], "big")
+    days = 1 + (h >> 1) % max_days
+    return days if h & 1 else -days
+
+
+def shift_dates(frame, columns, id_column, key, max_days=MAX_SHIFT_DAYS):
+    # 同一個案的所有日期平移相同天數，保留個案內的時間間隔；支援 epoch 秒數或 datetime64 欄位
+    import pandas as pd
+
+    codes, uniques = pd.factorize(frame[id_column])
+    offsets = np.array([shift_days(key, v, max_days) for v in uniques] + [0], dtype=np.int64)[codes]
+    for column in columns:
+        values = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            frame[column] = values + pd.to_timedelta(offsets, unit="D")
+        else:
+            frame[column] = values + offsets * 86400
+    return frame
+
+
+def age_band(series, width=AGE_BAND_WIDTH, top=AGE_TOP_CODE):
+    import pandas as pd
+
+    ages = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+    low = np.minimum(np.floor(ages / width) * width, top)
+    labels = _map_unique(
+        pd.Series(low, index=series.index),
+        lambda lo: f"{int(lo)}+" if lo >= top else f"{int(lo)}-{int(lo) + width - 1}",
+    )
+    return labels
+
+
+def deidentify(frame, key, id_column="patient_id", pseudonyms=("patient_id",), suppress=DIRECT_IDENTIFIERS,
+               dates=(), ages=("age",), max_shift_days=MAX_SHIFT_DAYS, band_width=AGE_BAND_WIDTH):
+    # 回傳新的 DataFrame；日期平移要用原始 id，須在假名化之前做
+    frame = frame.drop(columns=[c for c in suppress if c in frame.columns])
+    dates = [c for c in dates if c in frame.columns]
+    if dates:
+        shift_dates(frame, dates, id_column, key, max_shift_days)
+    for column in ages:
+        if column in frame.columns:
+            frame[column] = age_band(frame[column], band_width)
+    for column in pseudonyms:
+        if column in frame.columns:
+            frame[column] = pseudonymize(frame[column], key)
+    return frame
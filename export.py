@@ -0,0 +1,421 @@
+"""
+AI-CARE Lung 研究數據匯出
+依 id 分批從資料庫讀出症狀回報，逐批寫入 CSV / Parquet / Excel / SPSS，記憶體用量與總筆數無關；匯出在背景執行緒進行
+"""
+
+import csv
+import hashlib
+import importlib.util
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+CHUNK_ROWS = 20000
+# 「僅完成追蹤者」：出院後 12 個月追蹤期已結束（analytics.WINDOWS 最後一個時段），或已記錄完成治療
+FOLLOW_UP_DAYS = 365
+# Excel 單一工作表上限 1,048,576 列（含標題列），超過時換到下一張工作表
+XLSX_SHEET_ROWS = 1048575
+# pyreadstat 只能一次寫入整個 DataFrame，無法分批；超過上限請改用 Parquet
+SAV_MAX_ROWS = 1000000
+MAX_JOBS = 20
+
+# (欄位, 標籤, 型別, 是否為直接識別資料)；順序與 Store.report_rows_after 的查詢欄位一致
+REPORT_COLUMNS = [
+    ("report_id", "回報編號", "integer", False),
+    ("patient_id", "個案編號", "string", False),
+    ("name", "姓名", "string", True),
+    ("phone", "電話", "string", True),
+    ("age", "年齡", "integer", False),
+    ("surgery", "術式", "string", False),
+    ("post_op_day", "術後天數", "integer", False),
+    ("symptom", "症狀", "string", False),
+    ("score", "嚴重度 (0-10)", "integer", False),
+    ("reported_at", "回報時間", "datetime", False),
+]
+
+# 去識別化後的欄位：移除姓名電話、個案編號假名化、年齡分組、日期依個案平移
+DEID_COLUMNS = [
+    ("report_id", "回報編號", "integer", False),
+    ("patient_id", "研究編號（HMAC 假名）", "string", False),
+    ("age_band", "年齡組距", "string", False),
+    ("surgery", "術式", "string", False),
+    ("post_op_day", "術後天數", "integer", False),
+    ("symptom", "症狀", "string", False),
+    ("score", "嚴重度 (0-10)", "integer", False),
+    ("reported_at", "回報時間（已平移）", "datetime", False),
+]
+
+AUDIT_COLUMNS = [
+    ("audit_id", "稽核編號", "integer", False),
+    ("at", "時間", "datetime", False),
+    ("actor", "操作者", "string", False),
+    ("action", "動作", "string", False),
+    ("target", "對象", "string", False),
+    ("detail", "內容", "string", False),
+]
+
+
+def format_datetime(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts is not None else None
+
+
+def _text_rows(columns, rows):
+    # CSV / Excel：時間欄位轉成本地時間字串
+    stamps = [i for i, col in enumerate(columns) if col[2] == "datetime"]
+    if not stamps:
+        return rows
+    out = []
+    for row in rows:
+        row = list(row)
+        for i in stamps:
+            row[i] = format_datetime(row[i])
+        out.append(row)
+    return out
+
+
+# ============================================
+# 各格式寫出器：write(rows) 逐批寫入，close() 收尾
+# ============================================
+class CsvWriter:
+    def __init__(self, path, columns):
+        self.columns = columns
+        # utf-8-sig 讓 Excel 直接開啟時中文不會變亂碼
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([col[0] for col in columns])
+
+    def write(self, rows):
+        self.writer.writerows(_text_rows(self.columns, rows))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    # 每批寫成一個 row group
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.columns = columns
+        self.schema = pa.schema([
+            pa.field(
+                name,
+                pa.timestamp("ms", tz="UTC") if kind == "datetime" else pa.int64() if kind == "integer" else pa.string(),
+                metadata={"label": label},
+            )
+            for name, label, kind, _ in columns
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        arrays = []
+        for i, (field, col) in enumerate(zip(self.schema, self.columns)):
+            values = [row[i] for row in rows]
+            if col[2] == "datetime":
+                values = [round(v * 1000) if v is not None else None for v in values]
+            arrays.append(self.pa.array(values, type=field.type))
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class XlsxWriter:
+    def __init__(self, path, columns):
+        import xlsxwriter
+
+        self.columns = columns
+        # constant_memory：每列寫完即輸出到暫存檔，不在記憶體保留整張表
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_numbers": False})
+        self.sheet = None
+        self.row = 0
+        self.sheets = 0
+
+    def _next_sheet(self):
+        self.sheets += 1
+        self.sheet = self.workbook.add_worksheet(f"data{self.sheets}" if self.sheets > 1 else "data")
+        self.sheet.write_row(0, 0, [col[0] for col in self.columns])
+        self.row = 1
+
+    def write(self, rows):
+        for row in _text_rows(self.columns, rows):
+            if self.sheet is None or self.row > XLSX_SHEET_ROWS:
+                self._next_sheet()
+            self.sheet.write_row(self.row, 0, row)
+            self.row += 1
+
+    def close(self):
+        if self.sheet is None:
+            self._next_sheet()
+        self.workbook.close()
+
+
+class SavWriter:
+    # pyreadstat 不支援附加寫入，只能累積後一次寫出，以 SAV_MAX_ROWS 限制記憶體用量
+    def __init__(self, path, columns):
+        import pyreadstat
+
+        self.pyreadstat = pyreadstat
+        self.path = path
+        self.columns = columns
+        self.data = [[] for _ in columns]
+
+    def write(self, rows):
+        if len(self.data[0]) + len(rows) > SAV_MAX_ROWS:
+            raise ValueError(f"SPSS 匯出上限為 {SAV_MAX_ROWS:,} 筆，請改用 Parquet 或 CSV")
+        for values, column in zip(self.data, zip(*rows)):
+            values.extend(column)
+
+    def close(self):
+        import pandas as pd
+
+        frame = pd.DataFrame({col[0]: values for col, values in zip(self.columns, self.data)})
+        for name, _, kind, _ in self.columns:
+            if kind == "datetime":
+                frame[name] = pd.to_datetime(frame[name], unit="s")
+        self.pyreadstat.write_sav(frame, self.path, column_labels=[col[1] for col in self.columns])
+
+
+FORMATS = {
+    "csv": {"label": "📄 CSV", "ext": ".csv", "writer": CsvWriter, "module": None},
+    "parquet": {"label": "📈 Parquet（R / Python）", "ext": ".parquet", "writer": ParquetWriter, "module": "pyarrow"},
+    "xlsx": {"label": "📗 Excel", "ext": ".xlsx", "writer": XlsxWriter, "module": "xlsxwriter"},
+    "sav": {"label": "📊 SPSS", "ext": ".sav", "writer": SavWriter, "module": "pyreadstat"},
+}
+
+
+def available_formats():
+    return [key for key, fmt in FORMATS.items() if fmt["module"] is None or importlib.util.find_spec(fmt["module"])]
+
+
+# ============================================
+# 匯出流程
+# ============================================
+class ExportCancelled(Exception):
+    pass
+
+
+def report_columns(deidentify=True):
+    return DEID_COLUMNS if deidentify else REPORT_COLUMNS
+
+
+def deidentifier(key):
+    # 每批轉成 DataFrame 以欄為單位去識別化，再轉回 tuple 列
+    import pandas as pd
+
+    import deid
+
+    names = [col[0] for col in REPORT_COLUMNS]
+    output = [col[0] for col in DEID_COLUMNS]
+
+    def transform(rows):
+        frame = pd.DataFrame.from_records(rows, columns=names)
+        frame = deid.deidentify(frame, key, dates=("reported_at",)).rename(columns={"age": "age_band"})
+        return list(zip(*(frame[name].to_numpy(dtype=object, na_value=None) for name in output)))
+
+    return transform
+
+
+def _stream(fetch, writer, transform=None, progress=None, cancelled=None, chunk_rows=CHUNK_ROWS):
+    # fetch(last_id, limit) 回傳以 id 排序的 tuple 列（第一欄為 id）；transform 在寫出前轉換每一批
+    last_id, written = 0, 0
+    while True:
+        if cancelled is not None and cancelled():
+            raise ExportCancelled()
+        rows = fetch(last_id, chunk_rows)
+        if not rows:
+            return written
+        last_id = rows[-1][0]
+        writer.write(transform(rows) if transform is not None else rows)
+        written += len(rows)
+        if progress is not None:
+            progress(len(rows))
+
+
+def completed_cutoff(completed_only, now=None):
+    # 出院時間不晚於此時間者已完成追蹤；None 表示不篩選
+    return (now or time.time()) - FOLLOW_UP_DAYS * 86400 if completed_only else None
+
+
+def write_dictionary(path, columns, completed_only=False):
+    import deid
+
+    notes = {
+        "score": "0 = 無症狀，10 = 最嚴重",
+        "age_band": f"每 {deid.AGE_BAND_WIDTH} 歲一組，{deid.AGE_TOP_CODE} 歲以上合併",
+    }
+    if columns is DEID_COLUMNS:
+        notes["patient_id"] = "HMAC-SHA256 假名，同一金鑰下同一個案編號固定"
+        notes["reported_at"] = f"依個案平移 ±1-{deid.MAX_SHIFT_DAYS} 天，個案內時間間隔不變"
+    if completed_only:
+        notes["patient_id"] = "；".join(filter(None, [
+            notes.get("patient_id"), f"僅包含出院滿 {FOLLOW_UP_DAYS} 天或已完成治療的個案",
+        ]))
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["variable", "label", "type", "note"])
+        for name, label, kind, _ in columns:
+            note = notes.get(name, "")
+            if kind == "datetime":
+                note = "；".join(filter(None, [note, "本地時間 YYYY-MM-DD HH:MM:SS（Parquet 為 UTC 時間戳）"]))
+            writer.writerow([name, label, kind, note])
+
+
+def run_export(db, path, fmt="csv", deidentify=True, completed_only=False, dictionary=False, audit=False,
+               deid_key=None, progress=None, cancelled=None, chunk_rows=CHUNK_ROWS):
+    # 只有數據檔時直接寫出；含數據字典或稽核軌跡時打包成 zip。先寫暫存檔，完成後才改名
+    if deidentify and not deid_key:
+        raise ValueError("去識別化需要金鑰（deid_key）")
+    spec = FORMATS[fmt]
+    columns = report_columns(deidentify)
+    transform = deidentifier(deid_key) if deidentify else None
+    cutoff = completed_cutoff(completed_only)
+    fetch = lambda last_id, limit: db.report_rows_after(last_id, limit, completed_before=cutoff)
+    bundle = dictionary or audit
+    parts = [(path + ".part" + spec["ext"], "reports" + spec["ext"])]
+    try:
+        writer = spec["writer"](parts[0][0], columns)
+        try:
+            rows = _stream(fetch, writer, transform, progress, cancelled, chunk_rows)
+        finally:
+            writer.close()
+        if not bundle:
+            os.replace(parts[0][0], path)
+            return rows
+
+        if dictionary:
+            parts.append((path + ".part.dictionary.csv", "data_dictionary.csv"))
+            write_dictionary(parts[-1][0], columns, completed_only)
+        if audit:
+            parts.append((path + ".part.audit.csv", "audit_trail.csv"))
+            audit_writer = CsvWriter(parts[-1][0], AUDIT_COLUMNS)
+            try:
+                _stream(db.audit_rows_after, audit_writer, None, None, cancelled, chunk_rows)
+            finally:
+                audit_writer.close()
+        # ZipFile.write 分段讀檔壓縮，不會整個載入記憶體
+        with zipfile.ZipFile(path + ".part", "w", zipfile.ZIP_DEFLATED) as zf:
+            for part, name in parts:
+                zf.write(part, name)
+        os.replace(path + ".part", path)
+        return rows
+    finally:
+        for part in [p for p, _ in parts] + [path + ".part"]:
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ============================================
+# 背景匯出工作
+# ============================================
+class ExportJob:
+    def __init__(self, fmt, options, actor):
+        self.id = uuid.uuid4().hex[:12]
+        self.format = fmt
+        self.options = options
+        self.actor = actor
+        self.status = "queued"  # queued / running / done / failed / cancelled
+        self.total = 0
+        self.rows = 0
+        self.path = None
+        self.file_name = None
+        self.size = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def progress(self):
+        if self.status == "done":
+            return 1.0
+        return min(self.rows / self.total, 1.0) if self.total else 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class ExportManager:
+    def __init__(self, db, out_dir, deid_key=None, workers=1, max_jobs=MAX_JOBS):
+        self.db = db
+        self.out_dir = out_dir
+        self.deid_key = deid_key
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self.seq = itertools.count(1)
+
+    def submit(self, fmt, actor="研究人員", **options):
+        if fmt not in available_formats():
+            raise ValueError(f"未安裝 {FORMATS[fmt]['module']}，無法匯出 {FORMATS[fmt]['label']}")
+        job = ExportJob(fmt, options, actor)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._evict()
+        self.pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _evict(self):
+        # 只保留最近 max_jobs 筆已結束的工作，並刪除其檔案
+        finished = [job for job in self.jobs.values() if not job.active]
+        for job in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job.id]
+            if job.path and os.path.exists(job.path):
+                os.remove(job.path)
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            return
+        job.status = "running"
+        options = job.options
+        stamp = datetime.fromtimestamp(job.created_at).strftime("%Y%m%d_%H%M%S")
+        ext = ".zip" if options.get("dictionary") or options.get("audit") else FORMATS[job.format]["ext"]
+        job.file_name = f"aicare_reports_{stamp}_{next(self.seq)}{ext}"
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, job.file_name)
+        try:
+            job.total = self.db.count_report_rows(completed_cutoff(options.get("completed_only")))
+
+            def progress(n):
+                job.rows += n
+
+            rows = run_export(self.db, path, job.format, deid_key=self.deid_key, progress=progress, cancelled=job.cancel_event.is_set, **options)
+            job.path, job.size = path, os.path.getsize(path)
+            self.db.add_audit(job.actor, "export", job.file_name, json.dumps(
+                {"format": job.format, "rows": rows, "options": options, "sha256": file_sha256(path)},
+                ensure_ascii=False,
+            ))
+            job.status = "done"
+        except ExportCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished_at = time.time()
@@ -0,0 +1,171 @@
+"""
+AI-CARE Lung 順從度影響因子
+以 NumPy 牛頓法配適羅吉斯迴歸（結果：已到期時段完成率 ≥ 80%），各因子以平均邊際效果（百分點）呈現，
+bootstrap 信賴區間分批交給行程池平行計算；同一份世代資料的結果會快取
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# (欄位, 標籤)；設計矩陣中的順序
+FACTORS = [
+    ("age65", "年齡 ≥65 歲"),
+    ("college", "大學以上學歷"),
+    ("caregiver", "有主要照顧者"),
+    ("smartphone3", "智慧型手機經驗 ≥3年"),
+    ("gad7_10", "基線焦慮 (GAD-7≥10)"),
+]
+# 組別作為調整變項，以 AI-ePRO 為參考組
+ADJUST_ARMS = ["傳統ePRO", "常規照護"]
+COMPLIANT_RATE = 0.8
+REPLICATES = 1000
+CONFIDENCE = 0.95
+MIN_PATIENTS = 30
+MAX_ITER = 25
+TOL = 1e-8
+# 微量 ridge，避免完全分離時牛頓法發散
+RIDGE = 1e-6
+
+
+# ============================================
+# 資料與模型
+# ============================================
+def cohort_matrix(baseline, patient_ids, rates):
+    # baseline: Store.cohort_baseline()；patient_ids / rates: ComplianceModel.patient_rates()
+    rate_of = dict(zip(patient_ids, rates))
+    rows, y = [], []
+    for pid, arm, age, college, caregiver, smartphone_years, gad7 in baseline:
+        rate = rate_of.get(pid)
+        if rate is None or np.isnan(rate) or None in (age, college, caregiver, smartphone_years, gad7):
+            continue
+        rows.append([
+            1.0, age >= 65, college, caregiver, smartphone_years >= 3, gad7 >= 10,
+            *(arm == a for a in ADJUST_ARMS),
+        ])
+        y.append(rate >= COMPLIANT_RATE)
+    X = np.array(rows, dtype=float).reshape(-1, 1 + len(FACTORS) + len(ADJUST_ARMS))
+    return X, np.array(y, dtype=float)
+
+
+def fit_logistic(X, y, weights=None, start=None, max_iter=MAX_ITER, tol=TOL, ridge=RIDGE):
+    # 迭代加權最小平方法（牛頓法）；weights 為每列的重複次數（bootstrap），回傳係數，失敗時回傳 None
+    beta = np.zeros(X.shape[1]) if start is None else start.copy()
+    weights = np.ones(len(y)) if weights is None else weights
+    penalty = ridge * np.eye(X.shape[1])
+    for _ in range(max_iter):
+        p = 1 / (1 + np.exp(-(X @ beta)))
+        w = weights * p * (1 - p)
+        try:
+            step = np.linalg.solve((X.T * w) @ X + penalty, X.T @ (weights * (y - p)) - penalty @ beta)
+        except np.linalg.LinAlgError:
+            return None
+        beta += step
+        if np.abs(step).max() < tol:
+            return beta
+    return beta if np.all(np.isfinite(beta)) else None
+
+
+def marginal_effects(X, beta, weights=None):
+    # 各二元因子的平均邊際效果：全部設為 1 與全部設為 0 的預測機率差平均（百分點）
+    cols = np.arange(1, 1 + len(FACTORS))
+    eta = X @ beta
+    eta1 = eta[:, None] + beta[cols] * (1 - X[:, cols])
+    eta0 = eta[:, None] - beta[cols] * X[:, cols]
+    return np.average(1 / (1 + np.exp(-eta1)) - 1 / (1 + np.exp(-eta0)), axis=0, weights=weights) * 100
+
+
+def bootstrap_chunk(X, y, replicates, seed, start=None):
+    # 行程池工作單位：回傳 (replicates, 因子數) 的邊際效果，配適失敗的列為 nan
+    # 重抽樣以每列被抽中的次數當權重，不複製資料；以全樣本係數為起點，通常 3-4 步收斂
+    rng = np.random.default_rng(seed)
+    n = len(y)
+    out = np.full((replicates, len(FACTORS)), np.nan)
+    for i in range(replicates):
+        counts = np.bincount(rng.integers(0, n, n), minlength=n).astype(float)
+        beta = fit_logistic(X, y, counts, start)
+        if beta is not None:
+            out[i] = marginal_effects(X, beta, counts)
+    return out
+
+
+def signature(X, y, replicates=REPLICATES):
+    digest = hashlib.sha1(X.tobytes())
+    digest.update(y.tobytes())
+    digest.update(str(replicates).encode())
+    return digest.hexdigest()
+
+
+# ============================================
+# 估計（跨 session 共用，依世代資料快取）
+# ============================================
+class FactorEstimator:
+    def __init__(self, workers=None, replicates=REPLICATES, seed=0):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.replicates = replicates
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.executor = None
+        self.results = {}
+        self.latest = None
+
+    def _pool(self):
+        # spawn：Streamlit 行程內有多條執行緒，fork 不安全
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def result(self, X, y):
+        return self.results.get(signature(X, y, self.replicates))
+
+    def estimate(self, X, y):
+        key = signature(X, y, self.replicates)
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+            started = time.perf_counter()
+            if len(y) < MIN_PATIENTS or y.min() == y.max():
+                return None
+            beta = fit_logistic(X, y)
+            if beta is None:
+                return None
+            point = marginal_effects(X, beta)
+            draws = self._bootstrap(X, y, beta)
+            alpha = (1 - CONFIDENCE) / 2 * 100
+            low, high = np.nanpercentile(draws, [alpha, 100 - alpha], axis=0)
+            result = {
+                "factors": [
+                    {"key": key_, "label": label, "effect": float(point[j]), "low": float(low[j]), "high": float(high[j]),
+                     "odds_ratio": float(np.exp(beta[1 + j]))}
+                    for j, (key_, label) in enumerate(FACTORS)
+                ],
+                "n": len(y),
+                "events": int(y.sum()),
+                "replicates": int(np.isfinite(draws[:, 0]).sum()),
+                "workers": self.workers,
+                "seconds": time.perf_counter() - started,
+                "computed_at": time.time(),
+            }
+            # 世代一變舊結果就用不到，只留最新一份
+            self.results = {key: result}
+            self.latest = result
+            return result
+
+    def _bootstrap(self, X, y, start):
+        seeds = np.random.SeedSequence(self.seed).spawn(self.workers)
+        sizes = [len(part) for part in np.array_split(np.arange(self.replicates), self.workers)]
+        if self.workers == 1:
+            return bootstrap_chunk(X, y, sizes[0], seeds[0], start)
+        pool = self._pool()
+        futures = [pool.submit(bootstrap_chunk, X, y, size, seed, start) for size, seed in zip(sizes, seeds)]
+        return np.vstack([f.result() for f in futures])
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
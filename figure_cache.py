@@ -0,0 +1,88 @@
+"""
+AI-CARE Lung 圖表快取
+以「資料版本 + 版面參數」為鍵快取 plotly 圖表，依 Figure 物件佔用的記憶體做 LRU 淘汰；
+快取省下的是建圖時間，st.plotly_chart 每次仍會驗證並序列化 Figure
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import deep_sizeof
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+
+def figure_key(name, version, **layout):
+    # version 為資料版本（Store.version 或任何可 repr 的值），layout 為影響圖表外觀的參數
+    raw = json.dumps([name, repr(version), sorted(layout.items())], ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class FigureCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # key -> (估計大小, Figure)；只保留 Figure：Streamlit 驗證 Figure 物件遠比驗證 JSON / dict 快
+        self.items = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.build_seconds = 0.0
+
+    @property
+    def nbytes(self):
+        # 供 session 量測使用：放入時已量過各 Figure 的深層大小，不必每次重新走訪
+        return self.bytes
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, fig):
+        size = deep_sizeof(fig)
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[0]
+            self.items[key] = (size, fig)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self.items) > 1:
+                _, (evicted, _) = self.items.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+        return fig
+
+    def figure(self, key, build):
+        fig = self.get(key)
+        if fig is not None:
+            return fig
+        started = time.perf_counter()
+        fig = build()
+        if fig is None:
+            return None
+        with self.lock:
+            self.misses += 1
+            self.build_seconds += time.perf_counter() - started
+        return self.put(key, fig)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.items),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "avg_build_ms": self.build_seconds / self.misses * 1000 if self.misses else 0.0,
+            }
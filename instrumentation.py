@@ -0,0 +1,214 @@
+"""
+AI-CARE Lung 執行期量測
+每次執行後量測各 session 的 st.session_state 深層大小與腳本執行時間，維護分位數並輸出 JSON / Prometheus 文字格式
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+import types
+from collections import deque
+
+SESSION_TTL_SECONDS = 3600
+DUMP_INTERVAL_SECONDS = 60
+
+# 對數分桶：每 2 倍切 8 桶，誤差約 9%，記憶體固定
+BUCKETS_PER_DOUBLING = 8
+QUANTILES = (0.5, 0.9, 0.99)
+
+_ATOMIC = (int, float, complex, bool, str, bytes, type(None))
+# 模組、類別、函式屬於共用程式碼，不算入 session 大小
+_SHARED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def deep_sizeof(obj, seen=None):
+    # 以迭代方式走訪物件圖，共用物件只計一次
+    seen = set() if seen is None else seen
+    total, stack = 0, [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        if isinstance(o, _SHARED):
+            continue
+        total += sys.getsizeof(o)
+        if isinstance(o, _ATOMIC):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        else:
+            d = getattr(o, "__dict__", None)
+            if d is not None:
+                stack.append(d)
+            for slot in getattr(type(o), "__slots__", ()):
+                if hasattr(o, slot):
+                    stack.append(getattr(o, slot))
+    return total
+
+
+def _size_of_item(value):
+    # 陣列 (array / numpy) 以 buffer 大小計
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes + sys.getsizeof(value)
+    return deep_sizeof(value)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LogHistogram:
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        b = int(math.log2(max(value, 1)) * BUCKETS_PER_DOUBLING)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank, seen = q * self.count, 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                return min(2 ** ((b + 1) / BUCKETS_PER_DOUBLING), self.max)
+        return self.max
+
+
+class SessionMetrics:
+    def __init__(self, dump_dir=None, dump_interval=DUMP_INTERVAL_SECONDS):
+        self.lock = threading.Lock()
+        self.dump_lock = threading.Lock()
+        self.sessions = {}
+        self.state_bytes = LogHistogram()
+        # 以微秒記錄，對數分桶才有足夠解析度
+        self.run_us = LogHistogram()
+        self.runs = 0
+        self.dump_dir = dump_dir
+        self.dump_interval = dump_interval
+        self.last_dump = time.time()
+
+    def record(self, session_id, state, counts=None, now=None, run_seconds=None):
+        now = now or time.time()
+        keys = {str(k): _size_of_item(v) for k, v in state.items()}
+        total = sum(keys.values())
+        with self.lock:
+            self.runs += 1
+            self.state_bytes.record(total)
+            if run_seconds is not None:
+                self.run_us.record(run_seconds * 1e6)
+            self.sessions[session_id] = {
+                "bytes": total,
+                "keys": keys,
+                "counts": dict(counts or {}),
+                "last_run_ms": None if run_seconds is None else run_seconds * 1000,
+                "runs": self.sessions.get(session_id, {}).get("runs", 0) + 1,
+                "updated_at": now,
+            }
+            self._expire(now)
+            due = self.dump_dir and now - self.last_dump >= self.dump_interval
+            if due:
+                self.last_dump = now
+        if due:
+            self.dump()
+        return total
+
+    def _expire(self, now):
+        for sid in [s for s, r in self.sessions.items() if now - r["updated_at"] > SESSION_TTL_SECONDS]:
+            del self.sessions[sid]
+
+    # ---------- 輸出 ----------
+    def snapshot(self):
+        with self.lock:
+            key_totals = {}
+            for record in self.sessions.values():
+                for key, size in record["keys"].items():
+                    key_totals[key] = key_totals.get(key, 0) + size
+            return {
+                "generated_at": time.time(),
+                "runs": self.runs,
+                "active_sessions": len(self.sessions),
+                "state_bytes": {
+                    "count": self.state_bytes.count,
+                    "sum": self.state_bytes.sum,
+                    "max": self.state_bytes.max,
+                    "quantiles": {str(q): self.state_bytes.quantile(q) for q in QUANTILES},
+                },
+                "run_ms": {
+                    "count": self.run_us.count,
+                    "max": self.run_us.max / 1000,
+                    "quantiles": {str(q): self.run_us.quantile(q) / 1000 for q in QUANTILES},
+                },
+                "active_bytes_total": sum(r["bytes"] for r in self.sessions.values()),
+                "key_bytes_total": key_totals,
+                "sessions": {sid: dict(r) for sid, r in self.sessions.items()},
+            }
+
+    def prometheus(self, snapshot=None):
+        snap = snapshot or self.snapshot()
+        sb = snap["state_bytes"]
+        lines = [
+            "# HELP aicare_session_state_bytes Deep size of st.session_state measured after each run.",
+            "# TYPE aicare_session_state_bytes summary",
+        ]
+        lines += [f'aicare_session_state_bytes{{quantile="{q}"}} {v:.0f}' for q, v in sb["quantiles"].items()]
+        lines += [
+            f"aicare_session_state_bytes_sum {sb['sum']}",
+            f"aicare_session_state_bytes_count {sb['count']}",
+            "# HELP aicare_session_state_bytes_max Largest session_state seen.",
+            "# TYPE aicare_session_state_bytes_max gauge",
+            f"aicare_session_state_bytes_max {sb['max']}",
+            "# HELP aicare_script_run_seconds Full script run time per rerun.",
+            "# TYPE aicare_script_run_seconds summary",
+        ]
+        lines += [
+            f'aicare_script_run_seconds{{quantile="{q}"}} {v / 1000:.4f}' for q, v in snap["run_ms"]["quantiles"].items()
+        ]
+        lines += [
+            f"aicare_script_run_seconds_count {snap['run_ms']['count']}",
+            "# HELP aicare_active_sessions Sessions with a run in the last hour.",
+            "# TYPE aicare_active_sessions gauge",
+            f"aicare_active_sessions {snap['active_sessions']}",
+            "# HELP aicare_active_session_bytes Current session_state bytes summed over active sessions.",
+            "# TYPE aicare_active_session_bytes gauge",
+            f"aicare_active_session_bytes {snap['active_bytes_total']}",
+            "# HELP aicare_session_key_bytes Current bytes per session_state key summed over active sessions.",
+            "# TYPE aicare_session_key_bytes gauge",
+        ]
+        lines += [
+            f'aicare_session_key_bytes{{key="{_label(k)}"}} {v}'
+            for k, v in sorted(snap["key_bytes_total"].items())
+        ]
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        with self.dump_lock:
+            self._dump()
+
+    def _dump(self):
+        os.makedirs(self.dump_dir, exist_ok=True)
+        snap = self.snapshot()
+        for name, text in (
+            ("session_metrics.json", json.dumps(snap, ensure_ascii=False, indent=2)),
+            ("session_metrics.prom", self.prometheus(snap)),
+        ):
+            # 先寫暫存檔再改名，抓取端不會讀到一半的檔案
+            path = os.path.join(self.dump_dir, name)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(path + ".tmp", path)
@@ -0,0 +1,223 @@
+"""
+AI-CARE Lung 健康小助手後端
+可抽換的非同步模型介面、LRU+TTL 回覆快取、併發上限與逾時、串流輸出
+"""
+
+import asyncio
+import hashlib
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+import symptoms
+
+DEFAULT_TIMEOUT = 20.0
+DEFAULT_CONCURRENCY = 8
+CACHE_SIZE = 2048
+CACHE_TTL_SECONDS = 3600
+# 快取鍵納入的最近對話則數
+CONTEXT_TURNS = 2
+
+TIMEOUT_REPLY = "抱歉，系統目前較忙碌，請稍後再試一次。\n\n如果症狀嚴重，請直接撥打緊急聯繫專線。"
+ERROR_REPLY = "抱歉，小助手暫時無法回覆，我們正在處理。\n\n如果症狀嚴重，請直接撥打緊急聯繫專線。"
+
+_DONE = object()
+_SPACES = re.compile(r"\s+")
+
+
+# ============================================
+# 模型後端
+# ============================================
+class Backend:
+    # 子類別實作 stream()，逐段產生回覆文字
+    name = "base"
+
+    async def stream(self, prompt, history):
+        raise NotImplementedError
+        yield
+
+
+class LocalBackend(Backend):
+    # 離線替身：與原本關鍵字小助手相同的回覆，逐字串流以模擬模型延遲
+    name = "local"
+
+    def __init__(self, token_delay=0.01, chunk_size=3):
+        self.token_delay = token_delay
+        self.chunk_size = chunk_size
+
+    async def stream(self, prompt, history):
+        text = symptoms.reply(symptoms.classify(prompt))
+        for i in range(0, len(text), self.chunk_size):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield text[i:i + self.chunk_size]
+
+
+BACKENDS = {
+    "local": LocalBackend,
+}
+
+
+def make_backend(name, **options):
+    return BACKENDS[name](**options)
+
+
+# ============================================
+# 回覆快取
+# ============================================
+class ResponseCache:
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = now or time.monotonic()
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < now:
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value, now=None):
+        now = now or time.monotonic()
+        with self.lock:
+            self.items[key] = (value, now + self.ttl)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def cache_key(backend_name, prompt, history):
+    # 正規化輸入（全形數字、大小寫、空白）加上最近幾則對話
+    parts = [backend_name, _SPACES.sub(" ", symptoms.normalize(prompt)).strip()]
+    parts += [f"{m['role']}:{m['content']}" for m in list(history)[-CONTEXT_TURNS:]]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ============================================
+# 服務：背景事件迴圈 + 同步串流介面（給 st.write_stream）
+# ============================================
+class AssistantService:
+    def __init__(self, backend, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, cache=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.cache = cache or ResponseCache()
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=1000)
+        self.first_token = deque(maxlen=1000)
+
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="assistant-loop", daemon=True).start()
+        self.semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(concurrency), self.loop).result()
+
+    async def _make_semaphore(self, concurrency):
+        return asyncio.Semaphore(concurrency)
+
+    def stream(self, prompt, history=()):
+        started = time.perf_counter()
+        key = cache_key(self.backend.name, prompt, history)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._record(hit=True, latency=time.perf_counter() - started, ttft=time.perf_counter() - started)
+            yield cached
+            return
+
+        tokens = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._produce(prompt, list(history), tokens), self.loop)
+        parts, ttft, failed = [], None, None
+        try:
+            while True:
+                item = tokens.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    # 只有等待逾時才算逾時；後端其他錯誤另外計數並回覆不同訊息
+                    failed = "timeout" if isinstance(item, asyncio.TimeoutError) else "error"
+                    yield TIMEOUT_REPLY if failed == "timeout" else ERROR_REPLY
+                    break
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(item)
+                yield item
+        finally:
+            # 使用者離開頁面時停止背景產生
+            if not future.done():
+                future.cancel()
+        if failed:
+            with self.stats_lock:
+                self.misses += 1
+                if failed == "timeout":
+                    self.timeouts += 1
+                else:
+                    self.errors += 1
+            return
+        self.cache.put(key, "".join(parts))
+        self._record(hit=False, latency=time.perf_counter() - started, ttft=ttft or 0.0)
+
+    async def _produce(self, prompt, history, tokens):
+        try:
+            await asyncio.wait_for(self._pump(prompt, history, tokens), self.timeout)
+        except BaseException as exc:
+            tokens.put(exc)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+        finally:
+            tokens.put(_DONE)
+
+    async def _pump(self, prompt, history, tokens):
+        async with self.semaphore:
+            async for token in self.backend.stream(prompt, history):
+                tokens.put(token)
+
+    def complete(self, prompt, history=()):
+        return "".join(self.stream(prompt, history))
+
+    # ---------- 統計 ----------
+    def _record(self, hit, latency, ttft):
+        with self.stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.latencies.append(latency)
+            self.first_token.append(ttft)
+
+    def stats(self):
+        with self.stats_lock:
+            total = self.hits + self.misses
+            latencies, first_token = list(self.latencies), list(self.first_token)
+            return {
+                "backend": self.backend.name,
+                "requests": total,
+                "hit_rate": self.hits / total if total else 0.0,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "cache_size": len(self.cache),
+                "latency_p50": _percentile(latencies, 0.5),
+                "latency_p95": _percentile(latencies, 0.95),
+                "first_token_p50": _percentile(first_token, 0.5),
+                "first_token_p95": _percentile(first_token, 0.95),
+            }
@@ -0,0 +1,195 @@
+"""
+AI-CARE Lung 逾期未回報偵測
+每位受試者下一次應回報的期限放在 min-heap（惰性刪除）：每次掃描只取出已到期的個案，
+不逐一檢查所有收案者；新回報只重新排入該個案的期限
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from analytics import DAY, WINDOWS
+
+# 超過應回報期限多久才算逾期
+GRACE_HOURS = 6
+# 逾期不超過此時間才產生警示；更早就錯過的只標記狀態（例如系統停機後補掃）
+ALERT_MAX_AGE_HOURS = 24
+ALERT_SYMPTOM = "逾期未回報"
+REPORT_BATCH = 100000
+SWEEP_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def interval_at(surgery_at, discharge_at, ts):
+    # ts 所在追蹤時段的回報間隔（天）；出院後 365 天以後不再追蹤
+    for _, anchor, _, last, every in WINDOWS:
+        base = surgery_at if anchor == "surgery" else discharge_at
+        end = discharge_at if last is None else base + last * DAY
+        if ts < end:
+            return every
+    return None
+
+
+def next_due(surgery_at, discharge_at, last_report_at):
+    # 最近一次回報（沒有回報時為手術時間）之後的應回報期限；跨入間隔較長的時段時依新時段的間隔
+    since = max(last_report_at or surgery_at, surgery_at)
+    every = interval_at(surgery_at, discharge_at, since)
+    if every is None:
+        return None
+    later = interval_at(surgery_at, discharge_at, since + every * DAY)
+    if later is None:
+        return None
+    return since + max(every, later) * DAY + GRACE_HOURS * 3600
+
+
+# ============================================
+# 逾期偵測（跨 session 共用，增量更新）
+# ============================================
+class OverdueDetector:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.heap = []
+        self.entries = {}
+        self.schedule = {}
+        self.last_report = {}
+        self.counter = itertools.count()
+        self.stale = 0
+        self.cohort_version = None
+        self.last_report_id = 0
+        # 已標為逾期、等待回報後恢復的個案
+        self.overdue = set()
+        self.reported = set()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.last = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ---------- heap ----------
+    def _push(self, patient_id):
+        self._invalidate(patient_id)
+        surgery_at, discharge_at = self.schedule[patient_id]
+        due = next_due(surgery_at, discharge_at, self.last_report.get(patient_id))
+        if due is None:
+            return
+        entry = [due, next(self.counter), patient_id, True]
+        self.entries[patient_id] = entry
+        heapq.heappush(self.heap, entry)
+
+    def _invalidate(self, patient_id):
+        entry = self.entries.pop(patient_id, None)
+        if entry:
+            entry[-1] = False
+            self.stale += 1
+
+    def _compact(self):
+        if self.stale > len(self.heap) // 2:
+            self.heap = [e for e in self.heap if e[-1]]
+            heapq.heapify(self.heap)
+            self.stale = 0
+
+    # ---------- 載入 ----------
+    def refresh(self, db):
+        # 收案名單變動時重建；否則只依上次之後的新回報重新排入回報者的期限
+        with self.lock:
+            version = db.version("enrollment")
+            if version != self.cohort_version:
+                self._rebuild(db)
+                self.cohort_version = version
+            while True:
+                rows = db.report_times_after(self.last_report_id, REPORT_BATCH)
+                if not rows:
+                    break
+                for _, patient_id, at in rows:
+                    self._reported(patient_id, at)
+                self.last_report_id = rows[-1][0]
+            self._compact()
+        return self
+
+    def _rebuild(self, db):
+        # 先取游標再讀最後回報時間：兩者之間的新回報會再套用一次，結果相同
+        self.last_report_id = db.max_id("reports")
+        self.heap, self.entries, self.stale = [], {}, 0
+        self.schedule, self.last_report, self.overdue = {}, {}, set()
+        for patient_id, surgery_at, discharge_at, last_report_at, status in db.report_schedule():
+            self.schedule[patient_id] = (surgery_at, discharge_at)
+            self.last_report[patient_id] = last_report_at
+            # 已逾期的個案等到回報後才重新排入
+            if status == "overdue":
+                self.overdue.add(patient_id)
+            else:
+                self._push(patient_id)
+
+    def _reported(self, patient_id, at):
+        if patient_id not in self.schedule:
+            return
+        if at <= (self.last_report.get(patient_id) or 0):
+            return
+        self.last_report[patient_id] = at
+        if patient_id in self.overdue:
+            self.overdue.discard(patient_id)
+            self.reported.add(patient_id)
+        self._push(patient_id)
+
+    # ---------- 掃描 ----------
+    def sweep(self, db, now=None):
+        # 只取出期限已過的項目：O(k log n)，k 為這次到期的個案數
+        now = now or time.time()
+        started = time.perf_counter()
+        with self.lock:
+            self.refresh(db)
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                deadline, _, patient_id, valid = heapq.heappop(self.heap)
+                if not valid:
+                    self.stale -= 1
+                    continue
+                del self.entries[patient_id]
+                self.overdue.add(patient_id)
+                due.append((patient_id, deadline))
+            reported, self.reported = list(self.reported), set()
+        try:
+            restored = db.clear_overdue(reported, now=now) if reported else []
+            flagged = db.mark_overdue([pid for pid, _ in due], now=now) if due else []
+            # 其他狀態（警示中 / 需注意）的個案已有人處理，只對剛標為逾期且是最近錯過的個案發警示
+            recent = {pid for pid, deadline in due if now - deadline <= ALERT_MAX_AGE_HOURS * 3600}
+            alerts = [pid for pid in flagged if pid in recent]
+            for patient_id in alerts:
+                db.add_alert(patient_id, "yellow", ALERT_SYMPTOM, 0, now=now)
+        except Exception:
+            # 寫入失敗時已取出的期限不能遺失：下次掃描依資料庫狀態重建 heap，未標記的個案會再次到期
+            with self.lock:
+                self.reported.update(reported)
+                self.cohort_version = None
+            raise
+        self.last = {
+            "at": now, "due": len(due), "flagged": len(flagged), "alerts": len(alerts), "restored": len(restored),
+            "seconds": time.perf_counter() - started, "error": None,
+        }
+        return self.last
+
+    # ---------- 背景執行 ----------
+    def start(self, db, interval=SWEEP_SECONDS):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, args=(db, interval), name="overdue-sweep", daemon=True)
+            self.thread.start()
+            return True
+
+    def _run(self, db, interval):
+        # 單次掃描失敗（例如 database is locked）只記錄下來，下一輪照常掃描
+        while not self.stop_event.wait(interval):
+            try:
+                self.sweep(db)
+            except Exception as e:
+                logger.exception("逾期掃描失敗")
+                self.last = {"at": time.time(), "error": str(e)}
+
+    def stop(self):
+        self.stop_event.set()
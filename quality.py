@@ -0,0 +1,265 @@
+"""
+AI-CARE Lung 品質指標
+由收案、介入紀錄（轉介）與治療結果事件累計各指標的分子 / 分母，每個事件 O(1) 更新，不重掃世代；
+計數同時記入事件當天的日桶，任一時間點的快照（趨勢、認證進度）由日桶累加取得
+"""
+
+import bisect
+import threading
+import time
+
+import numpy as np
+
+from store import day_number
+
+DAY = 86400
+NUM, DEN = 0, 1
+
+# (代碼, 指標編號, 名稱, 類別, 目標 %, 越低越好)
+INDICATORS = [
+    ("contact7", "#1", "出院7日內聯繫率", "management", 80, False),
+    ("nutrition", "#3", "營養轉介率", "care", 30, False),
+    ("palliative", "#4", "緩和轉介率", "care", 60, False),
+    ("managed", "#5", "個管收案率", "management", 90, False),
+    ("mortality30", "#6", "30天死亡率", "outcome", 2, True),
+    ("readmit30", "#7", "30天再入院率", "outcome", 10, True),
+    ("completion", "#9", "完治率", "outcome", 75, False),
+]
+SLOT = {key: i for i, (key, *_) in enumerate(INDICATORS)}
+CATEGORIES = [("management", "📊 管理面"), ("care", "💉 照護面"), ("outcome", "📈 成效面")]
+# 以收案人數為分母的指標；完治率的分母為已結案（完成治療 / 退出 / 死亡）人數
+ENROLLED_KEYS = [key for key, *_ in INDICATORS if key != "completion"]
+
+# 介入紀錄的轉介欄位以開頭判斷類別（表單為「緩和醫療」，舊紀錄有「營養諮詢」）
+REFERRALS = {"緩和": "palliative", "營養": "nutrition"}
+OUTCOMES = {"completed": "完成治療", "withdrawn": "退出", "death": "死亡", "readmission": "再入院"}
+TERMINAL = {"completed", "withdrawn", "death"}
+
+CONTACT_DAYS = 7
+MORTALITY_DAYS = 30
+READMIT_DAYS = 30
+# 趨勢：目前累計值 vs. 一年前同一天的快照
+TREND_DAYS = 365
+EVENT_BATCH = 50000
+
+
+def referral_kind(referral):
+    for prefix, key in REFERRALS.items():
+        if referral and referral.startswith(prefix):
+            return key
+    return None
+
+
+def rate(num, den):
+    return num / den * 100 if den else None
+
+
+# ============================================
+# 指標引擎（跨 session 共用，增量更新）
+# ============================================
+class QualityEngine:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.totals = [0] * (2 * len(INDICATORS))
+        self.daily = {}
+        self.patients = {}
+        # 收案前就讀到的事件，收案後再套用
+        self.pending = {}
+        self.cursor = {"enrollment": 0, "interventions": 0, "outcomes": 0}
+        self.version = None
+        self.events = 0
+        self.memo = {}
+        self.cumulative = None
+
+    # ---------- 事件 ----------
+    def _count(self, key, part, at):
+        slot = 2 * SLOT[key] + part
+        self.totals[slot] += 1
+        day = day_number(at)
+        counts = self.daily.get(day)
+        if counts is None:
+            counts = self.daily[day] = [0] * len(self.totals)
+        counts[slot] += 1
+
+    def _flag(self, patient, key, at):
+        # 每位個案的分子只計一次；計入時間不早於收案
+        if key not in patient["flags"]:
+            patient["flags"].add(key)
+            self._count(key, NUM, max(at, patient["enrolled_at"]))
+
+    def enroll(self, patient_id, enrolled_at, surgery_at, discharge_at):
+        if patient_id in self.patients:
+            return
+        self.patients[patient_id] = {
+            "enrolled_at": enrolled_at, "surgery_at": surgery_at, "discharge_at": discharge_at, "flags": set(),
+        }
+        for key in ENROLLED_KEYS:
+            self._count(key, DEN, enrolled_at)
+        for name, *args in self.pending.pop(patient_id, ()):
+            getattr(self, name)(patient_id, *args)
+
+    def contact(self, patient_id, at, referral=None):
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            self.pending.setdefault(patient_id, []).append(("contact", at, referral))
+            return
+        self._flag(patient, "managed", at)
+        if 0 <= at - patient["discharge_at"] < CONTACT_DAYS * DAY:
+            self._flag(patient, "contact7", at)
+        kind = referral_kind(referral)
+        if kind:
+            self._flag(patient, kind, at)
+
+    def outcome(self, patient_id, kind, at):
+        patient = self.patients.get(patient_id)
+        if patient is None:
+            self.pending.setdefault(patient_id, []).append(("outcome", kind, at))
+            return
+        if kind == "death" and at - patient["surgery_at"] <= MORTALITY_DAYS * DAY:
+            self._flag(patient, "mortality30", at)
+        if kind == "readmission" and 0 <= at - patient["discharge_at"] <= READMIT_DAYS * DAY:
+            self._flag(patient, "readmit30", at)
+        # 完治率以第一個結案事件為準
+        if kind in TERMINAL and "closed" not in patient["flags"]:
+            patient["flags"].add("closed")
+            self._count("completion", DEN, at)
+            if kind == "completed":
+                self._count("completion", NUM, at)
+
+    # ---------- 載入 ----------
+    def refresh(self, db):
+        # 三個資料表都沒有寫入時不查詢；否則只讀上次之後的新事件（收案先讀）
+        with self.lock:
+            version = db.version("enrollment", "interventions", "outcomes")
+            if version == self.version:
+                return self
+            sources = [
+                ("enrollment", db.enrollment_after, lambda row: self.enroll(*row[1:])),
+                ("interventions", db.interventions_after, lambda row: self.contact(*row[1:])),
+                ("outcomes", db.outcomes_after, lambda row: self.outcome(*row[1:])),
+            ]
+            for name, fetch, apply in sources:
+                while True:
+                    rows = fetch(self.cursor[name], EVENT_BATCH)
+                    if not rows:
+                        break
+                    for row in rows:
+                        apply(row)
+                    self.events += len(rows)
+                    self.cursor[name] = rows[-1][0]
+            self.version = version
+        return self
+
+    # ---------- 查詢 ----------
+    def counts(self, key):
+        with self.lock:
+            slot = 2 * SLOT[key]
+            return self.totals[slot], self.totals[slot + 1]
+
+    def snapshot(self, at):
+        # at 當天結束時各指標的累計 (分子, 分母)
+        with self.lock:
+            if self.cumulative is None or self.cumulative[0] != self.events:
+                days = sorted(self.daily)
+                rows = np.cumsum([self.daily[d] for d in days], axis=0) if days else np.zeros((0, len(self.totals)))
+                self.cumulative = (self.events, days, rows.astype(np.int64))
+            _, days, rows = self.cumulative
+            i = bisect.bisect_right(days, day_number(at)) - 1
+            row = rows[i].tolist() if i >= 0 else [0] * len(self.totals)
+            return {key: (row[2 * j], row[2 * j + 1]) for j, (key, *_) in enumerate(INDICATORS)}
+
+    def summary(self, now=None):
+        # 同一天內、沒有新事件時直接回傳上次結果
+        now = now or time.time()
+        with self.lock:
+            key = (self.events, day_number(now))
+            if key not in self.memo:
+                self.memo = {key: self._summary(now)}
+            return self.memo[key]
+
+    def _summary(self, now):
+        past = self.snapshot(now - TREND_DAYS * DAY)
+        indicators = []
+        for key, number, name, category, target, lower_better in INDICATORS:
+            num, den = self.counts(key)
+            current, before = rate(num, den), rate(*past[key])
+            indicators.append({
+                "key": key, "indicator": number, "name": name, "category": category,
+                "rate": current, "num": num, "den": den, "target": target, "lower_better": lower_better,
+                "met": current is not None and (current <= target if lower_better else current >= target),
+                # 相對於一年前的變化（%）；一年前沒有資料或為 0 時為 None
+                "trend": (current - before) / before * 100 if current is not None and before else None,
+            })
+        return {
+            "indicators": indicators,
+            "cert": [
+                (label, sum(m["met"] for m in indicators if m["category"] == category),
+                 sum(m["category"] == category for m in indicators))
+                for category, label in CATEGORIES
+            ],
+        }
+
+
+# ============================================
+# 示範事件
+# ============================================
+DEMO_CONTACT_TYPES = ["電話", "LINE", "門診"]
+DEMO_NOTES = {
+    None: "出院後追蹤，說明 ePRO 回報方式與警示症狀，病人表示了解。",
+    "緩和醫療": "評估症狀負擔與照護需求，轉介緩和醫療團隊共同照護。",
+    "營養諮詢": "食慾差、體重下降，轉介營養諮詢並預約門診。",
+}
+
+
+def seed_demo_events(db, now=None, seed=0):
+    # 為示範世代產生個管聯繫、轉介與治療結果；較晚收案者的轉介率較高、早期死亡較少，以呈現改善趨勢
+    if db.count_outcomes():
+        return 0
+    now = now or time.time()
+    rng = np.random.default_rng(seed)
+    enrolled = db.list_enrollment()
+    surgery = np.array([e["surgery_at"] for e in enrolled], dtype=float)
+    discharge = np.array([e["discharge_at"] for e in enrolled], dtype=float)
+    n = len(enrolled)
+    # 0 = 最早收案、1 = 最近收案
+    recency = (surgery - surgery.min()) / max(np.ptp(surgery), 1)
+
+    contacts, outcomes = [], []
+
+    def contact(i, at, referral=None):
+        if at < now:
+            kind = DEMO_CONTACT_TYPES[int(rng.integers(len(DEMO_CONTACT_TYPES)))]
+            # 轉介於兩天後完成（尚未到期的保持待辦）
+            done = float(at + 2 * DAY) if referral and at + 2 * DAY < now else None
+            contacts.append((enrolled[i]["patient_id"], kind, DEMO_NOTES[referral], f"{int(rng.integers(2, 15))}分鐘", referral, done, float(at)))
+
+    def outcome(i, kind, at):
+        if at < now:
+            outcomes.append((enrolled[i]["patient_id"], kind, float(at)))
+
+    for i in range(n):
+        if rng.random() < 0.96:
+            contact(i, discharge[i] + rng.exponential(4) * DAY)
+        if rng.random() < 0.5 + 0.35 * recency[i]:
+            contact(i, discharge[i] + rng.uniform(7, 60) * DAY, "緩和醫療")
+        if rng.random() < 0.35:
+            contact(i, discharge[i] + rng.uniform(3, 45) * DAY, "營養諮詢")
+        if rng.random() < 0.07:
+            outcome(i, "readmission", discharge[i] + rng.uniform(1, READMIT_DAYS) * DAY)
+        if rng.random() < 0.025 * (1 - recency[i]):
+            outcome(i, "death", surgery[i] + rng.uniform(5, MORTALITY_DAYS) * DAY)
+        elif surgery[i] + 180 * DAY < now:
+            kind = rng.choice(["completed", "withdrawn", "death"], p=[0.82, 0.14, 0.04])
+            outcome(i, str(kind), surgery[i] + rng.uniform(150, 180) * DAY)
+
+    contacts.sort(key=lambda row: row[-1])
+    outcomes.sort(key=lambda row: row[-1])
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO interventions (patient_id, type, content, duration, referral, referral_done_at, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            contacts,
+        )
+        conn.executemany("INSERT INTO outcomes (patient_id, kind, at) VALUES (?, ?, ?)", outcomes)
+    db.bump("interventions", "outcomes")
+    return len(contacts) + len(outcomes)
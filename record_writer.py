@@ -0,0 +1,85 @@
+"""
+AI-CARE Lung 介入紀錄寫入
+各 session 送出的紀錄排入佇列，由單一寫入執行緒合併成批、在同一個交易提交（group commit）；
+每位病人的紀錄版本做樂觀並行控制，版本不符時回報在這之後其他個管師寫入的紀錄
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+MAX_BATCH = 256
+# 收到第一筆後最多再等多久湊批（秒）；預設不等，提交期間新到的紀錄自然併入下一批
+MAX_WAIT_SECONDS = 0
+WRITE_TIMEOUT = 10
+
+
+class VersionConflict(Exception):
+    def __init__(self, patient_id, version, records):
+        super().__init__(f"{patient_id} 的紀錄已更新到第 {version} 版（{len(records)} 筆新紀錄）")
+        self.patient_id = patient_id
+        self.version = version
+        self.records = records
+
+
+class RecordWriter:
+    def __init__(self, db, max_batch=MAX_BATCH, max_wait=MAX_WAIT_SECONDS):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {"records": 0, "batches": 0, "conflicts": 0, "largest": 0}
+
+    # ---------- 送出 ----------
+    def submit(self, record):
+        # record: patient_id, type, content, duration, referral, manager_id, expected（選擇病人時看到的版本，None 表示不檢查）
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="record-writer", daemon=True)
+                self.thread.start()
+        future = Future()
+        self.queue.put((dict(record, created_at=record.get("created_at") or time.time()), future))
+        return future
+
+    def write(self, record, timeout=WRITE_TIMEOUT):
+        # 等到所屬批次提交；回傳 (紀錄 id, 新版本)，版本不符時丟出 VersionConflict
+        intervention_id, version = self.submit(record).result(timeout)
+        if intervention_id is not None:
+            return intervention_id, version
+        if version is None:
+            raise KeyError(record["patient_id"])
+        raise VersionConflict(record["patient_id"], version, self.db.records_since_version(record["patient_id"], record["expected"]))
+
+    # ---------- 寫入執行緒 ----------
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            results = self.db.add_interventions([record for record, _ in batch])
+        except Exception as e:
+            # 整批失敗時逐筆重試，只讓有問題的紀錄失敗；每個 future 都要有結果，寫入執行緒也不能因此結束
+            if len(batch) > 1:
+                for item in batch:
+                    self._commit([item])
+            else:
+                batch[0][1].set_exception(e)
+            return
+        with self.lock:
+            self.stats["records"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["conflicts"] += sum(1 for intervention_id, _ in results if intervention_id is None)
+            self.stats["largest"] = max(self.stats["largest"], len(batch))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,198 @@
+"""
+AI-CARE Lung REDCap 增量同步
+以高水位標記找出新增 / 變更的個案與症狀回報，分批呼叫 REDCap API 匯入；連線池共用、失敗時退避重試
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BATCH_RECORDS = 500
+REQUEST_TIMEOUT = 30.0
+# 剛寫入的個案資料延後一輪再送，避免與同一時間戳的寫入交錯而漏掉
+SETTLE_SECONDS = 2.0
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+PATIENT_INSTRUMENT = "patient"
+REPORT_INSTRUMENT = "symptom_report"
+PATIENT_WATERMARK = "redcap:patients"
+REPORT_WATERMARK = "redcap:reports"
+
+
+class RedcapError(Exception):
+    pass
+
+
+def make_session(pool_size=4):
+    # 匯入採 overwriteBehavior=normal，重送同一批資料結果相同，POST 也可安全重試
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def format_redcap_time(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
+
+
+def patient_record(p):
+    return {
+        "record_id": p["id"],
+        "redcap_repeat_instrument": "",
+        "redcap_repeat_instance": "",
+        "age": p["age"],
+        "surgery": p["surgery"],
+        "post_op_day": p["day"],
+        "compliance": p["compliance"],
+        "status": p["status"],
+        f"{PATIENT_INSTRUMENT}_complete": "2",
+    }
+
+
+def report_record(row):
+    # row 為 Store.report_rows_after 的欄位順序；姓名電話不送出
+    report_id, patient_id, _, _, _, _, _, symptom, score, reported_at = row
+    return {
+        "record_id": patient_id,
+        "redcap_repeat_instrument": REPORT_INSTRUMENT,
+        "redcap_repeat_instance": report_id,
+        "symptom": symptom or "",
+        "score": score,
+        "reported_at": format_redcap_time(reported_at),
+        f"{REPORT_INSTRUMENT}_complete": "2",
+    }
+
+
+# ============================================
+# API 用戶端
+# ============================================
+class RedcapClient:
+    def __init__(self, url, token, session=None, timeout=REQUEST_TIMEOUT):
+        self.url = url
+        self.token = token
+        self.session = session or make_session()
+        self.timeout = timeout
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def post(self, **fields):
+        data = dict(fields, token=self.token, format="json", returnFormat="json")
+        self.requests += 1
+        self.bytes_sent += sum(len(str(v).encode("utf-8")) for v in data.values())
+        try:
+            resp = self.session.post(self.url, data=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise RedcapError(f"無法連線 REDCap：{e}") from e
+        if resp.status_code != 200:
+            raise RedcapError(f"REDCap 回應 {resp.status_code}：{resp.text[:200]}")
+        try:
+            return resp.json()
+        except ValueError as e:
+            # 200 但內容不是 JSON（例如代理伺服器的錯誤頁）；requests 的 JSONDecodeError 也是 ValueError
+            raise RedcapError(f"REDCap 回應無法解析：{resp.text[:200]}") from e
+
+    def version(self):
+        return self.post(content="version")
+
+    def import_records(self, records):
+        result = self.post(
+            content="record", action="import", type="flat",
+            overwriteBehavior="normal", returnContent="count",
+            data=json.dumps(records, ensure_ascii=False, separators=(",", ":")),
+        )
+        if not isinstance(result, dict):
+            raise RedcapError(f"REDCap 回應格式不符：{str(result)[:200]}")
+        if "error" in result:
+            raise RedcapError(result["error"])
+        return result.get("count", 0)
+
+
+# ============================================
+# 增量同步
+# ============================================
+class RedcapSync:
+    def __init__(self, db, client, batch_size=BATCH_RECORDS):
+        self.db = db
+        self.client = client
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.thread = None
+        self.last = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def pending(self):
+        return {
+            "patients": self.db.count_patients_changed_after(*self.db.get_watermark(PATIENT_WATERMARK)),
+            "reports": self.db.count_reports_after(int(self.db.get_watermark(REPORT_WATERMARK)[0])),
+        }
+
+    def _push_patients(self, stats, until):
+        ts, key = self.db.get_watermark(PATIENT_WATERMARK)
+        while True:
+            rows = self.db.patients_changed_after(ts, key, until, self.batch_size)
+            if not rows:
+                return
+            self.client.import_records([patient_record(p) for p in rows])
+            # 每批成功後才前移水位，中斷後從這裡接續
+            ts, key = rows[-1]["updated_at"], rows[-1]["id"]
+            self.db.set_watermark(PATIENT_WATERMARK, ts, key)
+            stats["patients"] += len(rows)
+            stats["batches"] += 1
+
+    def _push_reports(self, stats):
+        last_id = int(self.db.get_watermark(REPORT_WATERMARK)[0])
+        while True:
+            rows = self.db.report_rows_after(last_id, self.batch_size)
+            if not rows:
+                return
+            self.client.import_records([report_record(r) for r in rows])
+            last_id = rows[-1][0]
+            self.db.set_watermark(REPORT_WATERMARK, last_id)
+            stats["reports"] += len(rows)
+            stats["batches"] += 1
+
+    def run(self, actor="研究人員", now=None):
+        # 先送個案再送回報，REDCap 的重複表單要掛在已存在的紀錄下
+        with self.lock:
+            started = time.time()
+            stats = {"patients": 0, "reports": 0, "batches": 0, "error": None}
+            try:
+                self._push_patients(stats, (now or started) - SETTLE_SECONDS)
+                self._push_reports(stats)
+            except Exception as e:
+                # REDCap 錯誤之外，讀水位 / 個案時的資料庫錯誤也要記錄，管理頁才不會停在上一次的結果
+                stats["error"] = str(e)
+            stats["seconds"] = time.time() - started
+            stats["finished_at"] = time.time()
+            self.last = stats
+            self.db.add_audit(actor, "redcap_sync", self.client.url, json.dumps(stats, ensure_ascii=False))
+            return stats
+
+    def start(self, actor="研究人員"):
+        # 背景執行；已有同步在跑時不重複啟動
+        with self.start_lock:
+            if self.running:
+                return False
+            self.thread = threading.Thread(target=self.run, args=(actor,), name="redcap-sync", daemon=True)
+            self.thread.start()
+            return True
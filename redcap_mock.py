@@ -0,0 +1,116 @@
+"""
+AI-CARE Lung 本機 REDCap 替身
+只實作同步會用到的 API：content=version、content=record（import / export），可模擬暫時性錯誤以測試重試
+
+    python redcap_mock.py --port 8765 --token demo --fail-every 5
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+VERSION = "14.0.0-mock"
+
+
+class MockRedcap:
+    def __init__(self, token="demo", fail_every=0):
+        self.token = token
+        # 每 fail_every 個請求回一次 503（0 為不模擬）
+        self.fail_every = fail_every
+        # (record_id, 重複表單, instance) -> 欄位
+        self.records = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.imports = 0
+        self.failures = 0
+
+    def handle(self, form):
+        with self.lock:
+            self.requests += 1
+            if self.fail_every and self.requests % self.fail_every == 0:
+                self.failures += 1
+                return 503, {"error": "模擬暫時性錯誤"}
+        if form.get("token") != self.token:
+            return 403, {"error": "You do not have permissions to use the API"}
+        content = form.get("content")
+        if content == "version":
+            return 200, VERSION
+        if content == "record" and form.get("action", "export") == "import":
+            return self.import_records(form)
+        if content == "record":
+            with self.lock:
+                return 200, list(self.records.values())
+        return 400, {"error": f"不支援的 content：{content}"}
+
+    def import_records(self, form):
+        try:
+            records = json.loads(form.get("data", ""))
+        except ValueError:
+            return 400, {"error": "data 不是合法的 JSON"}
+        with self.lock:
+            for record in records:
+                key = (
+                    str(record["record_id"]),
+                    record.get("redcap_repeat_instrument") or "",
+                    str(record.get("redcap_repeat_instance") or ""),
+                )
+                # overwriteBehavior=normal：空值不覆蓋原有欄位
+                if key in self.records:
+                    self.records[key].update({k: v for k, v in record.items() if v not in ("", None)})
+                else:
+                    self.records[key] = dict(record)
+            self.imports += 1
+        return 200, {"count": len({r["record_id"] for r in records})}
+
+    def stats(self):
+        with self.lock:
+            return {"records": len(self.records), "requests": self.requests, "imports": self.imports, "failures": self.failures}
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+            status, body = api.handle(form)
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start(port=0, token="demo", fail_every=0):
+    # 在背景執行緒啟動，回傳 (server, api, url)；port=0 由系統指定
+    api = MockRedcap(token, fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="redcap-mock", daemon=True).start()
+    return server, api, f"http://127.0.0.1:{server.server_address[1]}/api/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機 REDCap API 替身")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", default="demo")
+    parser.add_argument("--fail-every", type=int, default=0, help="每 N 個請求回一次 503")
+    args = parser.parse_args()
+    api = MockRedcap(args.token, args.fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(api))
+    print(f"REDCap mock: http://127.0.0.1:{args.port}/api/ token={args.token}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(api.stats())
+
+
+if __name__ == "__main__":
+    main()
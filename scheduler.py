@@ -0,0 +1,261 @@
+"""
+AI-CARE Lung 個管師排程
+把待處理警示、逾期未回報個案與待執行轉介分派給各個管師：依期限（EDF）排序，
+放進接受該類工作、最早還有空的時段中負荷最輕的個管師；紅色警示可插入任何時段，
+其他工作在該類時段已滿或已過時改放當天其他於期限前結束的時段。
+項目變動時只移除 / 插入變動的工作，換時段或累積變動過多時才整體重排
+"""
+
+import bisect
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+# (開始, 結束, 工作內容, 優先接受的工作類別)
+BLOCKS = [
+    ("08:00", "10:00", "檢視系統數據，主動聯繫未完成者", {"overdue"}),
+    ("10:00", "12:00", "處理紅色/黃色警示患者", {"alert"}),
+    ("13:00", "15:00", "執行轉介、與醫療團隊溝通", {"referral"}),
+    ("15:00", "17:00", "數據輸入、個案管理日誌", set()),
+]
+# 排不進當天時段的工作
+OVERFLOW = len(BLOCKS)
+# 每件工作預估分鐘數
+TASK_MINUTES = {"red": 15, "yellow": 10, "green": 5, "overdue": 5, "referral": 20}
+URGENT_LEVELS = {"red"}
+LEVEL_LABEL = {"red": "紅色警示", "yellow": "黃色警示", "green": "綠色警示"}
+REFERRAL_SLA_HOURS = 48
+# 累積變動超過工作數的此比例時整體重排，避免負荷逐漸失衡
+REPLAN_RATIO = 0.25
+
+
+# ============================================
+# 工作項目
+# ============================================
+def alert_task(alert):
+    return {
+        "key": ("alert", alert["id"]), "kind": "alert", "id": alert["id"],
+        "patient_id": alert["patient_id"], "patient": alert["patient"],
+        "group": LEVEL_LABEL[alert["level"]], "detail": f"{alert['symptom']} {alert['score']}分",
+        "deadline": alert["deadline"], "minutes": TASK_MINUTES[alert["level"]], "urgent": alert["level"] in URGENT_LEVELS,
+    }
+
+
+def overdue_task(patient, deadline):
+    return {
+        "key": ("overdue", patient["id"]), "kind": "overdue", "id": patient["id"],
+        "patient_id": patient["id"], "patient": patient["name"],
+        "group": "未回報", "detail": "主動聯繫完成 ePRO 回報",
+        "deadline": deadline, "minutes": TASK_MINUTES["overdue"], "urgent": False,
+    }
+
+
+def referral_task(row):
+    return {
+        "key": ("referral", row["id"]), "kind": "referral", "id": row["id"],
+        "patient_id": row["patient_id"], "patient": row["patient"],
+        "group": row["referral"], "detail": f"轉介{row['referral']}",
+        "deadline": row["created_at"] + REFERRAL_SLA_HOURS * 3600, "minutes": TASK_MINUTES["referral"], "urgent": False,
+    }
+
+
+def day_blocks(now):
+    # 今天是工作日且還有時段就排今天，否則排下一個工作日；回傳 (日期, 各時段起訖 timestamp)
+    today = datetime.fromtimestamp(now).date()
+    for day in (today + timedelta(days=i) for i in range(8)):
+        if day.weekday() >= 5:
+            continue
+        spans = [
+            (datetime.fromisoformat(f"{day} {start}").timestamp(), datetime.fromisoformat(f"{day} {end}").timestamp())
+            for start, end, *_ in BLOCKS
+        ]
+        if now < spans[-1][1]:
+            return day, spans
+
+
+def _signature(task):
+    return task["deadline"], task["minutes"], task["urgent"]
+
+
+# ============================================
+# 排程（跨 session 共用，增量更新）
+# ============================================
+class Scheduler:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.counter = itertools.count()
+        self.managers = []
+        self.index = {}
+        self.tasks = {}
+        self.placed = {}
+        self.queues = {}
+        self.used = []
+        self.heaps = []
+        self.capacity = []
+        self.completed = {}
+        self.day = None
+        self.spans = []
+        self.plan_key = None
+        self.version = None
+        self.changes = 0
+        self.last = None
+
+    def _plan_key(self, managers, now):
+        # 日期、第一個還沒結束的時段或個管師名單改變時必須整體重排
+        day, spans = day_blocks(now)
+        first_open = next(b for b, (_, end) in enumerate(spans) if now < end)
+        return day, first_open, tuple(managers)
+
+    # ---------- 放置 / 移除 ----------
+    def _least_loaded(self, b):
+        # 惰性刪除：heap 裡的負荷與目前負荷不同就是過時項目
+        heap, used = self.heaps[b], self.used[b]
+        while heap[0][0] != used[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][1]
+
+    def _set_used(self, b, m, minutes):
+        self.used[b][m] = minutes
+        heapq.heappush(self.heaps[b], (minutes, m))
+        if len(self.heaps[b]) > 4 * len(self.managers):
+            self.heaps[b] = [(u, i) for i, u in enumerate(self.used[b])]
+            heapq.heapify(self.heaps[b])
+
+    def _fits(self, b, task):
+        # 該時段負荷最輕且放得下這件工作的個管師；放不下時回傳 None
+        if not self.capacity[b]:
+            return None
+        m = self._least_loaded(b)
+        return m if self.used[b][m] + task["minutes"] <= self.capacity[b] else None
+
+    def _place(self, task):
+        if not self.managers:
+            return
+        # 先放接受該類工作的時段；都滿了或已過，再放其他結束時間不晚於期限的時段，最後才順延
+        preferred = [b for b in range(OVERFLOW) if task["urgent"] or task["kind"] in BLOCKS[b][3]]
+        fallback = [b for b in range(OVERFLOW) if b not in preferred and self.spans[b][1] <= task["deadline"]]
+        for b in preferred + fallback:
+            m = self._fits(b, task)
+            if m is not None:
+                break
+        else:
+            b, m = OVERFLOW, self._least_loaded(OVERFLOW)
+        entry = (task["deadline"], next(self.counter), task["key"])
+        bisect.insort(self.queues.setdefault((m, b), []), entry)
+        self._set_used(b, m, self.used[b][m] + task["minutes"])
+        self.placed[task["key"]] = (m, b, entry)
+
+    def _unplace(self, key):
+        if key not in self.placed:
+            return
+        m, b, entry = self.placed.pop(key)
+        queue = self.queues[(m, b)]
+        del queue[bisect.bisect_left(queue, entry)]
+        self._set_used(b, m, self.used[b][m] - self.tasks[key]["minutes"])
+
+    def _replan(self, managers, tasks, now):
+        _, self.spans = day_blocks(now)
+        self.managers = list(managers)
+        self.index = {mid: i for i, mid in enumerate(self.managers)}
+        # 目前時段只剩下尚未經過的分鐘數；逾期時段容量為 0
+        self.capacity = [max(0.0, (end - max(start, now)) / 60) for start, end in self.spans] + [float("inf")]
+        size = max(len(self.managers), 1)
+        self.used = [[0] * size for _ in range(OVERFLOW + 1)]
+        self.heaps = [[(0, m) for m in range(size)] for _ in range(OVERFLOW + 1)]
+        self.queues, self.placed = {}, {}
+        self.tasks = tasks
+        for task in sorted(tasks.values(), key=lambda t: (t["deadline"], not t["urgent"])):
+            self._place(task)
+        self.changes = 0
+
+    # ---------- 更新 ----------
+    def update(self, managers, tasks, now=None):
+        # tasks: 目前所有待辦工作；與上次比較後只處理新增、移除與期限變動的項目
+        now = now or time.time()
+        started = time.perf_counter()
+        with self.lock:
+            tasks = {task["key"]: task for task in tasks}
+            plan_key = self._plan_key(managers, now)
+            if plan_key[0] != self.day:
+                self.day, self.completed = plan_key[0], {}
+            removed = [key for key in self.tasks if key not in tasks]
+            changed = [key for key, task in tasks.items() if key in self.tasks and _signature(task) != _signature(self.tasks[key])]
+            added = [key for key in tasks if key not in self.tasks]
+            # 消失的工作記為負責個管師在目前時段完成的工作
+            block = self._current_block(now)
+            for key in removed:
+                if key in self.placed:
+                    manager_id = self.managers[self.placed[key][0]]
+                    self.completed[manager_id, block] = self.completed.get((manager_id, block), 0) + 1
+            self.changes += len(removed) + len(changed) + len(added)
+            full = plan_key != self.plan_key or self.changes > REPLAN_RATIO * max(len(tasks), 1)
+            if full:
+                self._replan(managers, tasks, now)
+                self.plan_key = plan_key
+            else:
+                for key in removed + changed:
+                    self._unplace(key)
+                for key in changed:
+                    self.tasks[key] = tasks[key]
+                for key in removed:
+                    del self.tasks[key]
+                for key in sorted(changed + added, key=lambda k: tasks[k]["deadline"]):
+                    self.tasks[key] = tasks[key]
+                    self._place(tasks[key])
+            self.last = {
+                "full": full, "tasks": len(tasks), "added": len(added), "removed": len(removed), "changed": len(changed),
+                "seconds": time.perf_counter() - started, "at": now,
+            }
+        return self
+
+    def refresh(self, db, alerts, now=None):
+        # alerts: AlertQueue；警示 / 病人 / 介入紀錄 / 個管師都沒有寫入、也還在同一時段時不重建工作清單
+        now = now or time.time()
+        with self.lock:
+            managers = [m["id"] for m in db.list_managers()]
+            version = db.version("alerts", "patients", "interventions", "managers")
+            if version == self.version and self._plan_key(managers, now) == self.plan_key:
+                return self
+            _, spans = day_blocks(now)
+            tasks = (
+                [alert_task(alert) for alert in alerts.open_alerts()]
+                + [overdue_task(patient, spans[-1][1]) for patient in db.list_patients(status="overdue")]
+                + [referral_task(row) for row in db.open_referrals()]
+            )
+            self.update(managers, tasks, now)
+            self.version = version
+        return self
+
+    # ---------- 查詢 ----------
+    def _current_block(self, now):
+        # 目前所在（或最近一個已開始）的時段；第一個時段開始前為 0
+        return max([b for b, (start, _) in enumerate(self.spans) if start <= now] or [0])
+
+    def agenda(self, manager_id, now=None):
+        # 該個管師各時段的工作（依期限排序，含預估完成時間與是否可能逾時）與已完成件數
+        now = now or time.time()
+        with self.lock:
+            m = self.index.get(manager_id)
+            blocks = []
+            for b, (start, end, label, _) in enumerate(BLOCKS):
+                span_start, span_end = self.spans[b]
+                clock = max(span_start, now)
+                tasks = []
+                for _, _, key in self.queues.get((m, b), []):
+                    task = self.tasks[key]
+                    clock += task["minutes"] * 60
+                    tasks.append(dict(task, eta=clock, late=clock > task["deadline"]))
+                blocks.append({
+                    "time": f"{start}-{end}", "task": label,
+                    "status": "done" if now >= span_end else "current" if now >= span_start else "upcoming",
+                    "tasks": tasks, "completed": self.completed.get((manager_id, b), 0),
+                })
+            overflow = [self.tasks[key] for _, _, key in self.queues.get((m, OVERFLOW), [])]
+            return {"day": self.day, "blocks": blocks, "overflow": overflow}
+
+    def loads(self):
+        # 各個管師已排入的分鐘數（不含排不進的工作）
+        with self.lock:
+            return {mid: sum(self.used[b][m] for b in range(OVERFLOW)) for mid, m in self.index.items()}
@@ -0,0 +1,193 @@
+"""
+AI-CARE Lung 病人搜尋索引
+姓名 / 手術：CJK n-gram 倒排索引；病歷號 / 電話：前綴索引
+"""
+
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+NON_DIGIT = re.compile(r"\D")
+
+# 排名：病歷號完全符合 > 病歷號前綴 > 電話前綴 > 姓名完全符合 > 姓名前綴 > 姓名包含 > 手術包含
+# 同一層內以姓名長度、病歷號排序
+
+
+def _grams(text):
+    # 單字 + 雙字 n-gram，中文姓名不需斷詞
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _query_grams(text):
+    if len(text) == 1:
+        return [text]
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+class _PrefixIndex:
+    # 排序後的 (key, doc) 陣列，以二分搜尋取出前綴範圍
+    def __init__(self):
+        self.keys = []
+
+    def add(self, key, doc):
+        if key:
+            bisect.insort(self.keys, (key, doc))
+
+    def extend(self, pairs):
+        self.keys.extend(p for p in pairs if p[0])
+        self.keys.sort()
+
+    def remove(self, key, doc):
+        if not key:
+            return
+        i = bisect.bisect_left(self.keys, (key, doc))
+        if i < len(self.keys) and self.keys[i] == (key, doc):
+            del self.keys[i]
+
+    def prefix(self, prefix, limit):
+        i = bisect.bisect_left(self.keys, (prefix,))
+        out = []
+        while i < len(self.keys) and len(out) < limit:
+            key, doc = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            out.append((key, doc))
+            i += 1
+        return out
+
+
+class PatientIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.rank = {}
+        self.name_grams = defaultdict(set)
+        self.surgery_grams = defaultdict(set)
+        self.ids = _PrefixIndex()
+        self.phones = _PrefixIndex()
+        self.watermark = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    # ---------- 建立 / 增量更新 ----------
+    def add(self, patient):
+        with self.lock:
+            doc = self._index_doc(patient)
+            self.ids.add(doc["id_key"], doc["id"])
+            self.phones.add(doc["phone"], doc["id"])
+
+    def add_many(self, patients):
+        # 大量載入：前綴陣列最後一次排序，避免逐筆 insort
+        with self.lock:
+            docs = [self._index_doc(p) for p in patients]
+            self.ids.extend((d["id_key"], d["id"]) for d in docs)
+            self.phones.extend((d["phone"], d["id"]) for d in docs)
+
+    def _index_doc(self, patient):
+        pid = patient["id"]
+        doc = {
+            "id": pid,
+            "id_key": pid.lower(),
+            "name": patient.get("name") or "",
+            "phone": NON_DIGIT.sub("", patient.get("phone") or ""),
+            "surgery": patient.get("surgery") or "",
+        }
+        if pid in self.docs:
+            self._unindex(self.docs[pid])
+        self.docs[pid] = doc
+        self.rank[pid] = (len(doc["name"]), pid)
+        for g in _grams(doc["name"]):
+            self.name_grams[g].add(pid)
+        for g in _grams(doc["surgery"]):
+            self.surgery_grams[g].add(pid)
+        return doc
+
+    def remove(self, patient_id):
+        with self.lock:
+            doc = self.docs.pop(patient_id, None)
+            self.rank.pop(patient_id, None)
+            if doc:
+                self._unindex(doc)
+
+    def _unindex(self, doc):
+        pid = doc["id"]
+        for grams, text in ((self.name_grams, doc["name"]), (self.surgery_grams, doc["surgery"])):
+            for g in _grams(text):
+                posting = grams.get(g)
+                if posting is not None:
+                    posting.discard(pid)
+                    if not posting:
+                        del grams[g]
+        self.ids.remove(doc["id_key"], pid)
+        self.phones.remove(doc["phone"], pid)
+
+    def sync(self, db):
+        # 只讀取上次同步後有異動的病人
+        with self.lock:
+            changed = db.patients_updated_since(self.watermark)
+            if not changed:
+                return
+            if self.docs:
+                for p in changed:
+                    self.add(p)
+            else:
+                self.add_many(changed)
+            self.watermark = max(p["updated_at"] for p in changed)
+
+    # ---------- 查詢 ----------
+    def search(self, query, k=20):
+        query = (query or "").strip()
+        if not query:
+            return []
+        with self.lock:
+            # 依分數高低逐層取結果，高分層已滿 k 筆就不再展開低分層
+            results, seen = [], set()
+            for tier in self._tiers(query, k):
+                if len(results) >= k:
+                    break
+                fresh = [pid for pid in tier if pid not in seen]
+                best = heapq.nsmallest(k - len(results), fresh, key=self.rank.__getitem__)
+                results += best
+                seen.update(best)
+        return results
+
+    def _tiers(self, query, k):
+        q_lower = query.lower()
+        id_hits = self.ids.prefix(q_lower, k * 4)
+        yield [pid for key, pid in id_hits if key == q_lower]
+        yield [pid for key, pid in id_hits if key != q_lower]
+
+        digits = NON_DIGIT.sub("", query)
+        if len(digits) >= 3 and len(digits) >= len(query.replace("-", "").replace(" ", "")):
+            yield [pid for _, pid in self.phones.prefix(digits, k * 4)]
+
+        exact, prefix, contains = [], [], []
+        for pid in self._contains(self.name_grams, query, "name"):
+            name = self.docs[pid]["name"]
+            if name == query:
+                exact.append(pid)
+            elif name.startswith(query):
+                prefix.append(pid)
+            else:
+                contains.append(pid)
+        yield exact
+        yield prefix
+        yield contains
+
+        yield self._contains(self.surgery_grams, query, "surgery")
+
+    def _contains(self, grams, query, field):
+        postings = [grams.get(g) for g in _query_grams(query)]
+        if not postings or any(p is None for p in postings):
+            return []
+        postings.sort(key=len)
+        candidates = set.intersection(*postings) if len(postings) > 1 else postings[0]
+        if len(query) <= 2:
+            return candidates
+        # n-gram 交集可能誤判，再以原字串確認
+        return [pid for pid in candidates if query in self.docs[pid][field]]
@@ -0,0 +1,786 @@
+"""
+AI-CARE Lung 資料儲存層
+SQLite (WAL) 儲存：病人、警示、介入紀錄、排程、症狀回報、收案與治療結果
+"""
+
+import sqlite3
+import threading
+import time
+
+# ============================================
+# 資料表結構（依版本遞增的 migration）
+# ============================================
+MIGRATIONS = [
+    """
+    CREATE TABLE patients (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        age INTEGER,
+        surgery TEXT,
+        day INTEGER,
+        compliance INTEGER,
+        status TEXT NOT NULL DEFAULT 'normal',
+        last_report_at REAL,
+        phone TEXT,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX idx_patients_status ON patients(status);
+
+    CREATE TABLE alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id TEXT NOT NULL REFERENCES patients(id),
+        level TEXT NOT NULL,
+        symptom TEXT,
+        score INTEGER,
+        status TEXT NOT NULL DEFAULT 'pending',
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX idx_alerts_patient ON alerts(patient_id);
+    CREATE INDEX idx_alerts_level_status ON alerts(level, status);
+    CREATE INDEX idx_alerts_status_created ON alerts(status, created_at);
+
+    CREATE TABLE interventions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id TEXT NOT NULL REFERENCES patients(id),
+        type TEXT NOT NULL,
+        content TEXT,
+        duration TEXT,
+        referral TEXT,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX idx_interventions_patient ON interventions(patient_id, created_at);
+    CREATE INDEX idx_interventions_created ON interventions(created_at);
+
+    CREATE TABLE reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id TEXT NOT NULL REFERENCES patients(id),
+        symptom TEXT,
+        score INTEGER NOT NULL,
+        reported_at REAL NOT NULL
+    );
+    CREATE INDEX idx_reports_patient_time ON reports(patient_id, reported_at);
+    CREATE INDEX idx_reports_time ON reports(reported_at);
+
+    CREATE TABLE schedule (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        time TEXT NOT NULL,
+        task TEXT NOT NULL,
+        status TEXT NOT NULL,
+        detail TEXT NOT NULL DEFAULT ''
+    );
+
+    CREATE TABLE compliance_monthly (
+        month TEXT PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        ai_epro REAL,
+        traditional_epro REAL
+    );
+    """,
+    """
+    CREATE INDEX idx_patients_updated ON patients(updated_at);
+    """,
+    """
+    CREATE TABLE vitals (
+        patient_id TEXT NOT NULL,
+        ts INTEGER NOT NULL,
+        spo2 INTEGER NOT NULL,
+        hr INTEGER NOT NULL,
+        PRIMARY KEY (patient_id, ts)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE vitals_minute (
+        patient_id TEXT NOT NULL,
+        minute INTEGER NOT NULL,
+        n INTEGER NOT NULL,
+        spo2_min INTEGER, spo2_max INTEGER, spo2_sum INTEGER,
+        hr_min INTEGER, hr_max INTEGER, hr_sum INTEGER,
+        PRIMARY KEY (patient_id, minute)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE report_rollup (
+        patient_id TEXT NOT NULL,
+        period TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        symptom TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        score_sum INTEGER NOT NULL,
+        score_max INTEGER NOT NULL,
+        PRIMARY KEY (patient_id, period, bucket, symptom)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        at REAL NOT NULL,
+        actor TEXT NOT NULL,
+        action TEXT NOT NULL,
+        target TEXT,
+        detail TEXT
+    );
+    CREATE INDEX idx_audit_at ON audit_log(at);
+    """,
+    """
+    CREATE TABLE sync_state (
+        name TEXT PRIMARY KEY,
+        ts REAL NOT NULL DEFAULT 0,
+        key TEXT NOT NULL DEFAULT '',
+        updated_at REAL NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE enrollment (
+        patient_id TEXT PRIMARY KEY REFERENCES patients(id),
+        arm TEXT NOT NULL,
+        enrolled_at REAL NOT NULL,
+        surgery_at REAL NOT NULL,
+        discharge_at REAL NOT NULL,
+        college INTEGER,
+        caregiver INTEGER,
+        smartphone_years REAL,
+        gad7 INTEGER
+    );
+    CREATE INDEX idx_enrollment_arm ON enrollment(arm);
+    """,
+    """
+    CREATE TABLE outcomes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patient_id TEXT NOT NULL REFERENCES patients(id),
+        kind TEXT NOT NULL,
+        at REAL NOT NULL
+    );
+    CREATE INDEX idx_outcomes_patient ON outcomes(patient_id);
+    """,
+    """
+    CREATE TABLE managers (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL
+    );
+    ALTER TABLE interventions ADD COLUMN manager_id TEXT REFERENCES managers(id);
+    CREATE INDEX idx_interventions_manager ON interventions(manager_id, created_at);
+    """,
+    """
+    ALTER TABLE interventions ADD COLUMN referral_done_at REAL;
+    -- 既有轉介沒有完成紀錄，視為已完成，避免全部進入待辦
+    UPDATE interventions SET referral_done_at = created_at WHERE referral IS NOT NULL;
+    CREATE INDEX idx_interventions_referral_open ON interventions(created_at)
+        WHERE referral IS NOT NULL AND referral_done_at IS NULL;
+    """,
+    """
+    -- 每位病人介入紀錄的版本（樂觀並行控制），每筆紀錄記下寫入後的版本
+    ALTER TABLE patients ADD COLUMN record_version INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE interventions ADD COLUMN version INTEGER;
+    """,
+    """
+    -- 排程改由 scheduler.py 即時產生，不再使用靜態排程
+    DROP TABLE schedule;
+    """,
+    """
+    -- 順從度趨勢改由 analytics.py 從回報計算，不再使用每月數字
+    DROP TABLE compliance_monthly;
+    """,
+]
+
+# 已完成追蹤的個案：出院時間不晚於指定時間（追蹤期已結束），或已記錄完成治療
+COMPLETED_PATIENTS = (
+    "SELECT patient_id FROM enrollment WHERE discharge_at <= ?"
+    " UNION SELECT patient_id FROM outcomes WHERE kind = 'completed'"
+)
+
+# 症狀回報彙總：day / week 兩種區間，symptom 為 "*" 表示全部症狀合計
+ROLLUP_PERIODS = ("day", "week")
+ROLLUP_ALL = "*"
+# 以本地時區切日（台灣無日光節約時間，固定位移即可）
+UTC_OFFSET = time.localtime().tm_gmtoff
+
+
+def day_number(ts):
+    return int((ts + UTC_OFFSET) // 86400)
+
+
+def week_number(day):
+    # 以週一為一週開始；1970-01-01 為週四
+    return day - (day + 3) % 7
+
+
+def report_buckets(ts):
+    day = day_number(ts)
+    return {"day": day, "week": week_number(day)}
+
+# ============================================
+# 示範數據（首次啟動時寫入）
+# ============================================
+SEED_PATIENTS = [
+    {"id": "P001", "name": "王大明", "age": 68, "surgery": "右上肺葉切除", "day": 14, "compliance": 92, "status": "alert", "last_report": 50, "phone": "0912-345-678"},
+    {"id": "P002", "name": "李小華", "age": 55, "surgery": "左下肺葉切除", "day": 21, "compliance": 85, "status": "warning", "last_report": 125, "phone": "0923-456-789"},
+    {"id": "P003", "name": "陳美玲", "age": 72, "surgery": "右中肺葉切除", "day": 7, "compliance": 78, "status": "overdue", "last_report": 26 * 60, "phone": "0934-567-890"},
+    {"id": "P004", "name": "張志明", "age": 61, "surgery": "肺節切除", "day": 30, "compliance": 95, "status": "normal", "last_report": 155, "phone": "0945-678-901"},
+    {"id": "P005", "name": "林淑芬", "age": 58, "surgery": "左上肺葉切除", "day": 45, "compliance": 88, "status": "normal", "last_report": 22 * 60, "phone": "0956-789-012"},
+]
+
+# 時間欄位為「幾分鐘前」
+SEED_ALERTS = [
+    {"patient_id": "P001", "level": "red", "symptom": "呼吸困難", "score": 8, "ago": 10, "status": "pending"},
+    {"patient_id": "P002", "level": "yellow", "symptom": "疲勞", "score": 5, "ago": 30, "status": "pending"},
+    {"patient_id": "P003", "level": "yellow", "symptom": "胸痛", "score": 4, "ago": 60, "status": "contacted"},
+    {"patient_id": "P004", "level": "green", "symptom": "輕微咳嗽", "score": 2, "ago": 120, "status": "resolved"},
+]
+
+SEED_INTERVENTIONS = [
+    {"patient_id": "P001", "type": "電話", "content": "呼吸困難症狀評估，建議使用噘嘴式呼吸，若持續加重需回診。病人表示了解。", "ago": 5, "duration": "8分鐘", "referral": None},
+    {"patient_id": "P002", "type": "LINE", "content": "提醒今日回報，病人表示下午會填寫。", "ago": 80, "duration": "2分鐘", "referral": None},
+    {"patient_id": "P003", "type": "電話", "content": "評估後轉介營養諮詢，體重持續下降。已預約營養師門診。", "ago": 19 * 60, "duration": "12分鐘", "referral": "營養諮詢"},
+]
+
+# (天前, 症狀, 分數)
+SEED_REPORTS = [
+    (0, "輕微疲勞", 2), (1, "胸悶", 3), (2, "呼吸順暢", 1), (3, "輕微咳嗽", 3),
+    (4, "疲勞", 5), (5, "胸悶", 4), (6, "輕微咳嗽", 3),
+]
+
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+# ============================================
+# 儲存層
+# ============================================
+class Store:
+    def __init__(self, path):
+        self.path = path
+        # Streamlit 每個 session 在不同執行緒執行，共用一條連線並以鎖串行化
+        self.conn = self._connect()
+        self.lock = threading.RLock()
+        # 各資料表的寫入版本，供圖表等衍生資料判斷是否需要重算
+        self.versions = {}
+        self._migrate()
+        # 批次寫入另開一條連線：WAL 下寫入交易進行中，其他 session 仍可用主連線讀取；記憶體資料庫只能共用連線
+        if path == ":memory:":
+            self.write_conn, self.write_lock = self.conn, self.lock
+        else:
+            self.write_conn, self.write_lock = self._connect(), threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = _dict_row
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _migrate(self):
+        with self.lock:
+            version = self.conn.execute("PRAGMA user_version").fetchone()["user_version"]
+            for i, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                self.conn.executescript(f"BEGIN; {script} PRAGMA user_version = {i}; COMMIT;")
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def query_tuples(self, sql, params=()):
+        # 大量數值資料略過 dict 轉換
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.row_factory = None
+            return cur.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def max_id(self, table):
+        return self.query_one(f"SELECT COALESCE(MAX(id), 0) AS id FROM {table}")["id"]
+
+    def transaction(self):
+        return _Transaction(self.lock, self.conn)
+
+    def write_transaction(self):
+        return _Transaction(self.write_lock, self.write_conn)
+
+    def bump(self, *tables):
+        with self.lock:
+            for table in tables:
+                self.versions[table] = self.versions.get(table, 0) + 1
+
+    def version(self, *tables):
+        with self.lock:
+            return tuple(self.versions.get(table, 0) for table in tables)
+
+    def close(self):
+        with self.lock, self.write_lock:
+            if self.write_conn is not self.conn:
+                self.write_conn.close()
+            self.conn.close()
+
+    # ---------- 示範數據 ----------
+    def seed_demo(self, now=None):
+        now = now or time.time()
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM patients LIMIT 1").fetchone():
+                return False
+            conn.executemany(
+                "INSERT INTO patients (id, name, age, surgery, day, compliance, status, last_report_at, phone, updated_at)"
+                " VALUES (:id, :name, :age, :surgery, :day, :compliance, :status, :last_report_at, :phone, :updated_at)",
+                [dict(p, last_report_at=now - p["last_report"] * 60, updated_at=now) for p in SEED_PATIENTS],
+            )
+            conn.executemany(
+                "INSERT INTO alerts (patient_id, level, symptom, score, status, created_at, updated_at)"
+                " VALUES (:patient_id, :level, :symptom, :score, :status, :created_at, :created_at)",
+                [dict(a, created_at=now - a["ago"] * 60) for a in SEED_ALERTS],
+            )
+            conn.executemany(
+                "INSERT INTO interventions (patient_id, type, content, duration, referral, created_at)"
+                " VALUES (:patient_id, :type, :content, :duration, :referral, :created_at)",
+                [dict(r, created_at=now - r["ago"] * 60) for r in SEED_INTERVENTIONS],
+            )
+            conn.executemany(
+                "INSERT INTO reports (patient_id, symptom, score, reported_at) VALUES ('P001', ?, ?, ?)",
+                [(symptom, score, now - days * 86400) for days, symptom, score in SEED_REPORTS],
+            )
+        self.bump("patients", "alerts", "interventions", "reports")
+        return True
+
+    # ---------- 病人 ----------
+    def get_patient(self, patient_id):
+        return self.query_one("SELECT * FROM patients WHERE id = ?", (patient_id,))
+
+    def list_patients(self, status=None, search=None, limit=None, offset=0):
+        sql, where, params = "SELECT * FROM patients", [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if search:
+            where.append("(instr(name, ?) > 0 OR instr(id, ?) > 0)")
+            params += [search, search]
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self.query(sql, params)
+
+    def get_patients(self, patient_ids):
+        if not patient_ids:
+            return []
+        marks = ",".join("?" * len(patient_ids))
+        rows = {p["id"]: p for p in self.query(f"SELECT * FROM patients WHERE id IN ({marks})", list(patient_ids))}
+        return [rows[pid] for pid in patient_ids if pid in rows]
+
+    def patients_updated_since(self, ts=None):
+        if ts is None:
+            return self.query("SELECT * FROM patients ORDER BY updated_at")
+        return self.query("SELECT * FROM patients WHERE updated_at > ? ORDER BY updated_at", (ts,))
+
+    def patients_changed_after(self, ts, patient_id, until, limit):
+        # 外部同步用：依 (updated_at, id) 往後讀，until 之後的變更留到下一輪
+        return self.query(
+            "SELECT * FROM patients WHERE (updated_at > ? OR (updated_at = ? AND id > ?)) AND updated_at <= ?"
+            " ORDER BY updated_at, id LIMIT ?",
+            (ts, ts, patient_id, until, limit),
+        )
+
+    def count_patients_changed_after(self, ts, patient_id):
+        return self.query_one(
+            "SELECT COUNT(*) AS n FROM patients WHERE updated_at > ? OR (updated_at = ? AND id > ?)",
+            (ts, ts, patient_id),
+        )["n"]
+
+    def mark_overdue(self, patient_ids, now=None):
+        # 只把狀態為 normal 的個案標為逾期；回傳實際變更的個案
+        return self._set_status(patient_ids, "normal", "overdue", now)
+
+    def clear_overdue(self, patient_ids, now=None):
+        return self._set_status(patient_ids, "overdue", "normal", now)
+
+    def _set_status(self, patient_ids, old, new, now):
+        now = now or time.time()
+        changed = []
+        with self.transaction() as conn:
+            for patient_id in patient_ids:
+                cur = conn.execute(
+                    "UPDATE patients SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                    (new, now, patient_id, old),
+                )
+                if cur.rowcount:
+                    changed.append(patient_id)
+        if changed:
+            self.bump("patients")
+        return changed
+
+    def patient_names(self):
+        return self.query("SELECT id, name FROM patients ORDER BY id")
+
+    def count_patients(self, status=None):
+        if status:
+            return self.query_one("SELECT COUNT(*) AS n FROM patients WHERE status = ?", (status,))["n"]
+        return self.query_one("SELECT COUNT(*) AS n FROM patients")["n"]
+
+    # ---------- 警示 ----------
+    def list_alerts(self, status=None, level=None, limit=None, offset=0):
+        sql = (
+            "SELECT a.*, p.name AS patient, p.phone FROM alerts a"
+            " JOIN patients p ON p.id = a.patient_id"
+        )
+        where, params = [], []
+        if status:
+            where.append("a.status = ?")
+            params.append(status)
+        if level:
+            where.append("a.level = ?")
+            params.append(level)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY a.created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self.query(sql, params)
+
+    def count_alerts(self, status=None, level=None):
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if level:
+            where.append("level = ?")
+            params.append(level)
+        sql = "SELECT COUNT(*) AS n FROM alerts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return self.query_one(sql, params)["n"]
+
+    def add_alert(self, patient_id, level, symptom, score, now=None):
+        now = now or time.time()
+        alert_id = self.execute(
+            "INSERT INTO alerts (patient_id, level, symptom, score, status, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+            (patient_id, level, symptom, score, now, now),
+        ).lastrowid
+        self.bump("alerts")
+        return alert_id
+
+    def alerts_after(self, alert_id):
+        return self.query(
+            "SELECT a.*, p.name AS patient, p.phone FROM alerts a"
+            " JOIN patients p ON p.id = a.patient_id"
+            " WHERE a.id > ? ORDER BY a.id",
+            (alert_id,),
+        )
+
+    def set_alert_level(self, alert_id, level, now=None):
+        self.execute(
+            "UPDATE alerts SET level = ?, updated_at = ? WHERE id = ?",
+            (level, now or time.time(), alert_id),
+        )
+        self.bump("alerts")
+
+    def set_alert_status(self, alert_id, status, now=None):
+        self.execute(
+            "UPDATE alerts SET status = ?, updated_at = ? WHERE id = ?",
+            (status, now or time.time(), alert_id),
+        )
+        self.bump("alerts")
+
+    # ---------- 介入紀錄 ----------
+    def list_interventions(self, patient_id=None, limit=None, offset=0):
+        sql = (
+            "SELECT i.*, p.name AS patient FROM interventions i"
+            " JOIN patients p ON p.id = i.patient_id"
+        )
+        params = []
+        if patient_id:
+            sql += " WHERE i.patient_id = ?"
+            params.append(patient_id)
+        sql += " ORDER BY i.created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self.query(sql, params)
+
+    def count_interventions(self, patient_id=None):
+        if patient_id:
+            return self.query_one("SELECT COUNT(*) AS n FROM interventions WHERE patient_id = ?", (patient_id,))["n"]
+        return self.query_one("SELECT COUNT(*) AS n FROM interventions")["n"]
+
+    def add_intervention(self, patient_id, type, content, duration=None, referral=None, manager_id=None, now=None):
+        record = dict(patient_id=patient_id, type=type, content=content, duration=duration, referral=referral, manager_id=manager_id)
+        return self.add_interventions([record], now=now)[0][0]
+
+    def add_interventions(self, records, now=None):
+        # 整批在同一個交易寫入（group commit）。每筆先把病人的紀錄版本加一；
+        # 有指定 expected 且與目前版本不符時不寫入。回傳每筆的 (紀錄 id, 目前版本)，版本不符時 id 為 None
+        now = now or time.time()
+        results = []
+        with self.write_transaction() as conn:
+            for record in records:
+                patient_id, expected = record["patient_id"], record.get("expected")
+                sql, params = "UPDATE patients SET record_version = record_version + 1 WHERE id = ?", [patient_id]
+                if expected is not None:
+                    sql += " AND record_version = ?"
+                    params.append(expected)
+                row = conn.execute(sql + " RETURNING record_version", params).fetchall()
+                if not row:
+                    current = conn.execute("SELECT record_version FROM patients WHERE id = ?", (patient_id,)).fetchone()
+                    results.append((None, current and current["record_version"]))
+                    continue
+                version = row[0]["record_version"]
+                intervention_id = conn.execute(
+                    "INSERT INTO interventions (patient_id, type, content, duration, referral, manager_id, version, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (patient_id, record["type"], record["content"], record.get("duration"), record.get("referral"),
+                     record.get("manager_id"), version, record.get("created_at") or now),
+                ).lastrowid
+                results.append((intervention_id, version))
+        if any(intervention_id for intervention_id, _ in results):
+            self.bump("interventions")
+        return results
+
+    def record_version(self, patient_id):
+        row = self.query_one("SELECT record_version FROM patients WHERE id = ?", (patient_id,))
+        return row and row["record_version"]
+
+    def records_since_version(self, patient_id, version):
+        # 版本衝突時列出該版本之後其他人寫入的紀錄
+        return self.query(
+            "SELECT i.*, m.name AS manager FROM interventions i LEFT JOIN managers m ON m.id = i.manager_id"
+            " WHERE i.patient_id = ? AND i.version > ? ORDER BY i.version",
+            (patient_id, version),
+        )
+
+    def interventions_after(self, intervention_id, limit):
+        return self.query_tuples(
+            "SELECT id, patient_id, created_at, referral FROM interventions WHERE id > ? ORDER BY id LIMIT ?",
+            (intervention_id, limit),
+        )
+
+    def intervention_log_after(self, intervention_id, limit):
+        return self.query_tuples(
+            "SELECT id, manager_id, type, duration, referral, created_at FROM interventions"
+            " WHERE id > ? ORDER BY id LIMIT ?",
+            (intervention_id, limit),
+        )
+
+    def open_referrals(self):
+        return self.query(
+            "SELECT i.id, i.patient_id, p.name AS patient, i.referral, i.manager_id, i.created_at"
+            " FROM interventions i JOIN patients p ON p.id = i.patient_id"
+            " WHERE i.referral IS NOT NULL AND i.referral_done_at IS NULL ORDER BY i.created_at"
+        )
+
+    def complete_referral(self, intervention_id, now=None):
+        # 已完成的轉介不重複記錄；回傳這次是否有變更
+        done = self.execute(
+            "UPDATE interventions SET referral_done_at = ? WHERE id = ? AND referral_done_at IS NULL",
+            (now or time.time(), intervention_id),
+        ).rowcount
+        self.bump("interventions")
+        return bool(done)
+
+    def intervention_log_since(self, ts, until_id):
+        # 只需要近期紀錄時的首次載入；+id 讓查詢走時間索引而不是主鍵。之後改用 intervention_log_after 依 id 往後讀
+        return self.query_tuples(
+            "SELECT id, manager_id, type, duration, referral, created_at FROM interventions"
+            " WHERE created_at >= ? AND +id <= ?",
+            (ts, until_id),
+        )
+
+    # ---------- 症狀回報 ----------
+    def list_reports(self, patient_id, since=None, until=None, limit=None, offset=0):
+        sql, params = "SELECT * FROM reports WHERE patient_id = ?", [patient_id]
+        if since is not None:
+            sql += " AND reported_at >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND reported_at < ?"
+            params.append(until)
+        sql += " ORDER BY reported_at DESC"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self.query(sql, params)
+
+    def add_report(self, patient_id, symptom, score, now=None):
+        now = now or time.time()
+        with self.transaction() as conn:
+            report_id = conn.execute(
+                "INSERT INTO reports (patient_id, symptom, score, reported_at) VALUES (?, ?, ?, ?)",
+                (patient_id, symptom, score, now),
+            ).lastrowid
+            conn.execute(
+                "UPDATE patients SET last_report_at = ?, updated_at = ? WHERE id = ?",
+                (now, now, patient_id),
+            )
+            # 增量更新日 / 週彙總
+            buckets = report_buckets(now)
+            conn.executemany(
+                "INSERT INTO report_rollup (patient_id, period, bucket, symptom, n, score_sum, score_max)"
+                " VALUES (?, ?, ?, ?, 1, ?, ?)"
+                " ON CONFLICT (patient_id, period, bucket, symptom) DO UPDATE SET"
+                " n = n + 1, score_sum = score_sum + excluded.score_sum,"
+                " score_max = max(score_max, excluded.score_max)",
+                [
+                    (patient_id, period, buckets[period], key, score, score)
+                    for period in ROLLUP_PERIODS
+                    for key in {symptom or ROLLUP_ALL, ROLLUP_ALL}
+                ],
+            )
+        self.bump("reports", "patients")
+        return report_id
+
+    def count_reports(self, patient_id):
+        return self.query_one("SELECT COUNT(*) AS n FROM reports WHERE patient_id = ?", (patient_id,))["n"]
+
+    def report_rollups(self, patient_id, period, first, last, symptom=ROLLUP_ALL):
+        # first / last 為日或週編號（含）
+        return self.query_tuples(
+            "SELECT bucket, n, score_sum, score_max FROM report_rollup"
+            " WHERE patient_id = ? AND period = ? AND symptom = ? AND bucket >= ? AND bucket <= ?"
+            " ORDER BY bucket",
+            (patient_id, period, symptom, first, last),
+        )
+
+    def count_report_rows(self, completed_before=None):
+        if completed_before is None:
+            return self.query_one("SELECT COUNT(*) AS n FROM reports")["n"]
+        return self.query_one(
+            f"SELECT COUNT(*) AS n FROM reports WHERE patient_id IN ({COMPLETED_PATIENTS})",
+            (completed_before,),
+        )["n"]
+
+    def count_reports_after(self, report_id):
+        return self.query_one("SELECT COUNT(*) AS n FROM reports WHERE id > ?", (report_id,))["n"]
+
+    def report_times_after(self, report_id, limit):
+        return self.query_tuples(
+            "SELECT id, patient_id, reported_at FROM reports WHERE id > ? ORDER BY id LIMIT ?",
+            (report_id, limit),
+        )
+
+    def report_rows_after(self, report_id, limit, completed_before=None):
+        # 匯出用：依 id 分批往後讀（keyset），每批只短暫持有鎖；completed_before 為完成追蹤的出院時間上限
+        sql = (
+            "SELECT r.id, r.patient_id, p.name, p.phone, p.age, p.surgery, p.day,"
+            " r.symptom, r.score, r.reported_at"
+            " FROM reports r JOIN patients p ON p.id = r.patient_id WHERE r.id > ?"
+        )
+        params = [report_id]
+        if completed_before is not None:
+            sql += f" AND r.patient_id IN ({COMPLETED_PATIENTS})"
+            params.append(completed_before)
+        sql += " ORDER BY r.id LIMIT ?"
+        params.append(limit)
+        return self.query_tuples(sql, params)
+
+    # ---------- 收案 ----------
+    def list_enrollment(self):
+        return self.query("SELECT * FROM enrollment ORDER BY patient_id")
+
+    def cohort_baseline(self):
+        return self.query_tuples(
+            "SELECT e.patient_id, e.arm, p.age, e.college, e.caregiver, e.smartphone_years, e.gad7"
+            " FROM enrollment e JOIN patients p ON p.id = e.patient_id ORDER BY e.patient_id"
+        )
+
+    def count_enrollment(self):
+        return self.query_one("SELECT COUNT(*) AS n FROM enrollment")["n"]
+
+    def report_schedule(self):
+        # 逾期偵測用：追蹤起點、最後回報時間與目前狀態
+        return self.query_tuples(
+            "SELECT e.patient_id, e.surgery_at, e.discharge_at, p.last_report_at, p.status"
+            " FROM enrollment e JOIN patients p ON p.id = e.patient_id"
+        )
+
+    def enrollment_after(self, rowid, limit):
+        return self.query_tuples(
+            "SELECT rowid, patient_id, enrolled_at, surgery_at, discharge_at FROM enrollment"
+            " WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (rowid, limit),
+        )
+
+    # ---------- 治療結果 ----------
+    def add_outcome(self, patient_id, kind, now=None):
+        outcome_id = self.execute(
+            "INSERT INTO outcomes (patient_id, kind, at) VALUES (?, ?, ?)",
+            (patient_id, kind, now or time.time()),
+        ).lastrowid
+        self.bump("outcomes")
+        return outcome_id
+
+    def outcomes_after(self, outcome_id, limit):
+        return self.query_tuples(
+            "SELECT id, patient_id, kind, at FROM outcomes WHERE id > ? ORDER BY id LIMIT ?",
+            (outcome_id, limit),
+        )
+
+    def count_outcomes(self):
+        return self.query_one("SELECT COUNT(*) AS n FROM outcomes")["n"]
+
+    # ---------- 稽核軌跡 ----------
+    def add_audit(self, actor, action, target=None, detail=None, now=None):
+        audit_id = self.execute(
+            "INSERT INTO audit_log (at, actor, action, target, detail) VALUES (?, ?, ?, ?, ?)",
+            (now or time.time(), actor, action, target, detail),
+        ).lastrowid
+        self.bump("audit_log")
+        return audit_id
+
+    def audit_rows_since(self, ts, until_id):
+        return self.query_tuples(
+            "SELECT id, at, actor, action, target, detail FROM audit_log WHERE at >= ? AND +id <= ?",
+            (ts, until_id),
+        )
+
+    def audit_rows_after(self, audit_id, limit):
+        return self.query_tuples(
+            "SELECT id, at, actor, action, target, detail FROM audit_log WHERE id > ? ORDER BY id LIMIT ?",
+            (audit_id, limit),
+        )
+
+    # ---------- 外部同步進度 ----------
+    def get_watermark(self, name):
+        row = self.query_one("SELECT ts, key FROM sync_state WHERE name = ?", (name,))
+        return (row["ts"], row["key"]) if row else (0, "")
+
+    def set_watermark(self, name, ts, key="", now=None):
+        self.execute(
+            "INSERT INTO sync_state (name, ts, key, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET ts = excluded.ts, key = excluded.key, updated_at = excluded.updated_at",
+            (name, ts, key, now or time.time()),
+        )
+
+    # ---------- 個管師 ----------
+    def list_managers(self):
+        return self.query("SELECT * FROM managers ORDER BY id")
+
+    def add_managers(self, managers):
+        with self.transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO managers (id, name) VALUES (?, ?)", managers)
+        self.bump("managers")
+
+
+class _Transaction:
+    def __init__(self, lock, conn):
+        self.lock = lock
+        self.conn = conn
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
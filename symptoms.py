@@ -0,0 +1,165 @@
+"""
+AI-CARE Lung 症狀分類
+單次掃描的關鍵字比對（含否定詞）、分數解析（全形數字、中文數字）與健康小助手回覆
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+Classification = namedtuple("Classification", ["category", "score", "symptoms", "negated"])
+
+# 類別依優先順序排列：同時出現時取前者
+CATEGORIES = [
+    ("breath", "胸悶", ["悶", "喘", "呼吸"]),
+    ("fatigue", "疲勞", ["累", "疲", "沒力"]),
+    ("pain", "疼痛", ["痛", "疼"]),
+    ("cough", "咳嗽", ["咳", "痰"]),
+    ("good", None, ["不錯", "好", "還好", "👍"]),
+]
+PRIORITY = {name: i for i, (name, _, _) in enumerate(CATEGORIES)}
+SYMPTOM_LABEL = {name: label for name, label, _ in CATEGORIES}
+KEYWORD_CATEGORY = {word: name for name, _, words in CATEGORIES for word in words}
+
+NEGATIONS = ("沒有", "不", "沒", "無", "未")
+DEGREES = ("太", "很", "會", "再", "怎麼")
+NEGATION_TAIL = frozenset(w[-1] for w in NEGATIONS + DEGREES)
+
+
+def _alternation(words):
+    # 長字優先，讓「還好」「沒力」先於「好」「沒」比對
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+# 所有關鍵字編譯成單一 pattern，一次掃描取得全部命中
+KEYWORD_RE = re.compile(_alternation(KEYWORD_CATEGORY))
+
+CN_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+CN_NUM = "零〇一二兩三四五六七八九十"
+
+SCORE_RE = re.compile(
+    rf"(?<![0-9.{CN_NUM}])(?P<int>[0-9]{{1,2}}|[{CN_NUM}]{{1,3}})"
+    rf"(?:(?:\.|點)(?P<frac>[0-9{CN_NUM}]))?\s*(?P<unit>分)?"
+)
+SCORE_ONLY_RE = re.compile(rf"\s*{SCORE_RE.pattern}\s*[。.!！]?\s*")
+# 句中分數只在「分」前面找，避免整句逐字嘗試
+SCORE_TAIL_RE = re.compile(rf"{SCORE_RE.pattern}$")
+# 「分」後面須是句尾、空白、標點、語氣詞或症狀詞才是分數（排除分鐘、分之一、分享、分析等）
+SCORE_END_RE = re.compile(r"$|[\s,，。.!！?？;；:：、~～)）]|左右|上下|[了吧喔哦耶啦呢啊呀唷囉嘛]")
+
+# 全形數字與小數點轉半形；其他全形標點不影響比對
+FULLWIDTH_RE = re.compile("[０-９．]")
+FULLWIDTH_TABLE = {0xFF10 + i: ord("0") + i for i in range(10)} | {0xFF0E: ord(".")}
+
+
+def _cn_to_int(text):
+    if text.isdigit():
+        return int(text)
+    tens, sep, ones = text.partition("十")
+    if not sep:
+        return CN_DIGITS[text] if len(text) == 1 else -1
+    return (CN_DIGITS.get(tens, -100) if tens else 1) * 10 + (CN_DIGITS.get(ones, -100) if ones else 0)
+
+
+def normalize(text):
+    text = text or ""
+    if FULLWIDTH_RE.search(text):
+        text = text.translate(FULLWIDTH_TABLE)
+    return text.lower()
+
+
+def _negated(text, start):
+    # 關鍵字前可有一個程度副詞（不太痛、沒有很喘），再往前是否為否定詞
+    if not start or text[start - 1] not in NEGATION_TAIL:
+        return False
+    head = text[max(0, start - 4):start]
+    for degree in DEGREES:
+        if head.endswith(degree):
+            head = head[:-len(degree)]
+            break
+    return head.endswith(NEGATIONS)
+
+
+def parse_score(text):
+    return _parse_score(normalize(text))
+
+
+def _parse_score(text):
+    whole = SCORE_ONLY_RE.fullmatch(text)
+    if whole:
+        score = _cn_to_int(whole.group("int"))
+        return score if 0 <= score <= 10 else None
+    i = text.find("分")
+    while i != -1:
+        m = SCORE_TAIL_RE.search(text, max(0, i - 8), i + 1)
+        # 「十分累」的十分是副詞
+        adverb = m and m.group("int") == "十" and i + 1 < len(text) and not text[i + 1].isspace()
+        ends = SCORE_END_RE.match(text, i + 1) or KEYWORD_RE.match(text, i + 1)
+        if m and ends and not adverb:
+            score = _cn_to_int(m.group("int"))
+            if 0 <= score <= 10:
+                return score
+        i = text.find("分", i + 1)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def classify(text):
+    # 快速回覆、分數等重複訊息直接命中快取
+    return _classify(text)
+
+
+def _classify(text):
+    text = normalize(text)
+    found, negated = set(), set()
+    for m in KEYWORD_RE.finditer(text):
+        category = KEYWORD_CATEGORY[m.group()]
+        (negated if _negated(text, m.start()) else found).add(category)
+    # 同一類別有肯定也有否定（「不喘但很悶」）時以肯定為準
+    negated -= found
+    category = min(found, key=PRIORITY.__getitem__) if found else None
+    symptoms = tuple(sorted((c for c in found if SYMPTOM_LABEL[c]), key=PRIORITY.__getitem__))
+    return Classification(category, _parse_score(text), symptoms, tuple(sorted(negated, key=PRIORITY.__getitem__)))
+
+
+def classify_batch(messages):
+    # 重複訊息（快速回覆）只分類一次
+    seen = {}
+    return [seen[m] if m in seen else seen.setdefault(m, _classify(m)) for m in messages]
+
+
+# ============================================
+# 警示分級 / 回覆
+# ============================================
+RED_THRESHOLD = 7
+YELLOW_THRESHOLD = 4
+
+
+def alert_level(score, red=RED_THRESHOLD, yellow=YELLOW_THRESHOLD):
+    if score is None:
+        return None
+    if score >= red:
+        return "red"
+    if score >= yellow:
+        return "yellow"
+    return "green"
+
+
+REPLIES = {
+    "breath": "了解，胸口悶悶的感覺。\n\n請問用 0-10 分來評估，0 分是完全不悶，10 分是非常悶，您覺得大概幾分呢？\n\n（可以用下方滑桿選擇）",
+    "fatigue": "謝謝您告訴我。疲勞感是術後常見的症狀。\n\n請問這個疲勞感，如果用 0-10 分來評估，您覺得大概幾分呢？",
+    "pain": "了解您有疼痛的感覺。\n\n請問：\n1. 疼痛的位置在哪裡？\n2. 用 0-10 分評估，大概幾分？\n3. 是持續痛還是間歇性的？",
+    "cough": "好的，關於咳嗽的問題。\n\n請問：\n1. 有沒有痰？\n2. 痰的顏色是？（白/黃/綠/帶血）\n3. 咳嗽嚴重程度 0-10 分？",
+    "good": "太好了！很高興聽到您感覺不錯 😊\n\n為了完整記錄，想再確認一下：\n• 有沒有任何疼痛感？\n• 呼吸是否順暢？\n• 睡眠品質如何？",
+    "red": "收到，您評估為 {score} 分，這個分數較高。\n\n⚠️ 我已經通知您的個案管理師，她會在 30 分鐘內與您電話聯繫。\n\n在等待期間，您可以：\n• 找個舒適的姿勢休息\n• 試著做噘嘴式呼吸\n• 如果感覺更不舒服，請直接撥打緊急電話",
+    "yellow": "收到，您評估為 {score} 分。\n\n💡 小建議：\n• 噘嘴式呼吸：鼻子吸氣 2 秒，噘嘴慢慢吐氣 4 秒\n• 姿勢調整：稍微前傾坐著可能會舒服一些\n• 適度活動：短距離散步有助於改善\n\n個管師會在今天稍後關心您的狀況。",
+    "green": "收到，您評估為 {score} 分，這是很好的狀況！\n\n✅ 今日症狀回報已完成\n\n繼續保持，記得：\n• 每天按時服藥\n• 適度活動\n• 充足休息\n\n明天見！🌟",
+    "fallback": "謝謝您的回覆。\n\n能否再詳細描述一下您的感受呢？例如：\n• 有沒有疼痛？\n• 呼吸是否順暢？\n• 有沒有咳嗽？",
+}
+
+
+def reply(result, red=RED_THRESHOLD, yellow=YELLOW_THRESHOLD):
+    # 已給分數就直接分級；否則依症狀追問
+    if result.score is not None:
+        return REPLIES[alert_level(result.score, red, yellow)].format(score=result.score)
+    return REPLIES[result.category or "fallback"]
@@ -0,0 +1,125 @@
+"""
+AI-CARE Lung 症狀趨勢
+症狀回報的日 / 週彙總：新回報由 Store.add_report 增量更新，歷史資料以 pandas 向量化回填
+"""
+
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from store import ROLLUP_ALL, UTC_OFFSET, day_number, week_number
+
+# 超過此天數改用週彙總，12 個月約 52 點
+DAILY_MAX_DAYS = 90
+
+EPOCH = date(1970, 1, 1)
+
+
+# ============================================
+# 回填
+# ============================================
+def rollup_frame(reports):
+    # reports: 欄位 patient_id, symptom, score, reported_at；一次算出所有日 / 週彙總
+    import pandas as pd
+    day = ((reports["reported_at"].to_numpy(dtype=float) + UTC_OFFSET) // 86400).astype(np.int64)
+    base = pd.DataFrame({
+        "patient_id": reports["patient_id"].to_numpy(),
+        "symptom": reports["symptom"].to_numpy(dtype=object),
+        "score": reports["score"].to_numpy(dtype=np.int64),
+    })
+    frames = []
+    for period, bucket in (("day", day), ("week", day - (day + 3) % 7)):
+        keyed = base.assign(period=period, bucket=bucket)
+        # 每個症狀一列，另加 "*" 全部症狀合計
+        frames.append(keyed[keyed["symptom"].notna() & (keyed["symptom"] != ROLLUP_ALL)])
+        frames.append(keyed.assign(symptom=ROLLUP_ALL))
+    return (
+        pd.concat(frames, ignore_index=True)
+        .groupby(["patient_id", "period", "bucket", "symptom"], sort=False)["score"]
+        .agg(n="count", score_sum="sum", score_max="max")
+        .reset_index()
+    )
+
+
+def backfill(db, patient_ids=None):
+    # 由原始回報重建彙總；可限定病人（pandas 只在回填時載入，不影響冷啟動）
+    import pandas as pd
+    sql, params = "SELECT patient_id, symptom, score, reported_at FROM reports", []
+    if patient_ids:
+        sql += f" WHERE patient_id IN ({','.join('?' * len(patient_ids))})"
+        params = list(patient_ids)
+    reports = pd.DataFrame(db.query_tuples(sql, params), columns=["patient_id", "symptom", "score", "reported_at"])
+    rollup = rollup_frame(reports) if len(reports) else None
+    with db.transaction() as conn:
+        if patient_ids:
+            conn.execute(f"DELETE FROM report_rollup WHERE patient_id IN ({','.join('?' * len(patient_ids))})", params)
+        else:
+            conn.execute("DELETE FROM report_rollup")
+        if rollup is not None:
+            conn.executemany(
+                "INSERT INTO report_rollup (patient_id, period, bucket, symptom, n, score_sum, score_max)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rollup[["patient_id", "period", "bucket", "symptom", "n", "score_sum", "score_max"]]
+                .astype(object).itertuples(index=False, name=None),
+            )
+    db.bump("reports")
+    return 0 if rollup is None else len(rollup)
+
+
+def ensure_rollups(db):
+    # 既有資料庫升級後第一次啟動時回填
+    if db.query_one("SELECT 1 FROM report_rollup LIMIT 1") or not db.query_one("SELECT 1 FROM reports LIMIT 1"):
+        return 0
+    return backfill(db)
+
+
+# ============================================
+# 查詢
+# ============================================
+def bucket_date(bucket):
+    return EPOCH + timedelta(days=int(bucket))
+
+
+def series(db, patient_id, days, now=None, symptom=ROLLUP_ALL):
+    # 回傳 (period, {date, mean, max, n} 各為 list)；沒有回報的日 / 週不補點
+    last = day_number(now or time.time())
+    first = last - days + 1
+    period = "day" if days <= DAILY_MAX_DAYS else "week"
+    if period == "week":
+        first, last = week_number(first), week_number(last)
+    rows = db.report_rollups(patient_id, period, first, last, symptom)
+    return period, {
+        "date": [bucket_date(bucket) for bucket, _, _, _ in rows],
+        "mean": [total / n for _, n, total, _ in rows],
+        "max": [peak for _, _, _, peak in rows],
+        "n": [n for _, n, _, _ in rows],
+    }
+
+
+# ============================================
+# 示範數據
+# ============================================
+DEMO_SYMPTOMS = ["疲勞", "胸悶", "輕微咳嗽", "疼痛", "呼吸順暢"]
+
+
+def seed_demo_reports(db, patient_id, days=365, now=None, seed=0):
+    # 補上一年份的每日回報（不覆蓋最近一週的示範回報）
+    now = now or time.time()
+    if db.query_one(
+        "SELECT 1 FROM reports WHERE patient_id = ? AND reported_at < ? LIMIT 1",
+        (patient_id, now - 7 * 86400),
+    ):
+        return 0
+    rng = np.random.default_rng(seed)
+    offsets = np.arange(7, days)
+    # 術後初期分數較高，逐漸下降
+    scores = np.clip(np.round(2 + 4 * offsets / days + rng.normal(0, 1.2, len(offsets))), 0, 10).astype(int)
+    reported = now - offsets * 86400 - rng.integers(0, 4 * 3600, len(offsets))
+    picked = rng.choice(len(DEMO_SYMPTOMS), len(offsets))
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO reports (patient_id, symptom, score, reported_at) VALUES (?, ?, ?, ?)",
+            [(patient_id, DEMO_SYMPTOMS[s], int(sc), float(t)) for s, sc, t in zip(picked, scores, reported)],
+        )
+    return backfill(db, [patient_id])
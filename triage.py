@@ -0,0 +1,149 @@
+"""
+AI-CARE Lung 離線批次分流
+將 JSONL 病人訊息以與健康小助手相同的規則（symptoms.py）重新分級，輸出警示判定 JSONL
+
+    python triage.py messages.jsonl -o decisions.jsonl --workers 8
+    cat messages.jsonl | python triage.py - --red-threshold 8 > decisions.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import symptoms
+
+
+# ============================================
+# 工作程序
+# ============================================
+def triage_lines(lines, text_field, red, yellow, with_reply, only_alerts):
+    # 一批原始字串進、一批輸出字串出，減少程序間傳遞的物件數
+    # 無法解析、不是物件、缺少文字欄位或文字欄位不是字串的列都算錯誤；只有明確的空字串算空白訊息
+    records, errors = [], 0
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            errors += 1
+            continue
+        if not isinstance(record, dict) or not isinstance(record.get(text_field), str):
+            errors += 1
+            continue
+        records.append(record)
+    texts = [r[text_field] for r in records]
+    out, levels = [], Counter()
+    for record, text, result in zip(records, texts, symptoms.classify_batch(texts)):
+        level = symptoms.alert_level(result.score, red, yellow)
+        levels[level or "none"] += 1
+        if only_alerts and level not in ("red", "yellow"):
+            continue
+        decision = {k: v for k, v in record.items() if k != text_field}
+        decision.update(
+            category=result.category,
+            score=result.score,
+            symptoms=list(result.symptoms),
+            negated=list(result.negated),
+            level=level,
+            alert=level in ("red", "yellow"),
+        )
+        if with_reply:
+            decision["reply"] = symptoms.reply(result, red, yellow)
+        out.append(json.dumps(decision, ensure_ascii=False))
+    return out, levels, errors
+
+
+# ============================================
+# 串流處理
+# ============================================
+def batches(stream, size):
+    batch = []
+    for line in stream:
+        if line.strip():
+            batch.append(line)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def run(stream, out, workers, batch_size, **options):
+    totals, errors, count = Counter(), 0, 0
+
+    def drain(future):
+        nonlocal errors
+        lines, levels, bad = future.result()
+        if lines:
+            out.write("\n".join(lines) + "\n")
+        totals.update(levels)
+        errors += bad
+
+    if workers <= 1:
+        for batch in batches(stream, batch_size):
+            count += len(batch)
+            lines, levels, bad = triage_lines(batch, **options)
+            if lines:
+                out.write("\n".join(lines) + "\n")
+            totals.update(levels)
+            errors += bad
+        return count, totals, errors
+
+    # 同時在途的批次有上限，記憶體不隨輸入大小成長；結果依輸入順序寫出
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in batches(stream, batch_size):
+            count += len(batch)
+            pending.append(pool.submit(triage_lines, batch, **options))
+            if len(pending) >= workers * 2:
+                drain(pending.popleft())
+        while pending:
+            drain(pending.popleft())
+    return count, totals, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI-CARE Lung 離線批次分流")
+    parser.add_argument("input", help="JSONL 訊息檔，- 為標準輸入")
+    parser.add_argument("-o", "--output", default="-", help="輸出 JSONL，預設為標準輸出")
+    parser.add_argument("--text-field", default="content", help="訊息文字欄位（預設 content）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--red-threshold", type=int, default=symptoms.RED_THRESHOLD)
+    parser.add_argument("--yellow-threshold", type=int, default=symptoms.YELLOW_THRESHOLD)
+    parser.add_argument("--only-alerts", action="store_true", help="只輸出紅色 / 黃色警示")
+    parser.add_argument("--with-reply", action="store_true", help="輸出健康小助手回覆文字")
+    args = parser.parse_args(argv)
+
+    stream = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started = time.perf_counter()
+    try:
+        count, totals, errors = run(
+            stream, out, args.workers, args.batch_size,
+            text_field=args.text_field,
+            red=args.red_threshold,
+            yellow=args.yellow_threshold,
+            with_reply=args.with_reply,
+            only_alerts=args.only_alerts,
+        )
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    summary = " ".join(f"{level}={totals[level]}" for level in ("red", "yellow", "green", "none"))
+    print(
+        f"{count:,} 則訊息，{elapsed:.1f}s（{count / max(elapsed, 1e-9):,.0f} 則/秒）{summary} 錯誤={errors}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
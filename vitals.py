@@ -0,0 +1,175 @@
+"""
+AI-CARE Lung 居家生理數據
+血氧 (SpO2) / 心率批次寫入、每分鐘彙總、圖表降採樣 (LTTB)
+"""
+
+import time
+
+import numpy as np
+
+SPO2_RANGE = (50, 100)
+HR_RANGE = (20, 250)
+
+# 超過此時間範圍改讀每分鐘彙總，避免讀取數十萬筆原始資料
+RAW_WINDOW_SECONDS = 6 * 3600
+
+MAX_CHART_POINTS = 300
+
+
+# ============================================
+# 寫入
+# ============================================
+def _valid(spo2, hr):
+    return SPO2_RANGE[0] <= spo2 <= SPO2_RANGE[1] and HR_RANGE[0] <= hr <= HR_RANGE[1]
+
+
+def ingest(db, patient_id, readings):
+    # readings: [(ts, spo2, hr), ...]；超出生理範圍的讀值直接捨棄
+    rows, minutes = [], {}
+    for ts, spo2, hr in readings:
+        ts, spo2, hr = int(ts), int(spo2), int(hr)
+        if not _valid(spo2, hr):
+            continue
+        rows.append((patient_id, ts, spo2, hr))
+        m = minutes.get(ts // 60)
+        if m is None:
+            minutes[ts // 60] = [1, spo2, spo2, spo2, hr, hr, hr]
+        else:
+            m[0] += 1
+            m[1] = min(m[1], spo2)
+            m[2] = max(m[2], spo2)
+            m[3] += spo2
+            m[4] = min(m[4], hr)
+            m[5] = max(m[5], hr)
+            m[6] += hr
+    if not rows:
+        return 0
+    with db.transaction() as conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO vitals (patient_id, ts, spo2, hr) VALUES (?, ?, ?, ?)", rows
+        )
+        accepted = conn.total_changes - before
+        if accepted != len(rows):
+            # 有重送的讀值，彙總改由原始資料重算這幾分鐘
+            minutes = _recompute_minutes(conn, patient_id, minutes)
+        conn.executemany(
+            "INSERT INTO vitals_minute (patient_id, minute, n, spo2_min, spo2_max, spo2_sum, hr_min, hr_max, hr_sum)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (patient_id, minute) DO UPDATE SET"
+            " n = n + excluded.n,"
+            " spo2_min = min(spo2_min, excluded.spo2_min), spo2_max = max(spo2_max, excluded.spo2_max),"
+            " spo2_sum = spo2_sum + excluded.spo2_sum,"
+            " hr_min = min(hr_min, excluded.hr_min), hr_max = max(hr_max, excluded.hr_max),"
+            " hr_sum = hr_sum + excluded.hr_sum",
+            [(patient_id, minute, *m) for minute, m in minutes.items()],
+        )
+    db.bump("vitals")
+    return accepted
+
+
+def _recompute_minutes(conn, patient_id, minutes):
+    conn.executemany(
+        "DELETE FROM vitals_minute WHERE patient_id = ? AND minute = ?",
+        [(patient_id, minute) for minute in minutes],
+    )
+    recomputed = {}
+    for minute in minutes:
+        row = conn.execute(
+            "SELECT COUNT(*) AS n, MIN(spo2) AS a, MAX(spo2) AS b, SUM(spo2) AS c,"
+            " MIN(hr) AS d, MAX(hr) AS e, SUM(hr) AS f"
+            " FROM vitals WHERE patient_id = ? AND ts >= ? AND ts < ?",
+            (patient_id, minute * 60, minute * 60 + 60),
+        ).fetchone()
+        recomputed[minute] = [row["n"], row["a"], row["b"], row["c"], row["d"], row["e"], row["f"]]
+    return recomputed
+
+
+# ============================================
+# 讀取 / 降採樣
+# ============================================
+def load_series(db, patient_id, since, until=None):
+    # 回傳 (ts, spo2, hr) 三個 numpy 陣列
+    until = until or time.time()
+    if until - since <= RAW_WINDOW_SECONDS:
+        rows = db.query_tuples(
+            "SELECT ts, spo2, hr FROM vitals WHERE patient_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (patient_id, int(since), int(until) + 1),
+        )
+    else:
+        rows = db.query_tuples(
+            "SELECT minute * 60 + 30 AS ts, CAST(spo2_sum AS REAL) / n AS spo2, CAST(hr_sum AS REAL) / n AS hr"
+            " FROM vitals_minute WHERE patient_id = ? AND minute >= ? AND minute <= ? ORDER BY minute",
+            (patient_id, int(since) // 60, int(until) // 60),
+        )
+    if not rows:
+        return np.empty(0), np.empty(0), np.empty(0)
+    data = np.array(rows, dtype=float)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets：保留視覺上重要的轉折點
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def minmax_buckets(y, n_buckets):
+    # 每個區間保留最小與最大值的索引，適合呈現血氧驟降
+    n = len(y)
+    if n <= n_buckets * 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    idx = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        seg = y[lo:hi]
+        pair = sorted((lo + int(seg.argmin()), lo + int(seg.argmax())))
+        idx.extend(pair if pair[0] != pair[1] else pair[:1])
+    return np.array(idx)
+
+
+def chart_series(db, patient_id, since, until=None, max_points=MAX_CHART_POINTS, method="lttb"):
+    ts, spo2, hr = load_series(db, patient_id, since, until)
+    if len(ts) > max_points:
+        # 以血氧決定取樣點，心率使用同一組時間點
+        if method == "minmax":
+            idx = minmax_buckets(spo2, max_points // 2)
+        else:
+            idx = lttb(ts, spo2, max_points)
+        ts, spo2, hr = ts[idx], spo2[idx], hr[idx]
+    return ts, spo2, hr
+
+
+# ============================================
+# 示範數據
+# ============================================
+def seed_demo_vitals(db, patient_id, days=7, interval=60, now=None, seed=0):
+    if db.query_one("SELECT 1 FROM vitals WHERE patient_id = ? LIMIT 1", (patient_id,)):
+        return 0
+    now = int(now or time.time())
+    rng = np.random.default_rng(seed)
+    ts = np.arange(now - days * 86400, now, interval)
+    hours = (ts % 86400) / 3600
+    hr = 78 + 8 * np.sin((hours - 14) / 24 * 2 * np.pi) + rng.normal(0, 3, len(ts))
+    spo2 = 96 + rng.normal(0, 0.8, len(ts))
+    # 偶發的血氧下降事件
+    for start in rng.choice(len(ts), size=days, replace=False):
+        spo2[start:start + 15] -= np.linspace(4, 1, len(spo2[start:start + 15]))
+    spo2 = np.clip(np.round(spo2), 85, 100)
+    return ingest(db, patient_id, zip(ts.tolist(), spo2.tolist(), np.round(hr).tolist()))
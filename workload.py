@@ -0,0 +1,212 @@
+"""
+AI-CARE Lung 個管師工作量
+介入紀錄與警示結案 / 轉介完成的稽核事件依個管師記入 14 天環狀日桶：每個事件 O(1) 累加，
+今日 / 昨日與本週各日的統計直接讀桶，不重掃全部介入紀錄
+"""
+
+import re
+import threading
+import time
+
+import numpy as np
+
+from store import UTC_OFFSET, day_number, week_number
+
+DAY = 86400
+# 環狀日桶涵蓋本週與上週
+RING_DAYS = 14
+CONTACTS, CALLS, CALL_MINUTES, ALERTS, REFERRALS = range(5)
+METRICS = 5
+# 計入「警示處理」與「轉介完成」的稽核動作；轉介依完成時間（而非開立時間）記入
+AUDIT_METRICS = {"alert_resolved": ALERTS, "referral_done": REFERRALS}
+WEEKDAYS = ["一", "二", "三", "四", "五", "六", "日"]
+EVENT_BATCH = 50000
+
+MINUTES = re.compile(r"(\d+(?:\.\d+)?)\s*分")
+
+
+def day_start(day):
+    return day * DAY - UTC_OFFSET
+
+
+def parse_minutes(duration):
+    match = MINUTES.search(duration or "")
+    return float(match.group(1)) if match else None
+
+
+class DayRing:
+    # 單一個管師的環狀日桶：days[i] 為該格目前對應的日編號，換日時整格歸零
+    def __init__(self):
+        self.days = [None] * RING_DAYS
+        self.counts = [[0] * METRICS for _ in range(RING_DAYS)]
+
+    def add(self, day, metric, amount=1):
+        i = day % RING_DAYS
+        if self.days[i] != day:
+            # 比格內資料還舊的事件已超出視窗
+            if self.days[i] is not None and self.days[i] > day:
+                return
+            self.days[i] = day
+            self.counts[i] = [0] * METRICS
+        self.counts[i][metric] += amount
+
+    def get(self, day):
+        i = day % RING_DAYS
+        return self.counts[i] if self.days[i] == day else [0] * METRICS
+
+
+# ============================================
+# 工作量統計（跨 session 共用，增量更新）
+# ============================================
+class WorkloadStats:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rings = {}
+        self.cursor = {"interventions": None, "audit_log": None}
+        self.version = None
+        self.events = 0
+
+    def _ring(self, manager_id):
+        ring = self.rings.get(manager_id)
+        if ring is None:
+            ring = self.rings[manager_id] = DayRing()
+        return ring
+
+    # ---------- 事件 ----------
+    def contact(self, manager_id, type, duration, referral, at):
+        if manager_id is None:
+            return
+        ring, day = self._ring(manager_id), day_number(at)
+        ring.add(day, CONTACTS)
+        minutes = parse_minutes(duration)
+        if type == "電話" and minutes is not None:
+            ring.add(day, CALLS)
+            ring.add(day, CALL_MINUTES, minutes)
+
+    def audit(self, actor, action, at):
+        metric = AUDIT_METRICS.get(action)
+        if metric is not None:
+            self._ring(actor).add(day_number(at), metric)
+
+    # ---------- 載入 ----------
+    def refresh(self, db, now=None):
+        # 介入紀錄與稽核軌跡都沒有寫入時不查詢；首次載入只從視窗起點開始讀
+        with self.lock:
+            version = db.version("interventions", "audit_log")
+            if version == self.version:
+                return self
+            sources = [
+                ("interventions", db.intervention_log_since, db.intervention_log_after, lambda row: self.contact(*row[1:])),
+                ("audit_log", db.audit_rows_since, db.audit_rows_after, lambda row: self.audit(row[2], row[3], row[1])),
+            ]
+            for name, load, fetch, apply in sources:
+                if self.cursor[name] is None:
+                    # id 不一定依時間遞增，首次以時間索引讀視窗內的紀錄，之後才依 id 往後讀
+                    self.cursor[name] = db.max_id(name)
+                    rows = load(day_start(day_number(now or time.time()) - RING_DAYS + 1), self.cursor[name])
+                    for row in rows:
+                        apply(row)
+                    self.events += len(rows)
+                while True:
+                    rows = fetch(self.cursor[name], EVENT_BATCH)
+                    if not rows:
+                        break
+                    for row in rows:
+                        apply(row)
+                    self.events += len(rows)
+                    self.cursor[name] = rows[-1][0]
+            self.version = version
+        return self
+
+    # ---------- 查詢 ----------
+    def day(self, manager_id, day):
+        with self.lock:
+            ring = self.rings.get(manager_id)
+            return list(ring.get(day)) if ring else [0] * METRICS
+
+    def today(self, manager_id, now=None):
+        # 今日與昨日：(聯繫次數, 平均通話分鐘, 警示處理, 轉介) 兩組
+        today = day_number(now or time.time())
+
+        def metrics(counts):
+            return {
+                "contacts": counts[CONTACTS],
+                "avg_call": counts[CALL_MINUTES] / counts[CALLS] if counts[CALLS] else None,
+                "alerts": counts[ALERTS],
+                "referrals": counts[REFERRALS],
+            }
+
+        return metrics(self.day(manager_id, today)), metrics(self.day(manager_id, today - 1))
+
+    def week(self, manager_id, now=None):
+        # 本週一到今天每天的聯繫次數
+        today = day_number(now or time.time())
+        monday = week_number(today)
+        return [self.day(manager_id, day)[CONTACTS] for day in range(monday, today + 1)]
+
+
+# ============================================
+# 示範數據
+# ============================================
+DEMO_MANAGERS = [("M01", "林怡君"), ("M02", "陳雅婷"), ("M03", "張家豪")]
+DEMO_NOTES = [
+    "電話追蹤術後恢復狀況，提醒每日回報。",
+    "回覆病人 LINE 詢問傷口照護問題。",
+    "協助填寫 ePRO，說明症狀分數意義。",
+    "疼痛控制評估，建議依醫囑服藥。",
+]
+DEMO_REFERRALS = ["營養諮詢", "復健", "心理"]
+
+
+def seed_demo_activity(db, now=None, seed=0):
+    # 建立示範個管師與其近兩週（8-17 時，週末值班量較少）的聯繫紀錄、已處理警示與稽核軌跡
+    if db.list_managers():
+        return 0
+    now = now or time.time()
+    rng = np.random.default_rng(seed)
+    db.add_managers(DEMO_MANAGERS)
+    patients = [e["patient_id"] for e in db.list_enrollment()] or [p["id"] for p in db.list_patients()]
+    today = day_number(now)
+    contacts, alerts = [], []
+    for manager_id, _ in DEMO_MANAGERS:
+        for day in range(today - RING_DAYS + 1, today + 1):
+            volume = 0.3 if (day + 3) % 7 >= 5 else 1
+            start = day_start(day) + 8 * 3600
+            for at in np.sort(start + rng.random(rng.poisson(12 * volume)) * 9 * 3600):
+                kind = rng.choice(["電話", "LINE", "門診"], p=[0.6, 0.3, 0.1])
+                referral = DEMO_REFERRALS[int(rng.integers(len(DEMO_REFERRALS)))] if rng.random() < 0.1 else None
+                minutes = int(rng.integers(2, 12)) if kind == "電話" else int(rng.integers(1, 5))
+                # 轉介隔天完成，近一天內的仍待執行
+                done = float(at + DAY) if referral and at + DAY < now else None
+                contacts.append((
+                    patients[int(rng.integers(len(patients)))], str(kind), DEMO_NOTES[int(rng.integers(len(DEMO_NOTES)))],
+                    f"{minutes}分鐘", referral, manager_id, done, float(at),
+                ))
+            for at in np.sort(start + rng.random(rng.poisson(6 * volume)) * 9 * 3600):
+                alerts.append((patients[int(rng.integers(len(patients)))], manager_id, float(at)))
+    contacts = sorted((row for row in contacts if row[-1] < now), key=lambda row: row[-1])
+    alerts = sorted((row for row in alerts if row[-1] < now), key=lambda row: row[-1])
+    with db.transaction() as conn:
+        for row in contacts:
+            intervention_id = conn.execute(
+                "INSERT INTO interventions (patient_id, type, content, duration, referral, manager_id, referral_done_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            ).lastrowid
+            if row[6] is not None:
+                conn.execute(
+                    "INSERT INTO audit_log (at, actor, action, target) VALUES (?, ?, 'referral_done', ?)",
+                    (row[6], row[5], str(intervention_id)),
+                )
+        for patient_id, manager_id, at in alerts:
+            alert_id = conn.execute(
+                "INSERT INTO alerts (patient_id, level, symptom, score, status, created_at, updated_at)"
+                " VALUES (?, 'yellow', '疲勞', 5, 'resolved', ?, ?)",
+                (patient_id, at - 1800, at),
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO audit_log (at, actor, action, target) VALUES (?, ?, 'alert_resolved', ?)",
+                (at, manager_id, str(alert_id)),
+            )
+    db.bump("interventions", "alerts", "audit_log")
+    return len(contacts) + len(alerts)